@@ -0,0 +1,98 @@
+"""
+Синтетические данные для замеров: ответы Eduapp того же вида, что отдаёт сервер,
+нужного размера. Данные детерминированы, чтобы замеры разных версий кода были сравнимы
+"""
+
+import random
+from datetime import datetime, timedelta
+
+THEMES = ('Циклы', 'Функции', 'Рекурсия', 'Списки', 'Словари', 'Классы', 'Графы', 'Сортировки')
+
+COURSES = ('Python. Основы', 'Python. Продвинутый уровень', 'Алгоритмы', 'Веб-разработка')
+
+
+class FakeResponse:
+    """
+    Ответ сервера, у которого есть только :meth:`json`
+    """
+
+    def __init__(self, data: dict) -> None:
+        self.data = data
+
+    def json(self) -> dict:
+        return self.data
+
+
+def make_lessons(count: int, year: int = 2022, month: int = 3) -> list:
+    """
+    Занятия одного месяца, равномерно распределённые по дням
+
+    :param count: количество занятий
+    :param year: год
+    :param month: месяц
+    :return: занятия в том виде, в котором их отдаёт сервер
+    """
+    rng = random.Random(count)
+    lessons = []
+    for index in range(count):
+        begin = datetime(year, month, 1 + index % 28, 9) + timedelta(minutes=15 * (index // 28 % 48))
+        visited = rng.random()
+        lessons.append({
+            'classes': {
+                'date_of': begin.date().isoformat(),
+                'datetime_begin': begin.isoformat() + '+03:00',
+                'datetime_end': (begin + timedelta(minutes=90)).isoformat() + '+03:00',
+                'course': {'simplest_name': rng.choice(COURSES), 'diary_type': rng.choice('DB')},
+                'classes_lessons': [{'lesson': {'name': rng.choice(THEMES)}}] if visited > 0.1 else [],
+            },
+            'pupil_attendances': [{'is_begun': visited < 0.7, 'status': 'н' if visited < 0.1 else 'п'}],
+        })
+    return lessons
+
+
+def make_calendar_response(count: int) -> FakeResponse:
+    """
+    :param count: количество занятий
+    :return: ответ сервера с календарём на месяц
+    """
+    return FakeResponse({'count': count, 'next': None, 'results': make_lessons(count)})
+
+
+def make_timestamps(count: int) -> list:
+    """
+    :param count: количество меток времени
+    :return: разные метки времени в формате Eduapp
+    """
+    start = datetime(2022, 3, 1)
+    return [(start + timedelta(minutes=index)).isoformat() + '+03:00' for index in range(count)]
+
+
+def make_discussions(count: int) -> list:
+    """
+    :param count: количество обсуждений
+    :return: обсуждения в том виде, в котором их отдаёт сервер, от новых к старым
+    """
+    rng = random.Random(count)
+    start = datetime(2022, 3, 1)
+    return [{
+        'id': index,
+        'commented_at': (start - timedelta(hours=index * 7)).isoformat() + '+03:00',
+        'related_text': f'{rng.choice(COURSES)}: {rng.choice(THEMES)}',
+        'preview': f'Вопрос про {rng.choice(THEMES).lower()}',
+        'discussion_users': [
+            {'is_client': True, 'user': {'first_name': 'Ученик', 'last_name': str(index)}},
+            {'is_client': False, 'user': {'first_name': 'Мария', 'last_name': 'Преподавателева'}},
+        ],
+    } for index in range(count)]
+
+
+def make_comments(count: int, username: str = 'pupil') -> list:
+    """
+    :param count: количество реплик
+    :param username: логин ученика, реплики чередуются с репликами преподавателя
+    :return: реплики обсуждения в том виде, в котором их отдаёт сервер
+    """
+    return [{
+        'author': {'username': username if index % 2 == 0 else 'teacher'},
+        'message': f'{"Вопрос" if index % 2 == 0 else "Ответ"} №{index + 1}: ' + 'текст реплики ' * 5,
+    } for index in range(count)]
@@ -0,0 +1,217 @@
+"""
+Замеры скорости разбора ответов Eduapp и отрисовки сообщений.
+
+Каждый замер обрабатывает синтетические данные заданного размера (:mod:`benchmarks.fixtures`)
+несколько раз, в результат идёт лучшее время одного вызова. Результаты сравниваются
+с сохранёнными в JSON базовыми значениями, и если какой-то замер стал медленнее больше,
+чем на допустимую долю, программа завершается с кодом 1.
+
+Запуск::
+
+    python -m benchmarks.suite            # сравнить с базовыми значениями
+    python -m benchmarks.suite --save     # сохранить текущие результаты как базовые
+    python -m benchmarks.suite -k calendar
+
+Базовые значения зависят от машины, поэтому сохранять их нужно на той же машине,
+на которой потом проверяются изменения
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import timeit
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from benchmarks import fixtures
+from eduapp.main import calendar_data_to_good_json, get_datetime_from_ea_string, get_lessons
+from eduapp.questions import get_teacher, parse_questions_json
+from eduapp.timestamps import parse_ea_datetime
+from ui.main import calendar_data_to_str
+from ui.questions import question_page_to_str, single_question_to_str
+
+#: Файл с базовыми значениями по умолчанию
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+#: На какую долю замер может стать медленнее базового значения
+DEFAULT_THRESHOLD = 0.3
+
+#: Сколько раз повторяется каждый замер
+DEFAULT_REPEAT = 7
+
+#: Минимальная длительность одного повтора замера, в секундах
+MIN_REPEAT_TIME = 0.1
+
+
+@dataclass
+class Benchmark:
+    """
+    Замер одной функции на одних данных
+    """
+
+    #: Имя замера, например ``calendar_data_to_str[1000]``
+    name: str
+
+    #: Обработка данных
+    func: Callable[[], object]
+
+
+def cold(func: Callable[[], object]) -> Callable[[], object]:
+    """
+    :param func: обработка данных
+    :return: обработка данных, перед которой сбрасывается кэш меток времени
+    """
+    def wrapper():
+        parse_ea_datetime.cache_clear()
+        return func()
+    return wrapper
+
+
+def get_benchmarks() -> List[Benchmark]:
+    """
+    Создаёт данные и замеры.
+
+    Функции отрисовки вызываются в обход кэша сообщений (:mod:`ui.cache`), а перед
+    замерами разбора календаря сбрасывается кэш меток времени - иначе замерялся бы кэш, а не код
+
+    :return: замеры
+    """
+    benchmarks = []
+    for count in (10, 100, 1000, 10000):
+        response = fixtures.make_calendar_response(count)
+        data = calendar_data_to_good_json(response)
+        benchmarks.append(Benchmark(f'calendar_data_to_good_json[{count}]',
+                                    cold(lambda response=response: calendar_data_to_good_json(response))))
+        benchmarks.append(Benchmark(f'calendar_data_to_str[{count}]',
+                                    lambda data=data: calendar_data_to_str.__wrapped__(data)))
+
+    lessons = fixtures.make_lessons(1000)
+    benchmarks.append(Benchmark('get_lessons[1000]', cold(lambda: get_lessons(lessons))))
+
+    timestamps = fixtures.make_timestamps(1000)
+    benchmarks.append(Benchmark('get_datetime_from_ea_string[1000 cold]',
+                                cold(lambda: [get_datetime_from_ea_string(value) for value in timestamps])))
+    benchmarks.append(Benchmark('get_datetime_from_ea_string[1000 warm]',
+                                lambda: [get_datetime_from_ea_string(value) for value in timestamps]))
+
+    discussions = fixtures.make_discussions(1000)
+    page = discussions[:5]
+    benchmarks.append(Benchmark('parse_questions_json[page]',
+                                lambda: parse_questions_json(1, page, len(discussions))))
+    benchmarks.append(Benchmark('parse_questions_json[1000 unpaged]',
+                                lambda: parse_questions_json(1, discussions)))
+    benchmarks.append(Benchmark('get_teacher[1000]',
+                                lambda: [get_teacher(question) for question in discussions]))
+
+    questions_page = parse_questions_json(1, page, len(discussions))
+    benchmarks.append(Benchmark('question_page_to_str[page]',
+                                lambda: question_page_to_str.__wrapped__(questions_page)))
+    question = questions_page['questions'][0]
+    for count in (10, 1000, 5000):
+        comments = fixtures.make_comments(count)
+        benchmarks.append(Benchmark(
+            f'single_question_to_str[{count}]',
+            lambda comments=comments: single_question_to_str.__wrapped__(question, comments, 'pupil')))
+    return benchmarks
+
+
+def measure(benchmark: Benchmark, repeat: int = DEFAULT_REPEAT) -> float:
+    """
+    Замеряет время вызова. За один повтор функция вызывается столько раз, чтобы повтор
+    длился не меньше :data:`MIN_REPEAT_TIME`, сборщик мусора на время замера отключается
+
+    :param benchmark: замер
+    :param repeat: количество повторов
+    :return: лучшее время одного вызова, в секундах
+    """
+    timer = timeit.Timer(benchmark.func)
+    loops, _ = timer.autorange()
+    loops = max(loops, math.ceil(MIN_REPEAT_TIME / (timer.timeit(loops) / loops)))
+    return min(timer.repeat(repeat, loops)) / loops
+
+
+def find_regressions(results: Dict[str, float], baselines: Dict[str, float],
+                     threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    :param results: время замеров
+    :param baselines: базовое время замеров
+    :param threshold: на какую долю замер может стать медленнее базового значения
+    :return: имена замеров, ставших медленнее допустимого. Замеры без базового значения не учитываются
+    """
+    return [name for name, seconds in results.items()
+            if name in baselines and seconds > baselines[name] * (1 + threshold)]
+
+
+def load_baselines(path: str) -> Dict[str, float]:
+    """
+    :param path: файл с базовыми значениями
+    :return: базовое время замеров или пустой словарь, если файла нет
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)['results']
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(path: str, results: Dict[str, float]) -> None:
+    """
+    Сохраняет результаты как базовые. Значения замеров, которые не запускались, сохраняются
+
+    :param path: файл с базовыми значениями
+    :param results: время замеров
+    """
+    baselines = load_baselines(path)
+    baselines.update(results)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                   'results': dict(sorted(baselines.items()))}, file, ensure_ascii=False, indent=2)
+        file.write('\n')
+
+
+def format_row(name: str, seconds: float, baseline: Optional[float]) -> str:
+    """
+    :param name: имя замера
+    :param seconds: время замера
+    :param baseline: базовое время замера
+    :return: строка отчёта
+    """
+    row = f'{name:<42} {seconds * 1000:>10.3f} мс'
+    if baseline is None:
+        return row + '   нет базового значения'
+    return row + f' {baseline * 1000:>10.3f} мс {(seconds / baseline - 1) * 100:>+7.1f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры скорости разбора данных и отрисовки сообщений')
+    parser.add_argument('--save', action='store_true', help='сохранить результаты как базовые')
+    parser.add_argument('--baselines', default=BASELINES_PATH, help='файл с базовыми значениями')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='допустимое замедление, доля базового значения')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='количество повторов замера')
+    parser.add_argument('-k', dest='pattern', default='', help='запускать только замеры с этой подстрокой')
+    args = parser.parse_args()
+
+    baselines = load_baselines(args.baselines)
+    results = {}
+    for benchmark in get_benchmarks():
+        if args.pattern not in benchmark.name:
+            continue
+        results[benchmark.name] = measure(benchmark, args.repeat)
+        print(format_row(benchmark.name, results[benchmark.name], baselines.get(benchmark.name)))
+
+    if args.save:
+        save_baselines(args.baselines, results)
+        print(f'Базовые значения сохранены в {args.baselines}')
+        return
+    regressions = find_regressions(results, baselines, args.threshold)
+    if regressions:
+        print(f'Медленнее базовых значений больше чем на {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
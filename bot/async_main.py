@@ -0,0 +1,18 @@
+from telebot.async_telebot import AsyncTeleBot
+
+from bot.engine import AsyncEngine, navigation, reminders, reply_notifications, \
+    state_store_url, token
+from bot.state_store import create_state_store
+from bot.webhook import WebhookSettings
+
+tele_bot = AsyncTeleBot(token, parse_mode=None)
+engine = AsyncEngine(tele_bot, create_state_store(state_store_url),
+                      navigation == 'inline', reminders == 'on', reply_notifications == 'on')
+
+
+async def run():
+    await engine.run()
+
+
+async def run_webhook():
+    await engine.run_webhook(WebhookSettings.from_env())
@@ -1,36 +1,90 @@
+from typing import Any, Awaitable, Callable, Optional
+
 from telebot.types import Message
 
 import bot.bot_states
-import config
-from eduapp.main import login
+from eduapp.exceptions import TokenRejectedError
+from eduapp.sessions import EASession, sessions
 
 
-def auth_enter_login_handler(message: Message, tele_bot, status):
+async def auth_enter_login_handler(message: Message, tele_bot, status):
     text = message.text
     if text == 'Назад':
-        bot.bot_states.MainState(message, tele_bot, status)
+        await bot.bot_states.MainState(message, tele_bot, status)
         return
     temporary_login = text
-    tele_bot.reply_to(message, f'Вы ввели логин {text}')
-    tele_bot.send_message(message.chat.id, 'Введите пароль')
-    tele_bot.register_next_step_handler(
-        message, auth_enter_password_handler, tele_bot, status, temporary_login)
+    await tele_bot.reply_to(message, f'Вы ввели логин {text}')
+    await tele_bot.send_message(message.chat.id, 'Введите пароль')
+    status.register_next_step_handler(auth_enter_password_handler, temporary_login)
 
 
-def auth_enter_password_handler(message: Message, tele_bot, status, temporary_login):
+async def auth_enter_password_handler(message: Message, tele_bot, status, temporary_login):
     if message.text == 'Назад':
-        bot.bot_states.MainState(message, tele_bot, status)
+        await bot.bot_states.MainState(message, tele_bot, status)
         return
     text = message.text
-    tele_bot.reply_to(message, f'Вы ввели пароль {text}')
-    login_data = login(temporary_login, text)
+    await tele_bot.reply_to(message, f'Вы ввели пароль {text}')
+    login_data = await tele_bot.ea.open_session(message.chat.id, temporary_login, text)
 
     if login_data.success:
-        tele_bot.reply_to(message, 'Авторизация прошла успешно')
-        config.USER_LOGIN = temporary_login
-        config.USER_PASSWORD = text
+        await tele_bot.reply_to(message, 'Авторизация прошла успешно')
     else:
-        tele_bot.send_message(message.chat.id, 'Ошибка входа')
-        tele_bot.send_message(message.chat.id, login_data.error)
+        await tele_bot.send_message(message.chat.id, 'Ошибка входа')
+        await tele_bot.send_message(message.chat.id, login_data.error)
+
+    await bot.bot_states.MainState(message, tele_bot, status)
+
+
+async def get_user_session(message: Message, tele_bot) -> Optional[EASession]:
+    """
+    Возвращает сессию Eduapp пользователя, написавшего сообщение.
+    Если пользователь не авторизован - сообщает ему об этом
+
+    :param message: сообщение пользователя
+    :param tele_bot: движок бота
+    :return: сессия пользователя или `None`
+    """
+    session = sessions.get(message.chat.id)
+    if session is None:
+        await tele_bot.send_message(message.chat.id, 'Сначала нужно авторизоваться')
+    return session
+
+
+def is_token_rejected(status) -> bool:
+    """
+    :param status: статус ответа, например :class:`eduapp.questions.EaQuestionResponseStatus`
+    :return: `True`, если запрос не удался, потому что сервер не принял токен
+    """
+    return not status.success and status.error == TokenRejectedError.message
+
+
+async def request_with_relogin(message: Message, tele_bot, session: EASession,
+                               request: Callable[[EASession], Awaitable[Any]],
+                               is_rejected: Callable[[Any], bool] = lambda result: False):
+    """
+    Выполняет запрос к Eduapp. Если сервер не принял токен, авторизуется заново
+    с сохранёнными в сессии данными и повторяет запрос один раз.
+    Токены обновляются заранее в фоне, повторная авторизация нужна, только если
+    сервер отозвал токен раньше срока
 
-    bot.bot_states.MainState(message, tele_bot, status)
+    :param message: сообщение из чата пользователя
+    :param tele_bot: движок бота
+    :param session: сессия пользователя
+    :param request: корутина запроса, принимающая сессию
+    :param is_rejected: проверяет результат запроса, если сервер сообщает о негодном токене
+        не исключением :class:`eduapp.exceptions.TokenRejectedError`, а результатом
+    :return: результат запроса или `None`, если авторизоваться заново не удалось.
+        Об ошибке авторизации пользователь уже уведомлён
+    :raise TokenRejectedError: если сервер не принял и новый токен
+    """
+    try:
+        result = await request(session)
+        if not is_rejected(result):
+            return result
+    except TokenRejectedError:
+        pass
+    status = await tele_bot.ea.relogin(session)
+    if not status.success:
+        await tele_bot.send_message(message.chat.id, status.error)
+        return None
+    return await request(session)
@@ -1,68 +1,130 @@
 """ Файл с состояниями бота """
 
+import copy
+import functools
 import logging
 import types
+from typing import Callable, Dict, Tuple
 
 from telebot.types import KeyboardButton, ReplyKeyboardMarkup
 
-import bot.main
-from bot.auth import auth_enter_login_handler
+import bot.handlers
+from bot.auth import auth_enter_login_handler, get_user_session, is_token_rejected, \
+    request_with_relogin
 from bot.handlers import BotStructure, PreviousPageChat, QuePageCommandHandler, \
     OpenQueCommandHandler, AskCommandHandler
-from eduapp.questions import get_question_page_json, open_question
+from bot.navigation import MENU_ACTION, Button, chat_keyboard, has_next_questions_page, \
+    has_previous_chat_page, questions_keyboard
+from bot.state_store import BotStatus, get_handler_path, resolve_handler
 from ui.questions import question_page_to_str, single_question_to_str
 
 
 class BotState(BotStructure):
     """
     Базовый абстрактный класс состояния бота,
-    От него должны наследоваться все другие состояния
+    От него должны наследоваться все другие состояния.
+
+    Кнопки меню состояния и переходы по ним задаются в таблице :data:`TRANSITIONS`
     """
 
-    buttons = []
+    #: Сообщение, которое выводится при переходе в состояние
     text = 'Define me!'
-    next = {}
 
-    def __init__(self, message, t_bot, status_of_bot):
+    #: Кнопки меню, вместо которых при навигации кнопками под сообщением
+    #: показываются кнопки перелистывания, см. :meth:`show_page`
+    PAGING: Tuple[str, ...] = ()
+
+    async def run(self, message, t_bot, status_of_bot):
         """
-        Базовый конструктор состояния бота:
+        Базовое поведение состояния бота - вывести меню, см. :meth:`show_menu`
 
-        1. Создает меню, состоящее из кнопок (self.buttons - массив строчек с названием кнопок),
-        2. Выводит сообщение меню (self.text - строка)
-        3. Переключение обработчика на функцию processing (self.processing - функция)
+        :param message: сообщение пользователя
+        :type message: telebot.types.Message
+        :param t_bot: движок бота
+        :type t_bot: bot.engine.BotEngine
+        :param status_of_bot: состояние диалога с пользователем
+        :type status_of_bot: BotStatus
+        """
+        await self.show_menu(message, t_bot, status_of_bot)
+
+    async def show_menu(self, message, t_bot, status_of_bot, hidden=()):
+        """
+        1. Выводит сообщение меню (self.text - строка) с кнопками из :data:`TRANSITIONS`
+        2. Переключает обработчик на функцию processing (BotState.processing - корутина).
+           Сохраняются только имя состояния и скрытые кнопки, чтобы диалог пережил перезапуск бота
 
         :param message: сообщение пользователя
         :type message: telebot.types.Message
-        :param t_bot: собственно, сам бот
-        :type t_bot: telebot.TeleBot
-        :param status_of_bot: класс, отслеживающий состояние бота
+        :param t_bot: движок бота
+        :type t_bot: bot.engine.BotEngine
+        :param status_of_bot: состояние диалога с пользователем
         :type status_of_bot: BotStatus
+        :param hidden: кнопки из таблицы переходов, которые сейчас не нужно показывать
+        :type hidden: tuple(str)
+        """
+        status_of_bot.state = get_handler_path(type(self))
+        self.menu = SubMenu(get_keyboard(status_of_bot.state, tuple(hidden)), self.text, message, t_bot,
+                            BotState.processing, status_of_bot, status_of_bot.state, list(hidden))
+        await self.menu.show()
+
+    async def show_page(self, message, t_bot, status_of_bot, keyboard):
         """
-        self.menu = SubMenu(self.buttons, self.text, message, t_bot, self.processing, status_of_bot)
+        При навигации кнопками под сообщением выводит страницу (self.text) одним сообщением
+        со встроенной клавиатурой и ждёт следующее сообщение пользователя так же,
+        как :meth:`show_menu`. Кнопки меню состояния уже должны быть в клавиатуре,
+        см. :meth:`get_inline_menu`
 
-    def processing(self, message, t_bot, status_of_bot):
+        :param message: сообщение пользователя
+        :type message: telebot.types.Message
+        :param t_bot: движок бота
+        :type t_bot: bot.engine.BotEngine
+        :param status_of_bot: состояние диалога с пользователем
+        :type status_of_bot: BotStatus
+        :param keyboard: встроенная клавиатура, сериализованная в JSON
+        :type keyboard: str
+        """
+        status_of_bot.state = get_handler_path(type(self))
+        await t_bot.send_message(message.chat.id, self.text, parse_mode='HTML',
+                                 reply_markup=keyboard)
+        status_of_bot.register_next_step_handler(BotState.processing, status_of_bot.state,
+                                                 list(self.PAGING))
+
+    @classmethod
+    def get_inline_menu(cls) -> Tuple[Button, ...]:
+        """
+        :return: кнопки меню состояния для встроенной клавиатуры, кроме :attr:`PAGING`
+        """
+        return get_inline_menu(get_handler_path(cls), cls.PAGING)
+
+    @staticmethod
+    async def processing(message, t_bot, status_of_bot, state, hidden):
         """
         Метод-обработчик, который определяет, куда нужно переключиться после
         следующего сообщения от пользователя.
 
-        Он сравнивает ключи в словаре next с сообщением от пользователя и,
-        в зависимости от результата сравнения, вызывает нужную функцию
+        Он ищет сообщение от пользователя среди кнопок меню в таблице переходов и,
+        в зависимости от результата, вызывает нужную функцию
         или переходит в другое состояние
 
         :param message: сообщение пользователя
         :type message: telebot.types.Message
-        :param t_bot: сам бот
-        :type t_bot: telebot.TeleBot
-        :param status_of_bot: класс, отслеживающий состояние бота
+        :param t_bot: движок бота
+        :type t_bot: bot.engine.BotEngine
+        :param status_of_bot: состояние диалога с пользователем
         :type status_of_bot: BotStatus
+        :param state: имя состояния, которое показало меню
+        :type state: str
+        :param hidden: кнопки, которые не были показаны в меню
+        :type hidden: list(str)
         """
-        if message.text in self.next.keys():
-            self.next[message.text](message, t_bot, status_of_bot)
+        target = None if message.text in hidden else TRANSITIONS.get(state, {}).get(message.text)
+        if target is not None:
+            await target(message, t_bot, status_of_bot)
         else:
-            logging.info('От пользователя `%s` пришло: `{message.text}`',
-                         message.from_user.username)
-            t_bot.send_message(message.chat.id, "Команда не распознана")
-            self.__init__(message, t_bot, status_of_bot)
+            logging.info('От пользователя `%s` пришло: `%s`',
+                         message.from_user.username, message.text)
+            await t_bot.send_message(message.chat.id, "Команда не распознана")
+            await resolve_handler(state)(message, t_bot, status_of_bot)
 
 
 class GuestState(BotState):
@@ -70,13 +132,7 @@ class GuestState(BotState):
     Состояние неавторизованного пользователя
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        self.text = 'Вы находитесь в гостевом меню...\nАвторизуйтесь чтобы получить доступ к функциям бота'
-        self.buttons = ['Авторизация']
-        self.next = {
-            'Авторизация': AuthState,
-        }
-        super().__init__(message, t_bot, status_of_bot)
+    text = 'Вы находитесь в гостевом меню...\nАвторизуйтесь чтобы получить доступ к функциям бота'
 
 
 class MainState(BotState):
@@ -84,17 +140,7 @@ class MainState(BotState):
     Состояние главного меню.
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        self.text = 'Вы находитесь в главном меню...'
-        self.buttons = ['Календарь', 'Вопросы', 'Профиль', 'Авторизация', 'Что умеет этот бот?']
-        self.next = {
-            'Календарь': CalendarState,
-            'Вопросы': QuestionsState,
-            'Профиль': bot.handlers.ProfileCommandHandler,
-            'Авторизация': AuthState,
-            'Что умеет этот бот?': bot.handlers.HelpCommandHandler,
-        }
-        super().__init__(message, t_bot, status_of_bot)
+    text = 'Вы находитесь в главном меню...'
 
 
 class CalendarState(BotState):
@@ -102,18 +148,7 @@ class CalendarState(BotState):
     Состояние меню календаря.
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        self.text = 'Вы находитесь в меню календаря...'
-        self.buttons = ['Расписание на текущий месяц', 'Расписание по указанному периоду',
-                        'Расписание на предыдущий месяц', 'Расписание на следующий месяц', 'Назад']
-        self.next = {
-            'Расписание на текущий месяц': bot.handlers.CalendarCommandHandler,
-            'Расписание по указанному периоду': bot.handlers.CalendarFromPeriodCommandHandler,
-            'Расписание на предыдущий месяц': bot.handlers.CalendarCommandHandler,
-            'Расписание на следующий месяц': bot.handlers.CalendarCommandHandler,
-            'Назад': MainState
-        }
-        super().__init__(message, t_bot, status_of_bot)
+    text = 'Вы находитесь в меню календаря...'
 
 
 class AuthState(BotState):
@@ -121,68 +156,193 @@ class AuthState(BotState):
     Состояние меню авторизации.
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        self.text = 'Вы перешли в меню авторизации...\n\n' \
-                    'Введите логин:'
-        self.buttons = ['Назад']
-        self.next = {
-            'Назад': MainState,
-        }
-        self.menu = SubMenu(self.buttons, self.text, message, t_bot,
+    text = 'Вы перешли в меню авторизации...\n\n' \
+           'Введите логин:'
+
+    async def run(self, message, t_bot, status_of_bot):
+        status_of_bot.state = get_handler_path(AuthState)
+        self.menu = SubMenu(get_keyboard(status_of_bot.state), self.text, message, t_bot,
                             auth_enter_login_handler, status_of_bot)
+        await self.menu.show()
 
 
 class QuestionsState(BotState):
     """
     Состояние меню вопросов.
+    При навигации кнопками под сообщением список вопросов, кнопки перелистывания
+    и кнопки меню приходят одним сообщением
     """
-    page = 1
 
-    def __init__(self, message, t_bot, status_of_bot):
-        response = get_question_page_json(QuestionsState.page)
+    NEXT_PAGE = 'Отобразить следующие пять вопросов'
+    PREVIOUS_PAGE = 'Отобразить предыдущие пять вопросов'
+    PAGING = (NEXT_PAGE, PREVIOUS_PAGE)
+
+    async def run(self, message, t_bot, status_of_bot):
+        session = await get_user_session(message, t_bot)
+        if session is None:
+            await MainState(message, t_bot, status_of_bot)
+            return
+        page = status_of_bot.questions_page
+        response = await request_with_relogin(
+            message, t_bot, session,
+            lambda user_session: t_bot.ea.get_question_page_json(user_session, page),
+            is_token_rejected)
+        if response is None:
+            await MainState(message, t_bot, status_of_bot)
+            return
         if response.error:
-            t_bot.send_message(message.chat.id, response.error)
-            QuestionsState.page -= 1
-            super().__init__(message, t_bot, status_of_bot)
+            status_of_bot.questions_page = max(page - 1, 1)
+            self.text = response.error
+            await self.show_menu(message, t_bot, status_of_bot, self.PAGING)
             return
 
-        text = question_page_to_str(response.data)
-        self.text = text
-        self.buttons = ['Открыть вопрос', 'Назад']
-        self.next = {
-            'Открыть вопрос': OpenQueCommandHandler,
-            'Назад': MainState
-        }
-        if response.data['real_count'] > 5:
-            self.buttons.insert(1, 'Отобразить следующие пять вопросов')
-            self.next['Отобразить следующие пять вопросов'] = QuePageCommandHandler
-        if QuestionsState.page >= 2:
-            self.buttons.insert(2, 'Отобразить предыдущие пять вопросов')
-            self.next['Отобразить предыдущие пять вопросов'] = QuePageCommandHandler
-        super().__init__(message, t_bot, status_of_bot)
+        self.text = question_page_to_str(response.data)
+        has_next = has_next_questions_page(response.data, page)
+        if t_bot.inline_navigation:
+            await self.show_page(message, t_bot, status_of_bot,
+                                 questions_keyboard(page, has_next, self.get_inline_menu()))
+            return
+        hidden = []
+        if not has_next:
+            hidden.append(self.NEXT_PAGE)
+        if page < 2:
+            hidden.append(self.PREVIOUS_PAGE)
+        await self.show_menu(message, t_bot, status_of_bot, hidden)
 
 
 class QueChatState(BotState):
     """
     Состояние меню определённого вопроса.
+    Номер открытого вопроса и страница реплик хранятся в состоянии диалога
+    """
+
+    PREVIOUS_PAGE = 'Отобразить предыдущие 10 сообщений'
+    PAGING = (PREVIOUS_PAGE,)
+
+    async def run(self, message, t_bot, status_of_bot):
+        session = await get_user_session(message, t_bot)
+        if session is None or status_of_bot.question is None:
+            await MainState(message, t_bot, status_of_bot)
+            return
+        response = await request_with_relogin(
+            message, t_bot, session,
+            lambda user_session: t_bot.ea.open_question(user_session, status_of_bot.question),
+            is_token_rejected)
+        if response is None:
+            await MainState(message, t_bot, status_of_bot)
+            return
+        if response.error:
+            await t_bot.send_message(message.chat.id, response.error)
+            await QuestionsState(message, t_bot, status_of_bot)
+            return
+        jsn, phrases = response.data['question'], response.data['comments']
+        status_of_bot.discussion = jsn['id']
+        page = status_of_bot.chat_page
+        self.text = single_question_to_str(jsn, phrases, session.login, page)
+        has_previous = has_previous_chat_page(phrases, page)
+        if t_bot.inline_navigation:
+            await self.show_page(message, t_bot, status_of_bot, chat_keyboard(
+                status_of_bot.question, page, has_previous, self.get_inline_menu()))
+            return
+        hidden = []
+        if not has_previous:
+            hidden.append(self.PREVIOUS_PAGE)
+        await self.show_menu(message, t_bot, status_of_bot, hidden)
+
+
+#: Кнопки меню состояний в порядке вывода и переходы по ним: имя состояния -> {кнопка: состояние или хэндлер}.
+#: Задаются после объявления состояний, потому что состояния ссылаются друг на друга
+TRANSITIONS: Dict[str, Dict[str, Callable]] = {get_handler_path(state): targets for state, targets in {
+    GuestState: {
+        'Авторизация': AuthState,
+    },
+    MainState: {
+        'Календарь': CalendarState,
+        'Вопросы': QuestionsState,
+        'Профиль': bot.handlers.ProfileCommandHandler,
+        'Авторизация': AuthState,
+        'Что умеет этот бот?': bot.handlers.HelpCommandHandler,
+    },
+    CalendarState: {
+        'Расписание на текущий месяц': bot.handlers.CalendarCommandHandler,
+        'Расписание по указанному периоду': bot.handlers.CalendarFromPeriodCommandHandler,
+        'Расписание на предыдущий месяц': bot.handlers.CalendarCommandHandler,
+        'Расписание на следующий месяц': bot.handlers.CalendarCommandHandler,
+        'Назад': MainState,
+    },
+    AuthState: {
+        'Назад': MainState,
+    },
+    QuestionsState: {
+        'Открыть вопрос': OpenQueCommandHandler,
+        QuestionsState.NEXT_PAGE: QuePageCommandHandler,
+        QuestionsState.PREVIOUS_PAGE: QuePageCommandHandler,
+        'Назад': MainState,
+    },
+    QueChatState: {
+        'Написать сообщение': AskCommandHandler,
+        QueChatState.PREVIOUS_PAGE: PreviousPageChat,
+        'Назад': QuestionsState,
+    },
+}.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def get_keyboard(state: str, hidden: Tuple[str, ...] = ()) -> str:
+    """
+    Клавиатура меню состояния. Собирается и сериализуется один раз для каждого набора кнопок
+
+    :param state: имя состояния, см. :func:`bot.state_store.get_handler_path`
+    :param hidden: кнопки, которые не нужно показывать
+    :return: клавиатура, сериализованная в JSON
+    """
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
+    for text in TRANSITIONS[state]:
+        if text not in hidden:
+            keyboard.add(KeyboardButton(text=text))
+    return keyboard.to_json()
+
+
+@functools.lru_cache(maxsize=None)
+def get_inline_menu(state: str, hidden: Tuple[str, ...] = ()) -> Tuple[Button, ...]:
+    """
+    Кнопки меню состояния для встроенной клавиатуры. Данные кнопки - номера состояния
+    и кнопки в таблице переходов, см. :func:`handle_menu_action`
+
+    :param state: имя состояния, см. :func:`bot.state_store.get_handler_path`
+    :param hidden: кнопки, которые не нужно показывать
+    :return: текст и данные кнопок
     """
-    discussion = 0
-    page = 1
-
-    def __init__(self, message, t_bot, status_of_bot):
-        jsn, phrases = open_question(message)
-        QueChatState.discussion = jsn['id']
-        stroka = single_question_to_str(jsn, phrases)
-        self.text = stroka
-        self.buttons = ['Написать сообщение', 'Назад']
-        self.next = {
-            'Написать сообщение': AskCommandHandler,
-            'Назад': QuestionsState
-        }
-        if len(phrases) > 10:
-            self.buttons.insert(1, 'Отобразить предыдущие 10 сообщений')
-            self.next['Отобразить предыдущие 10 сообщений'] = PreviousPageChat
-        super().__init__(message, t_bot, status_of_bot)
+    number = list(TRANSITIONS).index(state) + 1
+    return tuple((text, f'{MENU_ACTION}:{number}:{index}')
+                 for index, text in enumerate(TRANSITIONS[state], 1) if text not in hidden)
+
+
+async def handle_menu_action(call, t_bot, status_of_bot, state_number, button_number):
+    """
+    Обрабатывает нажатие кнопки меню под сообщением так же, как сообщение с текстом кнопки.
+    Кнопки сообщений, оставшихся от других состояний, не срабатывают
+
+    :param call: callback-запрос
+    :type call: telebot.types.CallbackQuery
+    :param t_bot: движок бота
+    :type t_bot: bot.engine.BotEngine
+    :param status_of_bot: состояние диалога с пользователем
+    :type status_of_bot: BotStatus
+    :param state_number: номер состояния в таблице переходов, начиная с 1
+    :param button_number: номер кнопки в меню состояния, начиная с 1
+    """
+    states = list(TRANSITIONS)
+    state = states[state_number - 1] if state_number <= len(states) else None
+    if state is None or state != status_of_bot.state or button_number > len(TRANSITIONS[state]):
+        logging.info('Кнопка меню %s:%s не относится к текущему состоянию чата %s',
+                     state_number, button_number, call.message.chat.id)
+        return
+    text, target = list(TRANSITIONS[state].items())[button_number - 1]
+    message = copy.copy(call.message)
+    message.text = text
+    message.from_user = call.from_user
+    await target(message, t_bot, status_of_bot)
 
 
 class SubMenu:
@@ -191,35 +351,36 @@ class SubMenu:
     набора кнопок.
     """
 
-    def __init__(self, buttons, text, message, t_bot, func, status_of_bot):
+    def __init__(self, keyboard, text, message, t_bot, func, status_of_bot, *params):
         """
         Конструктор меню
 
-        :param buttons: массив строчек с названиями кнопок
-        :type buttons: list(str)
+        :param keyboard: клавиатура меню, см. :func:`get_keyboard`
+        :type keyboard: str
         :param text: сообщение, которое выводится при переходе в меню
         :type text: str
         :param message: сообщение пользователя
         :type message: telebot.types.Message
-        :param t_bot: сам бот
-        :type t_bot: telebot.TeleBot
-        :param func: функция-обработчик следующего сообщения пользователя
+        :param t_bot: движок бота
+        :type t_bot: bot.engine.BotEngine
+        :param func: корутина-обработчик следующего сообщения пользователя
         :type func: types.FunctionType
-        :param status_of_bot: класс, отслеживающий состояние бота
+        :param status_of_bot: состояние диалога с пользователем
         :type status_of_bot: BotStatus
+        :param params: дополнительные параметры обработчика, сериализуемые в JSON
         """
-        self.buttons = []
-        for item in buttons:
-            self.buttons.append(KeyboardButton(text=item))
-
-        self.keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-
-        for item in self.buttons:
-            self.keyboard.add(item)
-
-        t_bot.send_message(message.chat.id, text, reply_markup=self.keyboard, parse_mode='HTML')
-        t_bot.register_next_step_handler(message, func, t_bot, status_of_bot)
-
-
-class BotStatus:
-    state: BotState
+        self.text = text
+        self.message = message
+        self.t_bot = t_bot
+        self.func = func
+        self.status_of_bot = status_of_bot
+        self.params = params
+        self.keyboard = keyboard
+
+    async def show(self):
+        """
+        Выводит сообщение меню с кнопками и ждёт следующее сообщение пользователя
+        """
+        await self.t_bot.send_message(self.message.chat.id, self.text,
+                                      reply_markup=self.keyboard, parse_mode='HTML')
+        self.status_of_bot.register_next_step_handler(self.func, *self.params)
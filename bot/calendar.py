@@ -8,16 +8,17 @@ import bot.handlers
 from ui.calendar import CalendarUI
 
 
-def input_date_period(message, tele_bot, bot_status):
-    result = process_date_period(message, bot_status, tele_bot)
+async def input_date_period(message, tele_bot, bot_status):
+    result = await process_date_period(message, bot_status, tele_bot)
     if result['success']:
-        bot.handlers.HandlerStructure(message, tele_bot, bot_status, bot.bot_states.CalendarState)
+        await bot.handlers.HandlerStructure.switch(message, tele_bot, bot_status,
+                                                   bot.bot_states.CalendarState)
         return
-    tele_bot.send_message(message.chat.id, result['message'])
-    tele_bot.register_next_step_handler(message, input_date_period)
+    await tele_bot.send_message(message.chat.id, result['message'])
+    bot_status.register_next_step_handler(input_date_period)
 
 
-def process_date_period(message, bot_status, tele_bot):
+async def process_date_period(message, bot_status, tele_bot):
     result = {
         'success': False,
         'message': None,
@@ -34,7 +35,7 @@ def process_date_period(message, bot_status, tele_bot):
     if start_date > end_date:
         result['message'] = CalendarUI.ERROR_INVALID_START
         return result
-    bot.handlers.CalendarCommandHandler(
+    await bot.handlers.CalendarCommandHandler(
         message=message,
         t_bot=tele_bot,
         status_of_bot=bot_status,
@@ -0,0 +1,444 @@
+"""
+Движки бота.
+
+Состояния и хэндлеры бота - корутины. Движок оборачивает телеграм-бота
+(синхронный :class:`telebot.TeleBot` или асинхронный :class:`telebot.async_telebot.AsyncTeleBot`)
+так, чтобы состояния работали с ним одинаково, и выдаёт им подходящее API Eduapp.
+Состояние диалога и сессию Eduapp каждого чата движок загружает из хранилища перед обработкой
+сообщения и сохраняет после. Сообщения обрабатываются через планировщик (:mod:`bot.scheduler`):
+по порядку внутри чата и параллельно для разных чатов. Ответы бота отправляются
+после обработки сообщения через отправитель (:mod:`bot.outbox`), который объединяет
+их и соблюдает ограничения телеграма на частоту отправки.
+Нажатия кнопок под сообщениями (callback-запросы) обрабатываются так же, см. :mod:`bot.navigation`.
+Пока бот работает, движок может присылать напоминания о занятиях (:mod:`bot.reminders`)
+и новые ответы преподавателей (:mod:`bot.replies`)
+"""
+
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Callable, List, Union
+
+from aiohttp import web
+from dotenv import load_dotenv
+from telebot.types import CallbackQuery, Message
+
+import bot.bot_states
+import bot.handlers
+import bot.navigation
+import eduapp.async_api
+from bot.monitoring import monitor_outbox
+from bot.outbox import EDIT, AsyncOutbox, OutgoingMessage, Outbox, buffer_messages
+from bot.reminders import ReminderScheduler
+from bot.replies import ReplyPoller
+from bot.scheduler import BUSY_MESSAGE, AsyncChatScheduler, ChatScheduler, Update, get_chat_id
+from bot.state_store import StateStore
+from bot.webhook import WebhookServer, WebhookSettings, create_webhook_app, register_webhook
+from eduapp import calendar, main, questions
+from eduapp.exceptions import EAError, UnknownError
+from eduapp.metrics import metrics
+from eduapp.sessions import sessions
+
+load_dotenv()
+
+#: Токен телеграм-бота
+token = os.environ.get('TELEGRAM_BOT_TOKEN', 'DEFINE ME!')
+
+#: Адрес хранилища состояний диалогов, см. :func:`bot.state_store.create_state_store`
+state_store_url = os.environ.get('BOT_STATE_STORE', 'memory')
+
+#: Навигация по страницам: ``inline`` - кнопками под сообщением с изменением сообщения,
+#: ``reply`` - кнопками меню с отправкой новых сообщений
+navigation = os.environ.get('BOT_NAVIGATION', 'reply')
+
+#: Напоминания о занятиях: ``on`` - присылать, ``off`` - нет
+reminders = os.environ.get('BOT_REMINDERS', 'off')
+
+#: Уведомления о новых ответах преподавателей: ``on`` - присылать, ``off`` - нет
+reply_notifications = os.environ.get('BOT_REPLY_NOTIFICATIONS', 'off')
+
+#: Время обработки обновлений: ``message`` - сообщений, ``callback`` - нажатий кнопок
+update_seconds = metrics.histogram('bot_update_duration_seconds', 'Время обработки обновления',
+                                   ('kind',))
+
+#: Обновления, обработка которых завершилась ошибкой
+update_errors = metrics.counter('bot_update_errors_total',
+                                'Обновления, обработка которых завершилась ошибкой')
+
+#: Обновления, отклонённые из-за переполненной очереди
+rejected_updates = metrics.counter('bot_rejected_updates_total',
+                                   'Обновления, отклонённые из-за переполненной очереди')
+
+
+def get_busy_reply(update: Update) -> OutgoingMessage:
+    """
+    Ответ пользователю, сообщение которого не поместилось в очередь обработки.
+    Вебхук в этом случае отвечает телеграму 503, а при опросе сообщение иначе потерялось бы молча
+
+    :param update: отклонённое сообщение или callback-запрос
+    :return: сообщение с просьбой повторить позже
+    """
+    rejected_updates.inc()
+    return OutgoingMessage(get_chat_id(update), BUSY_MESSAGE)
+
+
+class SyncEduapp:
+    """
+    API Eduapp для синхронного движка: те же корутины, что и в :mod:`eduapp.async_api`,
+    но внутри них выполняются обычные блокирующие запросы
+    """
+
+    @staticmethod
+    async def open_session(chat_id, username, password):
+        return main.open_session(chat_id, username, password)
+
+    @staticmethod
+    async def relogin(session):
+        return main.relogin(session)
+
+    @staticmethod
+    async def get_profile_data(session):
+        return main.get_profile_data(session)
+
+    @staticmethod
+    async def get_calendar_data(session, start, end):
+        return main.get_calendar_data(session, start, end)
+
+    @staticmethod
+    async def get_month_calendar_data(session, month=0):
+        return calendar.get_month_calendar_data(session, month)
+
+    @staticmethod
+    async def get_question_page_json(session, page=1):
+        return questions.get_question_page_json(session, page)
+
+    @staticmethod
+    async def open_question(session, number):
+        return questions.open_question(session, number)
+
+
+class BotEngine(ABC):
+    """
+    Базовый абстрактный класс движка бота.
+
+    Передаёт сообщения пользователей в обработчики следующего сообщения,
+    сохранённые в состоянии диалога чата
+    """
+
+    #: API Eduapp, которым пользуются состояния и хэндлеры
+    ea = None
+
+    def __init__(self, tele_bot, state_store: StateStore, inline_navigation: bool = False,
+                 reminders: bool = False, reply_notifications: bool = False) -> None:
+        """
+        :param tele_bot: телеграм-бот, через которого отправляются сообщения
+        :param state_store: хранилище состояний диалогов
+        :param inline_navigation: листать страницы кнопками под сообщением, см. :mod:`bot.navigation`
+        :param reminders: присылать напоминания о занятиях, см. :mod:`bot.reminders`
+        :param reply_notifications: присылать новые ответы преподавателей, см. :mod:`bot.replies`
+        """
+        self.tele_bot = tele_bot
+        self.state_store = state_store
+        self.inline_navigation = inline_navigation
+        self.reminders = reminders
+        self.reply_notifications = reply_notifications
+
+    def start_notifiers(self, send: Callable[[OutgoingMessage], None]) -> list:
+        """
+        Запускает включённые фоновые уведомления: напоминания о занятиях и новые ответы преподавателей
+
+        :param send: функция, передающая сообщение отправителю из фонового потока
+        :return: запущенные уведомители, у каждого есть метод ``stop``
+        """
+        def send_html(chat_id: int, text: str) -> None:
+            send(OutgoingMessage(chat_id, text, {'parse_mode': 'HTML'}))
+
+        notifiers = []
+        if self.reminders:
+            notifiers.append(ReminderScheduler(send_html))
+        if self.reply_notifications:
+            notifiers.append(ReplyPoller(send_html))
+        for notifier in notifiers:
+            notifier.start()
+        return notifiers
+
+    @abstractmethod
+    async def send(self, reply: OutgoingMessage) -> None:
+        """
+        Передаёт сообщение отправителю, см. :mod:`bot.outbox`
+
+        :param reply: сообщение
+        """
+
+    async def send_message(self, chat_id, text, **kwargs):
+        """
+        Отправляет сообщение. Параметры те же, что и у :meth:`telebot.TeleBot.send_message`
+        """
+        await self.send(OutgoingMessage(chat_id, text, kwargs))
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        """
+        Меняет текст отправленного сообщения.
+        Остальные параметры те же, что и у :meth:`telebot.TeleBot.edit_message_text`
+        """
+        await self.send(OutgoingMessage(chat_id, text, dict(kwargs, message_id=message_id), method=EDIT))
+
+    @abstractmethod
+    async def answer_callback_query(self, callback_query_id):
+        """
+        Подтверждает получение callback-запроса, чтобы клиент перестал показывать загрузку
+        """
+
+    async def reply_to(self, message, text, **kwargs):
+        """
+        Отвечает на сообщение. Параметры те же, что и у :meth:`telebot.TeleBot.reply_to`
+        """
+        await self.send_message(message.chat.id, text, reply_to_message_id=message.message_id, **kwargs)
+
+    @abstractmethod
+    async def flush(self, messages: List[OutgoingMessage]) -> None:
+        """
+        Отправляет ответы, накопленные за обработку сообщения
+
+        :param messages: ответы в порядке отправки
+        """
+
+    async def process_update(self, update: Union[Message, CallbackQuery]) -> None:
+        """
+        Обрабатывает сообщение пользователя или нажатие кнопки под сообщением
+
+        :param update: сообщение или callback-запрос
+        """
+        if isinstance(update, CallbackQuery):
+            with update_seconds.time('callback'):
+                await self.process_callback(update)
+        else:
+            with update_seconds.time('message'):
+                await self.process_message(update)
+
+    async def process_callback(self, call: CallbackQuery) -> None:
+        """
+        Обрабатывает нажатие кнопки под сообщением, см. :func:`bot.navigation.handle_callback`.
+        Обработчик следующего сообщения при этом не меняется
+
+        :param call: callback-запрос
+        """
+        await self.answer_callback_query(call.id)
+        await self._process(call.message.chat.id, bot.navigation.handle_callback, call)
+
+    async def process_message(self, message: Message) -> None:
+        """
+        Обрабатывает сообщение пользователя: команду ``/start``
+        или зарегистрированный для чата обработчик следующего сообщения
+
+        :param message: сообщение пользователя
+        """
+        await self._process(message.chat.id, self._dispatch, message)
+
+    async def _process(self, chat_id, handler, update) -> None:
+        # Чат блокируется в хранилище, чтобы другой процесс бота не обработал следующее сообщение,
+        # пока не сохранено состояние и не отправлены ответы на это
+        async with self.state_store.lock(chat_id):
+            status_of_bot = await self.state_store.call(self.state_store.load, chat_id)
+            stored_session = await self.state_store.call(self.state_store.load_session, chat_id)
+            if stored_session is not None:
+                sessions.restore(stored_session)
+            with buffer_messages() as replies:
+                try:
+                    await handler(update, self, status_of_bot)
+                except Exception as ex:  # pylint: disable=W0703
+                    # Ответ об ошибке уходит вместе с тем, что хэндлер успел подготовить,
+                    # а обработчик следующего сообщения восстанавливает _dispatch
+                    logging.exception('Ошибка обработки сообщения чата %s', chat_id)
+                    update_errors.inc()
+                    text = str(ex) if isinstance(ex, EAError) else UnknownError.message
+                    await self.send_message(chat_id, text)
+                finally:
+                    await self.state_store.call(self.state_store.save, status_of_bot)
+                    session = sessions.get(chat_id)
+                    if session is not None:
+                        await self.state_store.call(self.state_store.save_session, session)
+            if replies:
+                await self.flush(replies)
+
+    @staticmethod
+    async def _dispatch(message: Message, t_bot, status_of_bot) -> None:
+        if message.text == '/start':
+            status_of_bot.clear_next_step()
+            await bot.handlers.StartCommandHandler(message, t_bot, status_of_bot)
+            return
+        saved_step = status_of_bot.step, status_of_bot.step_params
+        step = status_of_bot.pop_next_step()
+        if step is None:
+            logging.info('Для чата %s нет обработчика сообщения', message.chat.id)
+            return
+        callback, params = step
+        try:
+            with bot.handlers.handler_seconds.time(callback.__qualname__):
+                await callback(message, t_bot, status_of_bot, *params)
+        except Exception:
+            # Если хэндлер упал, не успев назначить следующий, пользователь остаётся на том же шаге
+            if status_of_bot.step is None:
+                status_of_bot.step, status_of_bot.step_params = saved_step
+            raise
+
+
+class SyncEngine(BotEngine):
+    """
+    Синхронный движок: :class:`telebot.TeleBot`, сообщения обрабатываются
+    пулом потоков планировщика, запросы к Eduapp блокируют поток.
+    Телеграм-бот должен быть создан с ``threaded=False``, чтобы сообщения
+    попадали в планировщик в порядке получения
+    """
+
+    ea = SyncEduapp
+
+    def __init__(self, tele_bot, state_store: StateStore, inline_navigation: bool = False,
+                 reminders: bool = False, reply_notifications: bool = False) -> None:
+        super().__init__(tele_bot, state_store, inline_navigation, reminders, reply_notifications)
+        self.outbox = Outbox(lambda reply: getattr(tele_bot, reply.method)(
+            chat_id=reply.chat_id, text=reply.text, **reply.kwargs))
+        monitor_outbox(self.outbox)
+
+    async def send(self, reply: OutgoingMessage) -> None:
+        self.outbox.send(reply)
+
+    async def flush(self, messages: List[OutgoingMessage]) -> None:
+        self.outbox.flush(messages)
+
+    async def answer_callback_query(self, callback_query_id):
+        self.tele_bot.answer_callback_query(callback_query_id)
+
+    def handle(self, update: Union[Message, CallbackQuery]) -> None:
+        """
+        Обрабатывает сообщение или callback-запрос в текущем потоке
+
+        :param update: сообщение или callback-запрос
+        """
+        asyncio.run(self.process_update(update))
+
+    def run(self) -> None:
+        """
+        Запускает бесконечный опрос телеграма
+        """
+        scheduler = ChatScheduler(self.handle)
+
+        def submit(update: Update) -> None:
+            if not scheduler.submit(update):
+                self.outbox.send(get_busy_reply(update))
+
+        @self.tele_bot.message_handler(func=lambda message: True)
+        def handle_message(message: Message):
+            submit(message)
+
+        @self.tele_bot.callback_query_handler(func=lambda call: True)
+        def handle_callback(call: CallbackQuery):
+            submit(call)
+
+        notifiers = self.start_notifiers(self.outbox.send)
+        try:
+            self.tele_bot.infinity_polling()
+        finally:
+            for notifier in notifiers:
+                notifier.stop()
+            scheduler.shutdown()
+
+    def run_webhook(self, settings: WebhookSettings) -> None:
+        """
+        Принимает обновления через вебхук, см. :class:`bot.webhook.WebhookServer`
+
+        :param settings: настройки вебхука
+        :raise ValueError: если не задан секретный токен
+        """
+        settings.check()
+        register_webhook(self.tele_bot.token, settings)
+        server = WebhookServer(ChatScheduler(self.handle), settings)
+        notifiers = self.start_notifiers(self.outbox.send)
+        try:
+            server.serve_forever()
+        finally:
+            for notifier in notifiers:
+                notifier.stop()
+            server.shutdown()
+
+
+class AsyncEngine(BotEngine):
+    """
+    Асинхронный движок: :class:`telebot.async_telebot.AsyncTeleBot` и асинхронный клиент Eduapp.
+    Все сообщения обрабатываются в одном потоке, пока ждём ответа сервера - обрабатываются другие
+    """
+
+    ea = eduapp.async_api
+
+    def __init__(self, tele_bot, state_store: StateStore, inline_navigation: bool = False,
+                 reminders: bool = False, reply_notifications: bool = False) -> None:
+        super().__init__(tele_bot, state_store, inline_navigation, reminders, reply_notifications)
+        state_store.offload = True
+        self.outbox = AsyncOutbox(lambda reply: getattr(tele_bot, reply.method)(
+            chat_id=reply.chat_id, text=reply.text, **reply.kwargs))
+        monitor_outbox(self.outbox)
+
+    async def send(self, reply: OutgoingMessage) -> None:
+        await self.outbox.send(reply)
+
+    async def flush(self, messages: List[OutgoingMessage]) -> None:
+        await self.outbox.flush(messages)
+
+    async def answer_callback_query(self, callback_query_id):
+        await self.tele_bot.answer_callback_query(callback_query_id)
+
+    async def run(self) -> None:
+        """
+        Запускает бесконечный опрос телеграма
+        """
+        scheduler = AsyncChatScheduler(self.process_update)
+
+        async def submit(update: Update) -> None:
+            if not scheduler.submit(update):
+                await self.outbox.send(get_busy_reply(update))
+
+        @self.tele_bot.message_handler(func=lambda message: True)
+        async def handle_message(message: Message):
+            await submit(message)
+
+        @self.tele_bot.callback_query_handler(func=lambda call: True)
+        async def handle_callback(call: CallbackQuery):
+            await submit(call)
+
+        loop = asyncio.get_running_loop()
+        notifiers = self.start_notifiers(
+            lambda reply: asyncio.run_coroutine_threadsafe(self.send(reply), loop))
+        try:
+            await self.tele_bot.infinity_polling()
+        finally:
+            for notifier in notifiers:
+                notifier.stop()
+            await scheduler.join()
+            await eduapp.async_api.async_ea_client.close()
+
+    async def run_webhook(self, settings: WebhookSettings) -> None:
+        """
+        Принимает обновления через вебхук, см. :func:`bot.webhook.create_webhook_app`
+
+        :param settings: настройки вебхука
+        :raise ValueError: если не задан секретный токен
+        """
+        settings.check()
+        register_webhook(self.tele_bot.token, settings)
+        scheduler = AsyncChatScheduler(self.process_update)
+        runner = web.AppRunner(create_webhook_app(scheduler, settings))
+        await runner.setup()
+        await web.TCPSite(runner, settings.host, settings.port).start()
+        logging.info('Вебхук слушает %s:%s%s', settings.host, settings.port, settings.path)
+        loop = asyncio.get_running_loop()
+        notifiers = self.start_notifiers(
+            lambda reply: asyncio.run_coroutine_threadsafe(self.send(reply), loop))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for notifier in notifiers:
+                notifier.stop()
+            await runner.cleanup()
+            await scheduler.join()
+            await eduapp.async_api.async_ea_client.close()
@@ -3,18 +3,23 @@
 import logging
 from abc import ABC
 
-import telebot
-
 import bot.bot_states
-import bot.main
+import bot.navigation
 import config
-from bot.auth import auth_enter_login_handler
+from bot.auth import auth_enter_login_handler, get_user_session, request_with_relogin
 from bot.calendar import input_date_period
 from bot.questions import parse_question_number
-from eduapp.main import login, get_calendar_data, get_profile_data
-from eduapp.urls import EAUrls
+from eduapp.calendar import get_shifted_month
+from eduapp.exceptions import EAError
+from eduapp.metrics import metrics
 from ui.main import calendar_data_to_str, profile_data_to_str
 
+#: Время работы состояний и хэндлеров по имени класса, вместе с состояниями,
+#: на которые они переключают, а также обработчиков следующего сообщения по имени функции
+#: (например ``BotState.processing``)
+handler_seconds = metrics.histogram('bot_handler_duration_seconds',
+                                    'Время работы состояния или хэндлера бота', ('handler',))
+
 
 class BotStructure(ABC):
     """
@@ -22,16 +27,35 @@ class BotStructure(ABC):
     От него должны наследоваться все другие состояния, хэндлеры и все остальное
     """
 
-    def __init__(self, message):
+    def __init__(self, message, t_bot, status_of_bot):
         """
-        Базовый конструктор структуры бота: пишет в лог информацию о команде,
-        которая пришла боту от пользователя.
+        Базовый конструктор структуры бота: запоминает, с чем будет вызван :meth:`run`,
+        и пишет в лог информацию о команде, которая пришла боту от пользователя.
+
+        Сама структура ничего не делает, пока её не дождутся:
+        ``await MainState(message, t_bot, status_of_bot)``
 
         :param message: сообщение пользователя
         :type message: telebot.types.Message
+        :param t_bot: движок бота
+        :type t_bot: bot.engine.BotEngine
+        :param status_of_bot: состояние диалога с пользователем
+        :type status_of_bot: bot.state_store.BotStatus
         """
+        self.args = (message, t_bot, status_of_bot)
         logging.info('От пользователя `%s` пришла команда `%s`', message.from_user.username, message.text)
 
+    def __await__(self):
+        with handler_seconds.time(type(self).__name__):
+            yield from self.run(*self.args).__await__()
+        return self
+
+    async def run(self, message, t_bot, status_of_bot):
+        """
+        Корутина с действиями структуры бота: отправка сообщений, запросы в Eduapp,
+        переключение состояний. Параметры те же, что и у конструктора
+        """
+
 
 class HandlerStructure(BotStructure):
     """
@@ -39,26 +63,22 @@ class HandlerStructure(BotStructure):
     От него должны наследоваться все другие хэндлеры
     """
 
-    def __init__(self, message, t_bot, status_of_bot, back_to_state):
+    @staticmethod
+    async def switch(message, t_bot, status_of_bot, back_to_state):
         """
-        Базовый конструктор хэндлера бота:
-
-        1. Вызывает конструктор структуры бота
-        2. Переключает состояние бота на то, которое должно включиться после
-           выполнения хэндлера
+        Переключает состояние бота на то, которое должно включиться после
+        выполнения хэндлера
 
         :param message: сообщение пользователя
         :type message: telebot.types.Message
-        :param t_bot: сам бот
-        :type t_bot: telebot.TeleBot
-        :param status_of_bot: класс, отслеживающий состояние бота
-        :type status_of_bot: BotStatus
+        :param t_bot: движок бота
+        :type t_bot: bot.engine.BotEngine
+        :param status_of_bot: состояние диалога с пользователем
+        :type status_of_bot: bot.state_store.BotStatus
         :param back_to_state: состояние, которое должно включиться после выполнения хэндлера
         :type back_to_state: bot.bot_states.BotState
         """
-
-        super().__init__(message)
-        status_of_bot.state = back_to_state(message, t_bot, status_of_bot)
+        await back_to_state(message, t_bot, status_of_bot)
 
 
 class StartCommandHandler(HandlerStructure):
@@ -66,8 +86,8 @@ class StartCommandHandler(HandlerStructure):
     Хэндлер стартовой команды (главного меню).
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        super().__init__(message, t_bot, status_of_bot, bot.bot_states.GuestState)
+    async def run(self, message, t_bot, status_of_bot):
+        await self.switch(message, t_bot, status_of_bot, bot.bot_states.GuestState)
 
 
 class HelpCommandHandler(HandlerStructure):
@@ -75,14 +95,14 @@ class HelpCommandHandler(HandlerStructure):
     Хэндлер команды "Что умеет этот бот?"
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        t_bot.reply_to(message, "Этот бот разработан для более удобного взаимодействия учеников с сервисами ШП."
-                                "\n\nС помощью него вы можете за пару кликов: "
-                                "\n\n ⦿ Узнать расписание занятий "
-                                "\n\n ⦿ Просмотреть свой профиль "
-                                "\n\n ⦿ Задать вопрос преподавателю"
-                                "\n\n И многое другое")
-        super().__init__(message, t_bot, status_of_bot, bot.bot_states.MainState)
+    async def run(self, message, t_bot, status_of_bot):
+        await t_bot.reply_to(message, "Этот бот разработан для более удобного взаимодействия учеников с сервисами ШП."
+                                      "\n\nС помощью него вы можете за пару кликов: "
+                                      "\n\n ⦿ Узнать расписание занятий "
+                                      "\n\n ⦿ Просмотреть свой профиль "
+                                      "\n\n ⦿ Задать вопрос преподавателю"
+                                      "\n\n И многое другое")
+        await self.switch(message, t_bot, status_of_bot, bot.bot_states.MainState)
 
 
 class LoginCommandHandler(HandlerStructure):
@@ -90,11 +110,11 @@ class LoginCommandHandler(HandlerStructure):
     Хэндлер команды авторизации.
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
+    async def run(self, message, t_bot, status_of_bot):
         logging.info('От пользователя `%s` пришла команда авторизации', message.from_user.username)
-        t_bot.send_message(message.chat.id, 'Введите "В меню" если захотите вернуться на главное меню')
-        t_bot.send_message(message.chat.id, 'Введите логин')
-        t_bot.register_next_step_handler(message, auth_enter_login_handler, t_bot, status_of_bot)
+        await t_bot.send_message(message.chat.id, 'Введите "В меню" если захотите вернуться на главное меню')
+        await t_bot.send_message(message.chat.id, 'Введите логин')
+        status_of_bot.register_next_step_handler(auth_enter_login_handler)
 
 
 class ProfileCommandHandler(HandlerStructure):
@@ -102,11 +122,18 @@ class ProfileCommandHandler(HandlerStructure):
     Хэндлер команды получения данных о пользователе
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        jsn = get_profile_data()
-        text = profile_data_to_str(jsn)
-        t_bot.send_message(message.chat.id, text, parse_mode='HTML')
-        super().__init__(message, t_bot, status_of_bot, bot.bot_states.MainState)
+    async def run(self, message, t_bot, status_of_bot):
+        session = await get_user_session(message, t_bot)
+        if session:
+            try:
+                jsn = await request_with_relogin(message, t_bot, session, t_bot.ea.get_profile_data)
+            except EAError as ex:
+                await t_bot.send_message(message.chat.id, str(ex))
+            else:
+                if jsn is not None:
+                    text = profile_data_to_str(jsn)
+                    await t_bot.send_message(message.chat.id, text, parse_mode='HTML')
+        await self.switch(message, t_bot, status_of_bot, bot.bot_states.MainState)
 
 
 class CalendarMenuCommandHandler(HandlerStructure):
@@ -114,8 +141,8 @@ class CalendarMenuCommandHandler(HandlerStructure):
     Хэндлер команды меню календаря.
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        super().__init__(message, t_bot, status_of_bot, bot.bot_states.CalendarState)
+    async def run(self, message, t_bot, status_of_bot):
+        await self.switch(message, t_bot, status_of_bot, bot.bot_states.CalendarState)
 
 
 class CalendarCommandHandler(HandlerStructure):
@@ -124,31 +151,74 @@ class CalendarCommandHandler(HandlerStructure):
     """
 
     def __init__(self, message, t_bot, status_of_bot, start_date=None, end_date=None):
-        if start_date:
-            self.get_calendar(message=message, t_bot=t_bot, start_date=start_date, end_date=end_date)
+        super().__init__(message, t_bot, status_of_bot)
+        self.start_date = start_date
+        self.end_date = end_date
+
+    async def run(self, message, t_bot, status_of_bot):
+        if self.start_date:
+            await self.get_calendar(message=message, t_bot=t_bot,
+                                    start_date=self.start_date, end_date=self.end_date)
         else:
             if message.text == "Расписание на предыдущий месяц":
-                self.get_calendar(message, t_bot, month=-1)
+                await self.get_calendar(message, t_bot, month=-1)
             elif message.text == "Расписание на следующий месяц":
-                self.get_calendar(message, t_bot, month=1)
+                await self.get_calendar(message, t_bot, month=1)
             else:
-                self.get_calendar(message, t_bot)
-            super().__init__(message, t_bot, status_of_bot, bot.bot_states.CalendarState)
+                await self.get_calendar(message, t_bot)
+            await self.switch(message, t_bot, status_of_bot, bot.bot_states.CalendarState)
 
     @staticmethod
-    def get_calendar(message, t_bot, month=0, start_date=None, end_date=None):
-        jsn = get_calendar_data(start=start_date, end=end_date, month=month)
-        if not jsn['success']:
-            login(config.USER_LOGIN, config.USER_PASSWORD)
-            jsn = get_calendar_data(start=start_date, end=end_date, month=month)
-        if not jsn['success']:
-            t_bot.send_message(message.chat.id, 'На этом отрезке времени нет занятий')
+    async def get_calendar(message, t_bot, month=0, start_date=None, end_date=None):
+        text = await CalendarCommandHandler.get_calendar_text(message, t_bot, month, start_date, end_date)
+        if text is None:
             return
+        kwargs = {}
+        if t_bot.inline_navigation and start_date is None:
+            kwargs['reply_markup'] = bot.navigation.calendar_keyboard(*get_shifted_month(month))
+        await t_bot.send_message(message.chat.id, text, parse_mode='HTML', **kwargs)
+
+    @staticmethod
+    async def get_calendar_text(message, t_bot, month=0, start_date=None, end_date=None):
+        """
+        Загружает и отрисовывает календарь за месяц или за период.
+        Об ошибках сообщает пользователю
+
+        :param message: сообщение из чата пользователя
+        :type message: telebot.types.Message
+        :param t_bot: движок бота
+        :type t_bot: bot.engine.BotEngine
+        :param month: сдвиг месяца относительно текущего
+        :param start_date: начало периода, если нужен календарь за период
+        :param end_date: конец периода
+        :return: текст календаря или `None`, если календарь не получен
+        """
+        session = await get_user_session(message, t_bot)
+        if session is None:
+            return None
+        try:
+            jsn = await request_with_relogin(
+                message, t_bot, session, lambda user_session: CalendarCommandHandler.load_calendar(
+                    t_bot, user_session, month, start_date, end_date))
+        except EAError as ex:
+            await t_bot.send_message(message.chat.id, str(ex))
+            return None
+        if jsn is None:
+            return None
+        if not jsn['success']:
+            await t_bot.send_message(message.chat.id, 'На этом отрезке времени нет занятий')
+            return None
         try:
-            text = calendar_data_to_str(jsn)
-            t_bot.send_message(message.chat.id, text, parse_mode='HTML')
+            return calendar_data_to_str(jsn)
         except TypeError:
-            t_bot.send_message(message.chat.id, 'На этом отрезке времени нет занятий')
+            await t_bot.send_message(message.chat.id, 'На этом отрезке времени нет занятий')
+            return None
+
+    @staticmethod
+    async def load_calendar(t_bot, session, month=0, start_date=None, end_date=None):
+        if start_date:
+            return await t_bot.ea.get_calendar_data(session, start_date, end_date)
+        return await t_bot.ea.get_month_calendar_data(session, month)
 
 
 class CalendarFromPeriodCommandHandler(HandlerStructure):
@@ -156,9 +226,9 @@ class CalendarFromPeriodCommandHandler(HandlerStructure):
     Хэндлер команды получения расписания за указанный период.
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        t_bot.send_message(message.chat.id, 'Пожалуйста, введите период в формате DD.MM-DD.MM')
-        t_bot.register_next_step_handler(message, input_date_period, t_bot, status_of_bot)
+    async def run(self, message, t_bot, status_of_bot):
+        await t_bot.send_message(message.chat.id, 'Пожалуйста, введите период в формате DD.MM-DD.MM')
+        status_of_bot.register_next_step_handler(input_date_period)
 
 
 class QuePageCommandHandler(HandlerStructure):
@@ -166,12 +236,12 @@ class QuePageCommandHandler(HandlerStructure):
     Хэндлер перелистывания на следующую/предыдущую страницу с вопросами
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
+    async def run(self, message, t_bot, status_of_bot):
         if message.text == 'Отобразить следующие пять вопросов':
-            bot.bot_states.QuestionsState.page += 1
+            status_of_bot.questions_page += 1
         else:
-            bot.bot_states.QuestionsState.page -= 1
-        super().__init__(message, t_bot, status_of_bot, bot.bot_states.QuestionsState)
+            status_of_bot.questions_page = max(status_of_bot.questions_page - 1, 1)
+        await self.switch(message, t_bot, status_of_bot, bot.bot_states.QuestionsState)
 
 
 class OpenQueCommandHandler(HandlerStructure):
@@ -179,9 +249,9 @@ class OpenQueCommandHandler(HandlerStructure):
     Хэндлер открывания определённого вопроса
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        t_bot.send_message(message.chat.id, 'Введите номер вопроса, который хотите открыть')
-        t_bot.register_next_step_handler(message, parse_question_number, t_bot, status_of_bot)
+    async def run(self, message, t_bot, status_of_bot):
+        await t_bot.send_message(message.chat.id, 'Введите номер вопроса, который хотите открыть')
+        status_of_bot.register_next_step_handler(parse_question_number)
 
 
 class AskCommandHandler(HandlerStructure):
@@ -189,10 +259,10 @@ class AskCommandHandler(HandlerStructure):
     Хэндлер написания вопроса в eduapp
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        t_bot.send_message(message.chat.id,
-                           f'Вы можете написать вопрос по этой ссылке: {config.EDUAPP_BASE_URL + f"/pupil/discussions/{bot.bot_states.QueChatState.discussion}/"}')
-        super().__init__(message, t_bot, status_of_bot, bot.bot_states.QuestionsState)
+    async def run(self, message, t_bot, status_of_bot):
+        await t_bot.send_message(message.chat.id,
+                                 f'Вы можете написать вопрос по этой ссылке: {config.EDUAPP_BASE_URL + f"/pupil/discussions/{status_of_bot.discussion}/"}')
+        await self.switch(message, t_bot, status_of_bot, bot.bot_states.QuestionsState)
 
 
 class PreviousPageChat(HandlerStructure):
@@ -200,6 +270,6 @@ class PreviousPageChat(HandlerStructure):
     Хэндлер открывания предыдущих десяти реплик
     """
 
-    def __init__(self, message, t_bot, status_of_bot):
-        bot.bot_states.QueChatState.page += 1
-        super().__init__(message, t_bot, status_of_bot, bot.bot_states.QueChatState.page)
+    async def run(self, message, t_bot, status_of_bot):
+        status_of_bot.chat_page += 1
+        await self.switch(message, t_bot, status_of_bot, bot.bot_states.QueChatState)
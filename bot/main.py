@@ -1,22 +1,18 @@
-import os
-
 import telebot
-from dotenv import load_dotenv
-from telebot.types import Message
 
-import config
-from bot.bot_states import BotStatus
-from bot.handlers import StartCommandHandler
-from eduapp.main import login
+from bot.engine import SyncEngine, navigation, reminders, reply_notifications, \
+    state_store_url, token
+from bot.state_store import create_state_store
+from bot.webhook import WebhookSettings
 
-load_dotenv()
+tele_bot = telebot.TeleBot(token, parse_mode=None, threaded=False)
+engine = SyncEngine(tele_bot, create_state_store(state_store_url),
+                     navigation == 'inline', reminders == 'on', reply_notifications == 'on')
 
-token = os.environ.get('TELEGRAM_BOT_TOKEN', 'DEFINE ME!')
-tele_bot = telebot.TeleBot(token, parse_mode=None)
 
-bot_status = BotStatus()
+def run():
+    engine.run()
 
 
-@tele_bot.message_handler(commands=['start'])
-def start_command_handler(message: Message):
-    StartCommandHandler(message, tele_bot, bot_status)
+def run_webhook():
+    engine.run_webhook(WebhookSettings.from_env())
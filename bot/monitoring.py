@@ -0,0 +1,211 @@
+"""
+Публикация метрик бота (:mod:`eduapp.metrics`).
+
+HTTP-сервер отдаёт все метрики в текстовом формате Prometheus по адресу ``/metrics``,
+а фоновый поток периодически пишет в лог сводку за прошедший интервал: самые долгие
+состояния и хэндлеры, запросы к Eduapp, доли попаданий в кэши и очередь отправки.
+
+Проверить локально::
+
+    curl http://localhost:9100/metrics
+"""
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import config
+from bot.outbox import BaseOutbox
+from eduapp.metrics import HistogramData, Labels, MetricsRegistry, metrics
+
+#: Тип содержимого текстового формата Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+#: Сколько самых долгих хэндлеров и адресов Eduapp показывать в сводке
+SUMMARY_TOP = 10
+
+
+def monitor_outbox(outbox: BaseOutbox, registry: MetricsRegistry = metrics) -> None:
+    """
+    Добавляет в метрики очередь и статистику отправителя сообщений
+
+    :param outbox: отправитель сообщений движка
+    :param registry: реестр метрик
+    """
+    registry.gauge('bot_outbox_queued', 'Сколько сообщений ждут отправки в телеграм',
+                   lambda: outbox.stats.snapshot()['queued'])
+    registry.collected_counter(
+        'bot_outbox_messages_total', 'Сообщения отправителя по результату',
+        lambda: {(result,): value for result, value in outbox.stats.snapshot().items()
+                 if result in ('sent', 'merged', 'retries', 'failed')},
+        ('result',))
+
+
+class MetricsServer:
+    """
+    HTTP-сервер, отдающий метрики в формате Prometheus. Работает в фоновом потоке
+    """
+
+    def __init__(self, host: str, port: int, registry: MetricsRegistry = metrics) -> None:
+        """
+        :param host: адрес, на котором слушает сервер
+        :param port: порт. 0 - любой свободный
+        :param registry: реестр метрик
+        """
+        self.registry = registry
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """
+        Порт, на котором слушает сервер (полезно, если указан порт 0)
+        """
+        return self.httpd.server_address[1]
+
+    def _make_handler(self):
+        server = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=C0103
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = server.registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=W0622
+                logging.debug('Метрики: ' + format, *args)
+
+        return MetricsHandler
+
+    def start(self) -> None:
+        """
+        Запускает сервер в фоновом потоке
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-server',
+                                        daemon=True)
+        self._thread.start()
+        logging.info('Метрики доступны на порту %s по адресу /metrics', self.port)
+
+    def stop(self) -> None:
+        """
+        Останавливает сервер
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def format_latency(seconds: float) -> str:
+    """
+    :param seconds: длительность
+    :return: длительность в миллисекундах для сводки
+    """
+    return '>10 с' if seconds == float('inf') else f'{seconds * 1000:.0f} мс'
+
+
+class MetricsLogger:
+    """
+    Фоновый поток, периодически пишущий в лог сводку метрик за прошедший интервал
+    """
+
+    def __init__(self, interval: float = config.BOT_METRICS_LOG_INTERVAL,
+                 registry: MetricsRegistry = metrics) -> None:
+        """
+        :param interval: как часто писать сводку, в секундах
+        :param registry: реестр метрик
+        """
+        self.interval = interval
+        self.registry = registry
+        self._previous: Dict[str, Dict[Labels, object]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _delta(self, name: str) -> Dict[Labels, object]:
+        # Значения метрики за время с прошлой сводки
+        metric = self.registry.get(name)
+        if metric is None:
+            return {}
+        current = metric.snapshot()
+        previous = self._previous.get(name, {})
+        self._previous[name] = current
+        delta = {}
+        for labels, value in current.items():
+            if labels in previous:
+                value = value - previous[labels]
+            if (value.count if isinstance(value, HistogramData) else value):
+                delta[labels] = value
+        return delta
+
+    def _histogram_lines(self, name: str, title: str) -> List[str]:
+        metric = self.registry.get(name)
+        delta = self._delta(name)
+        if not delta:
+            return []
+        lines = [title]
+        slowest = sorted(delta.items(), key=lambda item: item[1].total, reverse=True)
+        for labels, data in slowest[:SUMMARY_TOP]:
+            lines.append(f'  {" ".join(labels)}: {data.count} шт., в среднем '
+                         f'{format_latency(data.total / data.count)}, '
+                         f'p95 до {format_latency(data.quantile(0.95, metric.bounds))}')
+        return lines
+
+    def summary(self) -> str:
+        """
+        Сводка метрик с прошлого вызова
+
+        :return: многострочный текст сводки
+        """
+        lines = self._histogram_lines('bot_update_duration_seconds', 'Обработка обновлений:')
+        lines += self._histogram_lines('bot_handler_duration_seconds', 'Состояния и хэндлеры:')
+        lines += self._histogram_lines('eduapp_request_duration_seconds', 'Запросы к Eduapp:')
+        errors = {labels: count for labels, count in self._delta('eduapp_responses_total').items()
+                  if not labels[2].isdigit() or int(labels[2]) >= 500}
+        if errors:
+            lines.append('Ошибки Eduapp: ' + ', '.join(
+                f'{method} {endpoint} {status}: {int(count)}'
+                for (method, endpoint, status), count in sorted(errors.items())))
+        lines += self._histogram_lines('ui_template_render_seconds', 'Отрисовка шаблонов:')
+        rates = self.registry.get_cache_hit_rates()
+        if rates:
+            lines.append('Попадания в кэши: ' + ', '.join(
+                f'{name} {rate:.0%}' for name, rate in rates.items()))
+        queued = self.registry.get('bot_outbox_queued')
+        if queued is not None:
+            lines.append(f'Очередь отправки: {queued.collect()}')
+        return '\n'.join(lines)
+
+    def start(self) -> None:
+        """
+        Запускает фоновый поток
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='metrics-logger', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Останавливает фоновый поток
+        """
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                logging.info('Метрики за %s с:\n%s', self.interval, self.summary())
+            except Exception:  # pylint: disable=W0703
+                logging.exception('Ошибка сводки метрик')
+
+
+#: Общий для бота поток сводки метрик
+metrics_logger = MetricsLogger()
@@ -0,0 +1,260 @@
+"""
+Навигация кнопками под сообщением.
+
+Страницы вопросов, реплики обсуждения и месяцы календаря листаются кнопками
+встроенной клавиатуры. Нажатие присылает боту callback-запрос, и бот меняет
+текст того же сообщения вместо отправки нового.
+
+Страница приходит одним сообщением: под ней кнопки перелистывания и кнопки меню состояния.
+
+Всё, что нужно для перехода, записано в данных кнопки коротким токеном, поэтому
+кнопки работают и после перезапуска бота:
+
+- ``q:<страница>`` - страница списка вопросов;
+- ``c:<номер вопроса>:<страница>`` - страница реплик обсуждения;
+- ``m:<год>-<месяц>`` - календарь за месяц;
+- ``a:<номер состояния>:<номер кнопки>`` - кнопка меню состояния,
+  см. :func:`bot.bot_states.handle_menu_action`
+"""
+
+import html
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from telebot.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+import bot.bot_states
+import bot.handlers
+import config
+from bot.auth import get_user_session, is_token_rejected, request_with_relogin
+from constants import MonthNames
+from eduapp.calendar import shift_month
+from ui.questions import question_page_to_str, single_question_to_str
+
+QUESTIONS_PAGE = 'q'
+CHAT_PAGE = 'c'
+CALENDAR_MONTH = 'm'
+MENU_ACTION = 'a'
+
+#: Кнопка встроенной клавиатуры: текст и данные
+Button = Tuple[str, str]
+
+
+def has_next_questions_page(data: dict, page: int) -> bool:
+    """
+    :param data: страница вопросов, см. :func:`eduapp.questions.get_question_page_json`
+    :param page: номер страницы
+    :return: `True`, если после страницы есть ещё вопросы
+    """
+    return data['real_count'] > page * config.EDUAPP_QUESTIONS_PAGE_SIZE
+
+
+def has_previous_chat_page(phrases: list, page: int) -> bool:
+    """
+    :param phrases: реплики обсуждения
+    :param page: страница реплик, начиная с 1 (с самых новых)
+    :return: `True`, если перед страницей есть более ранние реплики
+    """
+    return len(phrases) > 10 * page
+
+
+def _keyboard(*buttons: Optional[Button], menu: Sequence[Button] = ()) -> Optional[str]:
+    # Кнопки перелистывания - в одну строку, кнопки меню - каждая в своей строке
+    row = [InlineKeyboardButton(text, callback_data=data) for text, data in filter(None, buttons)]
+    if not row and not menu:
+        return None
+    keyboard = InlineKeyboardMarkup()
+    if row:
+        keyboard.row(*row)
+    for text, data in menu:
+        keyboard.row(InlineKeyboardButton(text, callback_data=data))
+    return keyboard.to_json()
+
+
+def questions_keyboard(page: int, has_next: bool, menu: Sequence[Button] = ()) -> Optional[str]:
+    """
+    Кнопки перелистывания страниц вопросов
+
+    :param page: текущая страница
+    :param has_next: есть ли следующая страница
+    :param menu: кнопки меню под кнопками перелистывания
+    :return: клавиатура, сериализованная в JSON, или `None`, если кнопок нет
+    """
+    return _keyboard(
+        ('◀', f'{QUESTIONS_PAGE}:{page - 1}') if page > 1 else None,
+        ('▶', f'{QUESTIONS_PAGE}:{page + 1}') if has_next else None,
+        menu=menu,
+    )
+
+
+def chat_keyboard(question: int, page: int, has_previous: bool,
+                  menu: Sequence[Button] = ()) -> Optional[str]:
+    """
+    Кнопки перелистывания реплик обсуждения
+
+    :param question: номер вопроса в списке
+    :param page: текущая страница реплик, начиная с 1 (с самых новых)
+    :param has_previous: есть ли более ранние реплики
+    :param menu: кнопки меню под кнопками перелистывания
+    :return: клавиатура, сериализованная в JSON, или `None`, если кнопок нет
+    """
+    return _keyboard(
+        ('⬆ Раньше', f'{CHAT_PAGE}:{question}:{page + 1}') if has_previous else None,
+        ('⬇ Позже', f'{CHAT_PAGE}:{question}:{page - 1}') if page > 1 else None,
+        menu=menu,
+    )
+
+
+def calendar_keyboard(year: int, month: int) -> str:
+    """
+    Кнопки перехода к соседним месяцам календаря
+
+    :param year: год показанного месяца
+    :param month: показанный месяц
+    :return: клавиатура, сериализованная в JSON
+    """
+    buttons = []
+    for text, delta in (('◀ {}', -1), ('{} ▶', 1)):
+        shifted_year, shifted_month = shift_month(year, month, delta)
+        name = MonthNames.translate(datetime(1, shifted_month, 1).strftime('%B').lower())
+        buttons.append((text.format(name), f'{CALENDAR_MONTH}:{shifted_year}-{shifted_month}'))
+    return _keyboard(*buttons)
+
+
+def parse_callback_data(data: str) -> Optional[Tuple[str, Tuple[int, ...]]]:
+    """
+    Разбирает данные кнопки
+
+    :param data: данные callback-запроса
+    :return: вид токена и его числа или `None`, если данные не распознаны
+    """
+    view, _, args = (data or '').partition(':')
+    try:
+        numbers = tuple(int(arg) for arg in args.replace('-', ':').split(':'))
+    except ValueError:
+        return None
+    expected = {QUESTIONS_PAGE: 1, CHAT_PAGE: 2, CALENDAR_MONTH: 2, MENU_ACTION: 2}
+    if expected.get(view) != len(numbers) or min(numbers) < 1:
+        return None
+    if view == CALENDAR_MONTH and numbers[1] > 12:
+        return None
+    return view, numbers
+
+
+async def handle_callback(call: CallbackQuery, t_bot, status_of_bot) -> None:
+    """
+    Обрабатывает нажатие кнопки под сообщением: меняет текст сообщения
+    на запрошенную страницу
+
+    :param call: callback-запрос
+    :param t_bot: движок бота
+    :type t_bot: bot.engine.BotEngine
+    :param status_of_bot: состояние диалога с пользователем
+    :type status_of_bot: bot.state_store.BotStatus
+    """
+    token = parse_callback_data(call.data)
+    if token is None or call.message is None:
+        logging.info('Неизвестные данные кнопки: %s', call.data)
+        return
+    view, numbers = token
+    if view == QUESTIONS_PAGE:
+        await show_questions_page(call, t_bot, status_of_bot, *numbers)
+    elif view == CHAT_PAGE:
+        await show_chat_page(call, t_bot, status_of_bot, *numbers)
+    elif view == MENU_ACTION:
+        await bot.bot_states.handle_menu_action(call, t_bot, status_of_bot, *numbers)
+    else:
+        await show_calendar_month(call, t_bot, *numbers)
+
+
+def get_plain_text(text: str) -> str:
+    """
+    :param text: текст с HTML-разметкой
+    :return: текст, который увидит пользователь: без тегов и пробелов по краям
+    """
+    return html.unescape(re.sub(r'<[^>]*>', '', text)).strip()
+
+
+def is_shown(message: Message, text: str, keyboard: Optional[str]) -> bool:
+    """
+    Проверяет, показывает ли сообщение уже этот текст и клавиатуру.
+    Такое сообщение не нужно менять: телеграм ответит ошибкой "message is not modified"
+
+    :param message: сообщение бота
+    :param text: новый текст с HTML-разметкой
+    :param keyboard: новая клавиатура, сериализованная в JSON
+    :return: `True`, если текст и клавиатура не изменились
+    """
+    current = message.reply_markup.to_json() if message.reply_markup is not None else None
+    if (json.loads(current) if current else None) != (json.loads(keyboard) if keyboard else None):
+        return False
+    return get_plain_text(text) == (message.text or '').strip()
+
+
+async def edit_page(call: CallbackQuery, t_bot, text: str, keyboard: Optional[str]) -> None:
+    """
+    Меняет текст и клавиатуру сообщения с нажатой кнопкой, если они изменились
+
+    :param call: callback-запрос
+    :param t_bot: движок бота
+    :type t_bot: bot.engine.BotEngine
+    :param text: текст с HTML-разметкой
+    :param keyboard: клавиатура, сериализованная в JSON
+    """
+    if is_shown(call.message, text, keyboard):
+        return
+    await t_bot.edit_message_text(call.message.chat.id, call.message.message_id, text,
+                                  parse_mode='HTML', reply_markup=keyboard)
+
+
+async def show_questions_page(call: CallbackQuery, t_bot, status_of_bot, page: int) -> None:
+    session = await get_user_session(call.message, t_bot)
+    if session is None:
+        return
+    response = await request_with_relogin(
+        call.message, t_bot, session,
+        lambda user_session: t_bot.ea.get_question_page_json(user_session, page),
+        is_token_rejected)
+    if response is None:
+        return
+    if response.error:
+        await t_bot.send_message(call.message.chat.id, response.error)
+        return
+    status_of_bot.questions_page = page
+    keyboard = questions_keyboard(page, has_next_questions_page(response.data, page),
+                                  bot.bot_states.QuestionsState.get_inline_menu())
+    await edit_page(call, t_bot, question_page_to_str(response.data), keyboard)
+
+
+async def show_chat_page(call: CallbackQuery, t_bot, status_of_bot, question: int, page: int) -> None:
+    session = await get_user_session(call.message, t_bot)
+    if session is None:
+        return
+    response = await request_with_relogin(
+        call.message, t_bot, session,
+        lambda user_session: t_bot.ea.open_question(user_session, question),
+        is_token_rejected)
+    if response is None:
+        return
+    if response.error:
+        await t_bot.send_message(call.message.chat.id, response.error)
+        return
+    jsn, phrases = response.data['question'], response.data['comments']
+    status_of_bot.question = question
+    status_of_bot.discussion = jsn['id']
+    status_of_bot.chat_page = page
+    keyboard = chat_keyboard(question, page, has_previous_chat_page(phrases, page),
+                             bot.bot_states.QueChatState.get_inline_menu())
+    text = single_question_to_str(jsn, phrases, session.login, page)
+    await edit_page(call, t_bot, text, keyboard)
+
+
+async def show_calendar_month(call: CallbackQuery, t_bot, year: int, month: int) -> None:
+    now = datetime.now()
+    shift = (year - now.year) * 12 + month - now.month
+    text = await bot.handlers.CalendarCommandHandler.get_calendar_text(call.message, t_bot, month=shift)
+    if text is not None:
+        await edit_page(call, t_bot, text, calendar_keyboard(year, month))
@@ -0,0 +1,469 @@
+"""
+Отправка сообщений в телеграм.
+
+Телеграм ограничивает частоту отправки: около 30 сообщений в секунду на бота
+и около одного сообщения в секунду в один чат, а при превышении отвечает ошибкой 429
+с временем, через которое можно повторить запрос (``retry_after``).
+
+Сообщения, которые хэндлеры отправляют во время обработки одного сообщения пользователя,
+копятся в буфере (см. :func:`buffer_messages`) и отправляются после обработки.
+Идущие подряд тексты объединяются в одно сообщение, если помещаются в лимит длины телеграма,
+а отправка ждёт свободного места в ограничителях частоты - общем и для каждого чата
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import dataclasses
+import html
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import aiohttp
+import requests
+from telebot import apihelper
+
+import config
+
+#: Отправка нового сообщения
+SEND = 'send_message'
+
+#: Изменение текста отправленного сообщения, ``message_id`` передаётся в параметрах
+EDIT = 'edit_message_text'
+
+#: Разделитель текстов объединённых сообщений
+MERGE_SEPARATOR = '\n\n'
+
+# Параметры отправки, которые могут отличаться у объединяемых сообщений
+_MERGEABLE_KWARGS = ('parse_mode', 'reply_markup', 'reply_to_message_id')
+
+# Буфер сообщений обрабатываемого сообщения пользователя
+_buffer: contextvars.ContextVar = contextvars.ContextVar('outbox_buffer', default=None)
+
+
+@dataclasses.dataclass
+class OutgoingMessage:
+    """
+    Сообщение, ожидающее отправки
+    """
+
+    #: Идентификатор чата
+    chat_id: int
+
+    #: Текст сообщения
+    text: str
+
+    #: Остальные параметры метода отправки
+    kwargs: Dict[str, Any] = dataclasses.field(default_factory=dict)
+
+    #: Метод телеграм-бота: :data:`SEND` или :data:`EDIT`. Он вызывается с параметрами
+    #: ``chat_id``, ``text`` и :attr:`kwargs`
+    method: str = SEND
+
+    #: Когда сообщение было поставлено в очередь, по :func:`time.monotonic`
+    created_at: float = dataclasses.field(default_factory=time.monotonic)
+
+
+def _get_text(message: OutgoingMessage, parse_mode: Optional[str]) -> str:
+    if message.kwargs.get('parse_mode') == parse_mode:
+        return message.text
+    # Текст без разметки в сообщении с HTML-разметкой
+    return html.escape(message.text, quote=False)
+
+
+def merge(first: OutgoingMessage, second: OutgoingMessage) -> Optional[OutgoingMessage]:
+    """
+    Объединяет два сообщения в одно, если это возможно: это новые сообщения в один чат,
+    у них не больше одной клавиатуры, второе не отвечает на другое сообщение,
+    разметка совпадает или одно из сообщений без разметки, а другое - в HTML,
+    и вместе они не длиннее лимита телеграма
+
+    :param first: сообщение, отправляемое раньше
+    :param second: сообщение, отправляемое следом
+    :return: объединённое сообщение или `None`, если объединить нельзя
+    """
+    if first.chat_id != second.chat_id or first.method != SEND or second.method != SEND:
+        return None
+    if first.kwargs.get('reply_markup') is not None and second.kwargs.get('reply_markup') is not None:
+        return None
+    if second.kwargs.get('reply_to_message_id') not in (None, first.kwargs.get('reply_to_message_id')):
+        return None
+    parse_modes = {first.kwargs.get('parse_mode'), second.kwargs.get('parse_mode')}
+    if len(parse_modes) > 1 and parse_modes != {None, 'HTML'}:
+        return None
+    other = {key: value for key, value in first.kwargs.items() if key not in _MERGEABLE_KWARGS}
+    if other != {key: value for key, value in second.kwargs.items() if key not in _MERGEABLE_KWARGS}:
+        return None
+    parse_mode = 'HTML' if 'HTML' in parse_modes else None
+    text = _get_text(first, parse_mode) + MERGE_SEPARATOR + _get_text(second, parse_mode)
+    if len(text) > config.TELEGRAM_MESSAGE_LIMIT:
+        return None
+    kwargs = dict(first.kwargs)
+    kwargs.update((key, value) for key, value in second.kwargs.items() if value is not None)
+    return OutgoingMessage(first.chat_id, text, kwargs, created_at=first.created_at)
+
+
+def coalesce(messages: List[OutgoingMessage]) -> List[OutgoingMessage]:
+    """
+    Объединяет идущие подряд сообщения, см. :func:`merge`
+
+    :param messages: сообщения в порядке отправки
+    :return: сообщения, которые нужно отправить
+    """
+    result: List[OutgoingMessage] = []
+    for message in messages:
+        merged = merge(result[-1], message) if result else None
+        if merged is not None:
+            result[-1] = merged
+        else:
+            result.append(message)
+    return result
+
+
+@contextlib.contextmanager
+def buffer_messages() -> Iterator[List[OutgoingMessage]]:
+    """
+    Копит сообщения, отправляемые через :meth:`Outbox.send` внутри блока ``with``
+
+    :return: список накопленных сообщений, который нужно отправить после блока
+    """
+    messages: List[OutgoingMessage] = []
+    reset_token = _buffer.set(messages)
+    try:
+        yield messages
+    finally:
+        _buffer.reset(reset_token)
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты "корзина с токенами": в корзину с постоянной скоростью
+    добавляются токены, каждое сообщение забирает один. Если корзина пуста,
+    токен берётся в долг и сообщение ждёт, пока он появится
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        """
+        :param rate: сколько токенов добавляется в секунду
+        :param capacity: размер корзины - сколько сообщений можно отправить сразу
+        :param now: текущее время, по :func:`time.monotonic`
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+        self.paused_until = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def reserve(self, now: float) -> float:
+        """
+        Забирает токен
+
+        :param now: текущее время, по :func:`time.monotonic`
+        :return: сколько секунд нужно подождать перед отправкой
+        """
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, until: float) -> None:
+        """
+        Запрещает отправку до указанного времени, например после ошибки 429
+
+        :param until: время по :func:`time.monotonic`
+        """
+        self.paused_until = max(self.paused_until, until)
+
+    def is_idle(self, now: float) -> bool:
+        """
+        :return: `True`, если корзина полна и её можно удалить без потери ограничений
+        """
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class RateLimiter:
+    """
+    Общий ограничитель частоты отправки и ограничители для каждого чата. Потокобезопасен
+    """
+
+    def __init__(self, rate: float = config.BOT_SEND_RATE,
+                 burst: float = config.BOT_SEND_BURST,
+                 chat_rate: float = config.BOT_CHAT_SEND_RATE,
+                 chat_burst: float = config.BOT_CHAT_SEND_BURST,
+                 max_chats: int = config.BOT_SEND_MAX_CHATS) -> None:
+        """
+        :param rate: сколько сообщений в секунду можно отправить во все чаты
+        :param burst: сколько сообщений можно отправить во все чаты сразу
+        :param chat_rate: сколько сообщений в секунду можно отправить в один чат
+        :param chat_burst: сколько сообщений можно отправить в один чат сразу
+        :param max_chats: сколько ограничителей чатов хранить, прежде чем удалять неактивные
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self._global = TokenBucket(rate, burst, time.monotonic())
+        self._chats: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def reserve(self, chat_id: int) -> float:
+        """
+        Занимает место для отправки сообщения в чат
+
+        :param chat_id: идентификатор чата
+        :return: сколько секунд нужно подождать перед отправкой
+        """
+        now = time.monotonic()
+        with self._lock:
+            return max(self._global.reserve(now), self._chat_bucket(chat_id, now).reserve(now))
+
+    def pause(self, chat_id: int, delay: float) -> None:
+        """
+        Приостанавливает отправку в чат
+
+        :param chat_id: идентификатор чата
+        :param delay: на сколько секунд
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._chat_bucket(chat_id, now).pause(now + delay)
+
+
+class OutboxStats:
+    """
+    Статистика отправки сообщений. Потокобезопасна
+    """
+
+    def __init__(self) -> None:
+        #: Сколько сообщений ждут отправки
+        self.queued = 0
+        #: Сколько сообщений отправлено
+        self.sent = 0
+        #: Сколько сообщений не отправлено отдельно, а объединено с предыдущими
+        self.merged = 0
+        #: Сколько раз отправка повторялась после ошибки 429
+        self.retries = 0
+        #: Сколько сообщений не удалось отправить
+        self.failed = 0
+        #: Суммарная и максимальная задержка от постановки в очередь до отправки, в секундах
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._lock = threading.Lock()
+
+    def add_queued(self, count: int) -> None:
+        with self._lock:
+            self.queued += count
+
+    def add_merged(self, count: int) -> None:
+        with self._lock:
+            self.merged += count
+
+    def add_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def add_done(self, message: OutgoingMessage, success: bool) -> None:
+        latency = time.monotonic() - message.created_at
+        with self._lock:
+            self.queued -= 1
+            if not success:
+                self.failed += 1
+                return
+            self.sent += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        :return: значения статистики и средняя задержка отправки
+        """
+        with self._lock:
+            return {
+                'queued': self.queued,
+                'sent': self.sent,
+                'merged': self.merged,
+                'retries': self.retries,
+                'failed': self.failed,
+                'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+
+def get_retry_after(ex: Exception) -> Optional[float]:
+    """
+    :param ex: ошибка отправки сообщения
+    :return: через сколько секунд повторить отправку или `None`, если это не ошибка 429
+    """
+    if getattr(ex, 'error_code', None) != 429:
+        return None
+    return float(ex.result_json.get('parameters', {}).get('retry_after', 1))
+
+
+def is_not_modified(ex: Exception) -> bool:
+    """
+    :param ex: ошибка отправки сообщения
+    :return: `True`, если телеграм не стал менять сообщение, потому что текст и клавиатура те же
+    """
+    return getattr(ex, 'error_code', None) == 400 and 'message is not modified' in str(ex)
+
+
+class BaseOutbox:
+    """
+    Базовый класс отправителя сообщений
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None,
+                 retries: int = config.BOT_SEND_RETRIES) -> None:
+        """
+        :param limiter: ограничитель частоты отправки
+        :param retries: сколько раз повторять отправку после ошибки 429
+        """
+        self.limiter = limiter or RateLimiter()
+        self.retries = retries
+        self.stats = OutboxStats()
+
+    def _prepare(self, messages: List[OutgoingMessage]) -> List[OutgoingMessage]:
+        result = coalesce(messages)
+        self.stats.add_merged(len(messages) - len(result))
+        self.stats.add_queued(len(result))
+        return result
+
+    def _should_retry(self, message: OutgoingMessage, ex: Exception, attempt: int) -> bool:
+        if is_not_modified(ex):
+            # Сообщение уже показывает этот текст, например после двойного нажатия кнопки
+            logging.debug('Сообщение в чате %s не изменилось', message.chat_id)
+            return False
+        retry_after = get_retry_after(ex)
+        if retry_after is None or attempt > self.retries:
+            logging.error('Не удалось отправить сообщение в чат %s: %s', message.chat_id, ex)
+            return False
+        logging.warning('Телеграм просит подождать %s с перед отправкой в чат %s',
+                        retry_after, message.chat_id)
+        self.limiter.pause(message.chat_id, retry_after)
+        self.stats.add_retry()
+        return True
+
+
+class Outbox(BaseOutbox):
+    """
+    Отправитель сообщений для синхронного движка.
+    Сообщения отправляются в потоке, который их отправил, поток ждёт ограничителя частоты
+    """
+
+    def __init__(self, send: Callable[[OutgoingMessage], Any], **kwargs) -> None:
+        """
+        :param send: функция отправки одного сообщения
+        :param kwargs: параметры :class:`BaseOutbox`
+        """
+        super().__init__(**kwargs)
+        self._send = send
+
+    def send(self, message: OutgoingMessage) -> None:
+        """
+        Отправляет сообщение или, внутри :func:`buffer_messages`, откладывает его
+
+        :param message: сообщение
+        """
+        buffer = _buffer.get()
+        if buffer is not None:
+            buffer.append(message)
+        else:
+            self.flush([message])
+
+    def flush(self, messages: List[OutgoingMessage]) -> None:
+        """
+        Объединяет и отправляет сообщения по порядку
+
+        :param messages: сообщения
+        """
+        for message in self._prepare(messages):
+            success = False
+            try:
+                success = self._deliver(message)
+            except (apihelper.ApiException, requests.RequestException) as ex:
+                # Ошибка одного сообщения не мешает отправить остальные
+                logging.error('Не удалось отправить сообщение в чат %s: %s', message.chat_id, ex)
+            finally:
+                self.stats.add_done(message, success)
+
+    def _deliver(self, message: OutgoingMessage) -> bool:
+        attempt = 0
+        while True:
+            time.sleep(self.limiter.reserve(message.chat_id))
+            try:
+                self._send(message)
+                return True
+            except apihelper.ApiTelegramException as ex:
+                attempt += 1
+                if not self._should_retry(message, ex, attempt):
+                    return is_not_modified(ex)
+
+
+class AsyncOutbox(BaseOutbox):
+    """
+    Отправитель сообщений для асинхронного движка.
+    Пока сообщение ждёт ограничителя частоты, обрабатываются другие
+    """
+
+    def __init__(self, send: Callable[[OutgoingMessage], Awaitable[Any]], **kwargs) -> None:
+        """
+        :param send: корутина отправки одного сообщения
+        :param kwargs: параметры :class:`BaseOutbox`
+        """
+        super().__init__(**kwargs)
+        self._send = send
+        # Модуль создаёт сессию aiohttp при импорте, поэтому импортируется только в асинхронном движке
+        from telebot import asyncio_helper  # pylint: disable=C0415
+        self._api_error = asyncio_helper.ApiTelegramException
+        self._send_errors = (asyncio_helper.ApiException, asyncio_helper.RequestTimeout,
+                             aiohttp.ClientError, asyncio.TimeoutError)
+
+    async def send(self, message: OutgoingMessage) -> None:
+        """
+        См. :meth:`Outbox.send`
+        """
+        buffer = _buffer.get()
+        if buffer is not None:
+            buffer.append(message)
+        else:
+            await self.flush([message])
+
+    async def flush(self, messages: List[OutgoingMessage]) -> None:
+        """
+        См. :meth:`Outbox.flush`
+        """
+        for message in self._prepare(messages):
+            success = False
+            try:
+                success = await self._deliver(message)
+            except self._send_errors as ex:
+                logging.error('Не удалось отправить сообщение в чат %s: %s', message.chat_id, ex)
+            finally:
+                self.stats.add_done(message, success)
+
+    async def _deliver(self, message: OutgoingMessage) -> bool:
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.limiter.reserve(message.chat_id))
+            try:
+                await self._send(message)
+                return True
+            except self._api_error as ex:
+                attempt += 1
+                if not self._should_retry(message, ex, attempt):
+                    return is_not_modified(ex)
@@ -1,23 +1,27 @@
-import requests
 from telebot.types import Message
 
-import config
 import bot.bot_states
-from eduapp.questions import get_question_page_json
-from eduapp.urls import EAUrls
+import config
+from bot.auth import get_user_session
 
 
-def parse_question_number(message: Message, t_bot, status):
+async def parse_question_number(message: Message, t_bot, status):
     if message.text == 'Назад':
-        bot.bot_states.QuestionsState(message, t_bot, status)
+        await bot.bot_states.QuestionsState(message, t_bot, status)
+        return
+    session = await get_user_session(message, t_bot)
+    if session is None:
+        await bot.bot_states.MainState(message, t_bot, status)
         return
-    first_num = bot.bot_states.QuestionsState.page * 5
+    first_num = status.questions_page * config.EDUAPP_QUESTIONS_PAGE_SIZE
     try:
         if 1 <= int(message.text) <= first_num:
-            bot.bot_states.QueChatState(message, t_bot, status)
+            status.question = int(message.text)
+            status.chat_page = 1
+            await bot.bot_states.QueChatState(message, t_bot, status)
         else:
-            t_bot.send_message(message.chat.id, f'Введите число от 1 до {first_num} или "Назад" если хотите выйти')
-            t_bot.register_next_step_handler(message, parse_question_number, t_bot, status)
+            await t_bot.send_message(message.chat.id, f'Введите число от 1 до {first_num} или "Назад" если хотите выйти')
+            status.register_next_step_handler(parse_question_number)
     except ValueError:
-        t_bot.send_message(message.chat.id, f'Введите число от 1 до {first_num} или "Назад" если хотите выйти')
-        t_bot.register_next_step_handler(message, parse_question_number, t_bot, status)
+        await t_bot.send_message(message.chat.id, f'Введите число от 1 до {first_num} или "Назад" если хотите выйти')
+        status.register_next_step_handler(parse_question_number)
@@ -0,0 +1,305 @@
+"""
+Напоминания о занятиях.
+
+Планировщик держит в куче (:mod:`heapq`) ближайшие занятия всех авторизованных
+пользователей и присылает напоминание за :data:`config.BOT_REMINDER_LEAD` секунд
+до начала каждого. Поток отправки спит до момента ближайшего напоминания и
+просыпается раньше, только если появилось напоминание ещё раньше.
+
+Расписания берутся из кэша календаря (:mod:`eduapp.calendar`). Второй поток обходит
+сессии пачками по :data:`config.BOT_REMINDER_REFRESH_BATCH` с паузой между пачками,
+поэтому обновление расписаний не создаёт всплеск запросов к Eduapp.
+
+В куче лежат только напоминания на :data:`config.BOT_REMINDER_HORIZON` секунд вперёд,
+а их общее количество ограничено :data:`config.BOT_REMINDER_MAX_PENDING`.
+Обновлённое расписание чата не ищется в куче: у старых напоминаний просто устаревает
+поколение, и они пропускаются при извлечении. Когда устаревших записей становится
+больше, чем действующих, куча пересобирается
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+
+import config
+from eduapp.calendar import get_month
+from eduapp.exceptions import EAError
+from eduapp.lessons import Lesson
+from eduapp.sessions import EASession, SessionRegistry, sessions
+from ui.calendar import reminder_to_str
+
+#: Напоминание в куче: (когда отправить, поколение, идентификатор чата, текст)
+Reminder = Tuple[float, int, int, str]
+
+
+class ReminderQueue:
+    """
+    Очередь напоминаний, упорядоченная по времени отправки. Не потокобезопасна
+    """
+
+    def __init__(self, max_size: int = config.BOT_REMINDER_MAX_PENDING) -> None:
+        """
+        :param max_size: сколько напоминаний может ждать отправки
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._heap: List[Reminder] = []
+        self._generations: Dict[int, int] = {}
+        self._counts: Dict[int, int] = {}
+        self._counter = itertools.count()
+
+    def replace(self, chat_id: int, reminders: Iterable[Tuple[float, str]]) -> int:
+        """
+        Заменяет все напоминания чата
+
+        :param chat_id: идентификатор чата
+        :param reminders: пары (когда отправить, текст)
+        :return: сколько напоминаний добавлено
+        """
+        self._drop(chat_id)
+        generation = next(self._counter)
+        added = 0
+        for remind_at, text in reminders:
+            if self.size >= self.max_size:
+                logging.warning('Очередь напоминаний заполнена, напоминания чата %s отброшены', chat_id)
+                break
+            heapq.heappush(self._heap, (remind_at, generation, chat_id, text))
+            self.size += 1
+            added += 1
+        if added:
+            self._generations[chat_id] = generation
+            self._counts[chat_id] = added
+        self._compact()
+        return added
+
+    def remove(self, chat_id: int) -> None:
+        """
+        Удаляет все напоминания чата
+
+        :param chat_id: идентификатор чата
+        """
+        self._drop(chat_id)
+        self._compact()
+
+    def chat_ids(self) -> Set[int]:
+        """
+        :return: чаты, у которых есть напоминания
+        """
+        return set(self._counts)
+
+    def next_time(self) -> Optional[float]:
+        """
+        :return: когда отправить ближайшее напоминание или `None`, если напоминаний нет
+        """
+        self._skip_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[Tuple[int, str]]:
+        """
+        Достаёт напоминания, которые пора отправить
+
+        :param now: текущий момент (:func:`time.time`)
+        :return: пары (идентификатор чата, текст) по порядку отправки
+        """
+        due = []
+        while self.next_time() is not None and self._heap[0][0] <= now:
+            _, _, chat_id, text = heapq.heappop(self._heap)
+            due.append((chat_id, text))
+            self.size -= 1
+            self._counts[chat_id] -= 1
+            if not self._counts[chat_id]:
+                del self._counts[chat_id]
+                del self._generations[chat_id]
+        return due
+
+    def _is_stale(self, reminder: Reminder) -> bool:
+        return self._generations.get(reminder[2]) != reminder[1]
+
+    def _skip_stale(self) -> None:
+        while self._heap and self._is_stale(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _drop(self, chat_id: int) -> None:
+        self.size -= self._counts.pop(chat_id, 0)
+        self._generations.pop(chat_id, None)
+
+    def _compact(self) -> None:
+        if len(self._heap) <= 2 * self.size + 64:
+            return
+        self._heap = [reminder for reminder in self._heap if not self._is_stale(reminder)]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def get_months(start: float, end: float) -> List[Tuple[int, int]]:
+    """
+    Месяцы, на которые приходится промежуток времени
+
+    :param start: начало промежутка (:func:`time.time`)
+    :param end: конец промежутка
+    :return: пары (год, месяц) по порядку
+    """
+    first, last = datetime.fromtimestamp(start), datetime.fromtimestamp(end)
+    months = [(first.year, first.month)]
+    if (last.year, last.month) != months[0]:
+        months.append((last.year, last.month))
+    return months
+
+
+def get_upcoming_lessons(data: dict, start: float, end: float) -> List[Lesson]:
+    """
+    Занятия из календаря, начинающиеся в промежутке времени
+
+    :param data: красивый словарь с данными о календаре
+    :param start: начало промежутка (:func:`time.time`), не включается
+    :param end: конец промежутка, включается
+    :return: занятия
+    """
+    if not data.get('success'):
+        return []
+    return [lesson for lessons in data['days'].values() for lesson in lessons
+            if start < lesson.time.start.timestamp() <= end]
+
+
+class ReminderScheduler:
+    """
+    Фоновые потоки, которые обновляют расписания пользователей и присылают напоминания
+    """
+
+    def __init__(self, send: Callable[[int, str], None],
+                 registry: SessionRegistry = sessions,
+                 lead: float = config.BOT_REMINDER_LEAD,
+                 horizon: float = config.BOT_REMINDER_HORIZON,
+                 refresh_interval: float = config.BOT_REMINDER_REFRESH_INTERVAL,
+                 batch_size: int = config.BOT_REMINDER_REFRESH_BATCH,
+                 batch_pause: float = config.BOT_REMINDER_REFRESH_PAUSE,
+                 max_pending: int = config.BOT_REMINDER_MAX_PENDING) -> None:
+        """
+        :param send: функция отправки напоминания: (идентификатор чата, текст с HTML-разметкой)
+        :param registry: реестр сессий
+        :param lead: за сколько секунд до начала занятия напоминать
+        :param horizon: на сколько секунд вперёд планировать напоминания
+        :param refresh_interval: пауза между обходами всех сессий, в секундах
+        :param batch_size: сколько расписаний обновлять за раз
+        :param batch_pause: пауза между пачками, в секундах
+        :param max_pending: сколько напоминаний может ждать отправки
+        """
+        self.send = send
+        self.registry = registry
+        self.lead = lead
+        self.horizon = horizon
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.queue = ReminderQueue(max_pending)
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def refresh(self, session: EASession) -> int:
+        """
+        Перепланирует напоминания пользователя по его календарю.
+        Если календарь не удалось получить, старые напоминания остаются
+
+        :param session: сессия пользователя
+        :return: сколько напоминаний запланировано
+        """
+        now = time.time()
+        start, end = now + self.lead, now + self.lead + self.horizon
+        lessons = []
+        try:
+            for year, month in get_months(start, end):
+                data = get_month(session, year, month)
+                if not data.get('success'):
+                    return 0
+                lessons.extend(get_upcoming_lessons(data, start, end))
+        except (EAError, requests.RequestException) as ex:
+            logging.info('Не удалось обновить расписание чата %s: %s', session.chat_id, ex)
+            return 0
+        reminders = [(lesson.time.start.timestamp() - self.lead, reminder_to_str(lesson))
+                     for lesson in lessons]
+        with self._wakeup:
+            before = self.queue.next_time()
+            added = self.queue.replace(session.chat_id, reminders)
+            after = self.queue.next_time()
+            if after is not None and (before is None or after < before):
+                self._wakeup.notify()
+        return added
+
+    def refresh_all(self) -> int:
+        """
+        Обновляет расписания всех пользователей, которые пользовались ботом
+        в последние :data:`config.EDUAPP_SESSION_TTL` секунд, пачками
+
+        :return: сколько напоминаний запланировано
+        """
+        active = self.registry.active(time.time() - config.EDUAPP_SESSION_TTL)
+        with self._wakeup:
+            for chat_id in self.queue.chat_ids() - {session.chat_id for session in active}:
+                self.queue.remove(chat_id)
+        added = 0
+        for offset in range(0, len(active), self.batch_size):
+            if offset and self._stop.wait(self.batch_pause):
+                break
+            added += sum(self.refresh(session) for session in active[offset:offset + self.batch_size])
+        return added
+
+    def dispatch_due(self) -> int:
+        """
+        Отправляет напоминания, которые пора отправить
+
+        :return: сколько напоминаний отправлено
+        """
+        with self._wakeup:
+            due = self.queue.pop_due(time.time())
+        for chat_id, text in due:
+            try:
+                self.send(chat_id, text)
+            except Exception:  # pylint: disable=W0703
+                logging.exception('Ошибка отправки напоминания в чат %s', chat_id)
+        return len(due)
+
+    def start(self) -> None:
+        """
+        Запускает фоновые потоки
+        """
+        if self._threads:
+            return
+        self._threads = [threading.Thread(target=self._run_refresh, name='reminder-refresh', daemon=True),
+                         threading.Thread(target=self._run_dispatch, name='reminder-dispatch', daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Останавливает фоновые потоки
+        """
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _run_refresh(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh_all()
+            except Exception:  # pylint: disable=W0703
+                logging.exception('Ошибка обновления расписаний для напоминаний')
+            self._stop.wait(self.refresh_interval)
+
+    def _run_dispatch(self) -> None:
+        while not self._stop.is_set():
+            with self._wakeup:
+                next_time = self.queue.next_time()
+                timeout = None if next_time is None else next_time - time.time()
+                if timeout is None or timeout > 0:
+                    self._wakeup.wait(timeout)
+                    continue
+            self.dispatch_due()
@@ -0,0 +1,125 @@
+"""
+Уведомления о новых ответах преподавателей в обсуждениях.
+
+Фоновый поток обходит сессии пользователей пачками по :data:`config.BOT_REPLIES_POLL_BATCH`
+с паузой между пачками и синхронизирует их обсуждения (:mod:`eduapp.discussions`).
+Синхронизация запрашивает только изменившиеся обсуждения и только новые реплики,
+поэтому обход почти ничего не скачивает, пока преподаватели не отвечают
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+import config
+from eduapp.discussions import sync_discussions
+from eduapp.exceptions import EAError
+from eduapp.sessions import EASession, SessionRegistry, sessions
+from ui.questions import reply_notification_to_str
+
+
+def is_teacher_reply(comment: dict, session: EASession) -> bool:
+    """
+    Отличает ответы преподавателей от реплик самого ученика по идентификатору автора:
+    логин ученика не обязан совпадать с именем пользователя, которое показывает сервер
+
+    :param comment: реплика обсуждения
+    :param session: сессия ученика
+    :return: `True`, если реплику написал не ученик. Реплики без автора не считаются ответами
+    """
+    author_id = (comment.get('author') or {}).get('id')
+    return author_id is not None and session.user_id is not None and author_id != session.user_id
+
+
+class ReplyPoller:
+    """
+    Фоновый поток, который присылает пользователям новые ответы преподавателей
+    """
+
+    def __init__(self, send: Callable[[int, str], None],
+                 registry: SessionRegistry = sessions,
+                 interval: float = config.BOT_REPLIES_POLL_INTERVAL,
+                 batch_size: int = config.BOT_REPLIES_POLL_BATCH,
+                 batch_pause: float = config.BOT_REPLIES_POLL_PAUSE) -> None:
+        """
+        :param send: функция отправки уведомления: (идентификатор чата, текст с HTML-разметкой)
+        :param registry: реестр сессий
+        :param interval: пауза между обходами всех сессий, в секундах
+        :param batch_size: сколько пользователей синхронизировать за раз
+        :param batch_pause: пауза между пачками, в секундах
+        """
+        self.send = send
+        self.registry = registry
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll(self, session: EASession) -> int:
+        """
+        Синхронизирует обсуждения пользователя и присылает ему новые ответы преподавателей
+
+        :param session: сессия пользователя
+        :return: сколько уведомлений отправлено
+        """
+        try:
+            updates = sync_discussions(session)
+        except EAError as ex:
+            logging.info('Не удалось синхронизировать обсуждения чата %s: %s', session.chat_id, ex)
+            return 0
+        sent = 0
+        for update in updates:
+            replies = [comment for comment in update.comments if is_teacher_reply(comment, session)]
+            if replies:
+                self.send(session.chat_id, reply_notification_to_str(update.question, replies))
+                sent += 1
+        return sent
+
+    def poll_all(self) -> int:
+        """
+        Синхронизирует обсуждения всех пользователей, которые пользовались ботом
+        в последние :data:`config.EDUAPP_SESSION_TTL` секунд, пачками
+
+        :return: сколько уведомлений отправлено
+        """
+        active: List[EASession] = self.registry.active(time.time() - config.EDUAPP_SESSION_TTL)
+        sent = 0
+        for offset in range(0, len(active), self.batch_size):
+            if offset and self._stop.wait(self.batch_pause):
+                break
+            sent += sum(self._poll_safely(session)
+                        for session in active[offset:offset + self.batch_size])
+        return sent
+
+    def _poll_safely(self, session: EASession) -> int:
+        # Ошибка одной сессии не должна лишать уведомлений остальные
+        try:
+            return self.poll(session)
+        except Exception:  # pylint: disable=W0703
+            logging.exception('Ошибка проверки новых ответов чата %s', session.chat_id)
+            return 0
+
+    def start(self) -> None:
+        """
+        Запускает фоновый поток
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='reply-poller', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Останавливает фоновый поток
+        """
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_all()
+            except Exception:  # pylint: disable=W0703
+                logging.exception('Ошибка проверки новых ответов в обсуждениях')
+            self._stop.wait(self.interval)
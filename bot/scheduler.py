@@ -0,0 +1,223 @@
+"""
+Планировщик обработки сообщений.
+
+Сообщения раскладываются по очередям чатов. Сообщения одного чата обрабатываются
+строго по порядку, по одному, а разные чаты - параллельно общим пулом обработчиков.
+Так два быстрых нажатия кнопок в одном чате не гоняются за состоянием диалога,
+а медленный запрос к Eduapp одного пользователя не задерживает остальных.
+
+После каждого сообщения очередь чата встаёт в конец общей очереди пула,
+поэтому чат с большим количеством сообщений не занимает обработчик надолго
+"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Deque, Dict, Optional, Union
+
+from telebot.types import CallbackQuery, Message
+
+import config
+
+#: Обновление телеграма, которое обрабатывает бот
+Update = Union[Message, CallbackQuery]
+
+#: Ответ на сообщение, которое не поместилось в очередь
+BUSY_MESSAGE = 'Слишком много сообщений, повторите позже'
+
+
+def get_chat_id(update: Update) -> int:
+    """
+    :param update: сообщение или callback-запрос
+    :return: идентификатор чата, к которому относится обновление
+    """
+    if isinstance(update, CallbackQuery):
+        return update.message.chat.id
+    return update.chat.id
+
+
+class ChatQueues:
+    """
+    Очереди сообщений по чатам с ограничениями на размер.
+    Первое сообщение в очереди чата - то, которое сейчас обрабатывается
+    """
+
+    def __init__(self, chat_queue_size: int, max_pending: int) -> None:
+        """
+        :param chat_queue_size: сколько сообщений одного чата может ждать обработки
+        :param max_pending: сколько сообщений всех чатов может ждать обработки
+        """
+        self.chat_queue_size = chat_queue_size
+        self.max_pending = max_pending
+        self.pending = 0
+        self._queues: Dict[int, Deque[Update]] = {}
+
+    def push(self, message: Update) -> Optional[bool]:
+        """
+        Добавляет сообщение в очередь его чата
+
+        :param message: сообщение или callback-запрос
+        :return: `None`, если очередь заполнена; `True`, если это первое сообщение
+            в очереди и чат нужно поставить на обработку; иначе `False`
+        """
+        if self.pending >= self.max_pending:
+            return None
+        chat_id = get_chat_id(message)
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        elif len(queue) >= self.chat_queue_size:
+            return None
+        queue.append(message)
+        self.pending += 1
+        return len(queue) == 1
+
+    def head(self, chat_id: int) -> Update:
+        """
+        :return: сообщение чата, которое нужно обработать
+        """
+        return self._queues[chat_id][0]
+
+    def pop(self, chat_id: int) -> bool:
+        """
+        Убирает обработанное сообщение из очереди чата
+
+        :return: `True`, если в очереди чата остались сообщения
+        """
+        queue = self._queues[chat_id]
+        queue.popleft()
+        self.pending -= 1
+        if queue:
+            return True
+        del self._queues[chat_id]
+        return False
+
+
+class ChatScheduler:
+    """
+    Планировщик для синхронного движка: сообщения обрабатываются пулом потоков
+    """
+
+    def __init__(self, process: Callable[[Update], None],
+                 workers: int = config.BOT_WORKERS,
+                 chat_queue_size: int = config.BOT_CHAT_QUEUE_SIZE,
+                 max_pending: int = config.BOT_MAX_PENDING) -> None:
+        """
+        :param process: функция обработки одного сообщения
+        :param workers: количество потоков-обработчиков
+        :param chat_queue_size: сколько сообщений одного чата может ждать обработки
+        :param max_pending: сколько сообщений всех чатов может ждать обработки
+        """
+        self.process = process
+        self._queues = ChatQueues(chat_queue_size, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-worker')
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, message: Update) -> bool:
+        """
+        Ставит сообщение в очередь его чата
+
+        :param message: сообщение или callback-запрос
+        :return: `False`, если очередь заполнена и сообщение не принято: отправителю
+            нужно ответить, см. :func:`bot.engine.get_busy_reply`
+        """
+        with self._lock:
+            start = self._queues.push(message)
+        if start is None:
+            logging.warning('Очередь сообщений чата %s заполнена', get_chat_id(message))
+            return False
+        if start:
+            self._executor.submit(self._run, get_chat_id(message))
+        return True
+
+    def _run(self, chat_id: int) -> None:
+        with self._lock:
+            message = self._queues.head(chat_id)
+        try:
+            self.process(message)
+        except Exception:  # pylint: disable=W0703
+            logging.exception('Ошибка обработки сообщения из чата %s', chat_id)
+        with self._lock:
+            more = self._queues.pop(chat_id)
+            if not self._queues.pending:
+                self._idle.notify_all()
+        if more:
+            self._executor.submit(self._run, chat_id)
+
+    def join(self) -> None:
+        """
+        Дожидается обработки всех принятых сообщений
+        """
+        with self._lock:
+            self._idle.wait_for(lambda: not self._queues.pending)
+
+    def shutdown(self) -> None:
+        """
+        Дожидается обработки всех принятых сообщений и останавливает пул
+        """
+        self.join()
+        self._executor.shutdown(wait=True)
+
+
+class AsyncChatScheduler:
+    """
+    Планировщик для асинхронного движка: у каждого чата с сообщениями своя задача,
+    одновременно обрабатывается не больше ``workers`` сообщений
+    """
+
+    def __init__(self, process: Callable[[Update], Awaitable[None]],
+                 workers: int = config.BOT_WORKERS,
+                 chat_queue_size: int = config.BOT_CHAT_QUEUE_SIZE,
+                 max_pending: int = config.BOT_MAX_PENDING) -> None:
+        """
+        :param process: корутина обработки одного сообщения
+        :param workers: сколько сообщений обрабатывается одновременно
+        :param chat_queue_size: сколько сообщений одного чата может ждать обработки
+        :param max_pending: сколько сообщений всех чатов может ждать обработки
+        """
+        self.process = process
+        self.workers = workers
+        self._queues = ChatQueues(chat_queue_size, max_pending)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    def submit(self, message: Update) -> bool:
+        """
+        Ставит сообщение в очередь его чата. Вызывается из работающего event loop
+
+        :param message: сообщение или callback-запрос
+        :return: `False`, если очередь заполнена и сообщение не принято: отправителю
+            нужно ответить, см. :func:`bot.engine.get_busy_reply`
+        """
+        start = self._queues.push(message)
+        if start is None:
+            logging.warning('Очередь сообщений чата %s заполнена', get_chat_id(message))
+            return False
+        if start:
+            task = asyncio.ensure_future(self._run(get_chat_id(message)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, chat_id: int) -> None:
+        if self._semaphore is None:
+            # Семафор привязывается к event loop, поэтому создаётся внутри него
+            self._semaphore = asyncio.Semaphore(self.workers)
+        more = True
+        while more:
+            async with self._semaphore:
+                try:
+                    await self.process(self._queues.head(chat_id))
+                except Exception:  # pylint: disable=W0703
+                    logging.exception('Ошибка обработки сообщения из чата %s', chat_id)
+            more = self._queues.pop(chat_id)
+
+    async def join(self) -> None:
+        """
+        Дожидается обработки всех принятых сообщений
+        """
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
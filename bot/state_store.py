@@ -0,0 +1,370 @@
+"""
+Хранилище состояния диалогов с пользователями.
+
+Состояние каждого чата (:class:`BotStatus`) и сессия пользователя Eduapp
+(:class:`eduapp.sessions.EASession`) хранятся отдельно от процесса бота,
+поэтому после перезапуска пользователь продолжает диалог с того же места,
+а несколько процессов бота могут работать с одним хранилищем. Чтобы процессы
+не обрабатывали сообщения одного чата одновременно, на время обработки
+чат блокируется в хранилище (:meth:`StateStore.lock`).
+
+Обработчики следующего сообщения и состояния хранятся по имени
+(``модуль:имя``), а их параметры должны сериализоваться в JSON
+"""
+
+import asyncio
+import contextlib
+import dataclasses
+import importlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import config
+from eduapp.sessions import EASession
+
+#: Модули, из которых можно загружать обработчики по имени
+HANDLER_MODULES_PREFIX = 'bot.'
+
+
+def get_handler_path(handler) -> str:
+    """
+    Имя обработчика или класса состояния, по которому его можно найти после перезапуска
+
+    :param handler: функция, корутина или класс
+    :return: строка вида ``модуль:имя``
+    """
+    return f'{handler.__module__}:{handler.__qualname__}'
+
+
+def resolve_handler(path: str) -> Callable:
+    """
+    Находит обработчик или класс состояния по имени
+
+    :param path: строка вида ``модуль:имя``, см. :func:`get_handler_path`
+    :raise ValueError: если имя указывает не на модуль бота
+    :return: обработчик
+    """
+    module_name, _, qualname = path.partition(':')
+    if not module_name.startswith(HANDLER_MODULES_PREFIX):
+        raise ValueError(f'Обработчик {path} не из модулей бота')
+    handler = importlib.import_module(module_name)
+    for name in qualname.split('.'):
+        handler = getattr(handler, name)
+    return handler
+
+
+@dataclasses.dataclass
+class BotStatus:
+    """
+    Состояние диалога с пользователем одного чата
+    """
+
+    #: Идентификатор чата
+    chat_id: int
+
+    #: Текущее состояние бота, см. :func:`get_handler_path`
+    state: Optional[str] = None
+
+    #: Обработчик следующего сообщения пользователя, см. :func:`get_handler_path`
+    step: Optional[str] = None
+
+    #: Дополнительные параметры обработчика следующего сообщения
+    step_params: List = dataclasses.field(default_factory=list)
+
+    #: Номер страницы обсуждений, которую смотрит пользователь, начиная с 1
+    questions_page: int = 1
+
+    #: Номер открытого обсуждения в списке
+    question: Optional[int] = None
+
+    #: Идентификатор открытого обсуждения в Eduapp
+    discussion: Optional[int] = None
+
+    #: Страница реплик открытого обсуждения, начиная с 1 (с самых новых)
+    chat_page: int = 1
+
+    def register_next_step_handler(self, callback: Callable, *params) -> None:
+        """
+        Регистрирует обработчик следующего сообщения пользователя.
+        Обработчик будет вызван как ``callback(message, t_bot, status_of_bot, *params)``
+
+        :param callback: корутина из модулей бота
+        :param params: дополнительные параметры обработчика, сериализуемые в JSON
+        """
+        self.step = get_handler_path(callback)
+        self.step_params = list(params)
+
+    def clear_next_step(self) -> None:
+        """
+        Сбрасывает обработчик следующего сообщения
+        """
+        self.step = None
+        self.step_params = []
+
+    def pop_next_step(self) -> Optional[Tuple[Callable, List]]:
+        """
+        Достаёт и сбрасывает обработчик следующего сообщения
+
+        :return: пара (обработчик, параметры) или `None`, если обработчика нет
+        """
+        if self.step is None:
+            return None
+        step = resolve_handler(self.step), self.step_params
+        self.clear_next_step()
+        return step
+
+    def to_json(self) -> str:
+        """
+        :return: состояние, сериализованное в JSON
+        """
+        return json.dumps(dataclasses.asdict(self), ensure_ascii=False)
+
+    @staticmethod
+    def from_json(data: str) -> 'BotStatus':
+        """
+        :param data: состояние, сериализованное в JSON
+        :return: состояние диалога
+        """
+        return BotStatus(**json.loads(data))
+
+
+class StateStore(ABC):
+    """
+    Базовый класс хранилища состояний диалогов
+    """
+
+    #: Обращения к хранилищу блокируют поток (например, запросы к файлу базы данных)
+    blocking = False
+
+    #: Выполнять блокирующие обращения из асинхронного кода в пуле потоков event loop'а,
+    #: см. :meth:`call`. Включает :class:`bot.engine.AsyncEngine`: в нём все чаты
+    #: обрабатываются в одном потоке, и ожидание базы данных не должно его останавливать
+    offload = False
+
+    async def call(self, method: Callable, *args) -> Any:
+        """
+        Вызывает метод хранилища из асинхронного кода
+
+        :param method: метод хранилища, например :meth:`load`
+        :param args: параметры метода
+        :return: результат метода
+        """
+        if self.offload and self.blocking:
+            return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+        return method(*args)
+
+    def load(self, chat_id: int) -> BotStatus:
+        """
+        Загружает состояние диалога чата
+
+        :param chat_id: идентификатор чата
+        :return: сохранённое состояние или новое, если чат ещё не писал боту
+        """
+        data = self._load(chat_id)
+        if data is None:
+            return BotStatus(chat_id)
+        try:
+            return BotStatus.from_json(data)
+        except (TypeError, ValueError):
+            logging.warning('Не удалось прочитать состояние чата %s', chat_id)
+            return BotStatus(chat_id)
+
+    def save(self, status: BotStatus) -> None:
+        """
+        Сохраняет состояние диалога
+
+        :param status: состояние диалога
+        """
+        self._save(status.chat_id, status.to_json())
+
+    def load_session(self, chat_id: int) -> Optional[EASession]:
+        """
+        Загружает сессию Eduapp пользователя чата
+
+        :param chat_id: идентификатор чата
+        :return: сохранённая сессия или `None`, если пользователь не авторизовался
+        """
+        data = self._load_session(chat_id)
+        if data is None:
+            return None
+        try:
+            return EASession.from_json(data)
+        except (TypeError, ValueError):
+            logging.warning('Не удалось прочитать сессию чата %s', chat_id)
+            return None
+
+    def save_session(self, session: EASession) -> None:
+        """
+        Сохраняет сессию Eduapp пользователя
+
+        :param session: сессия пользователя
+        """
+        self._save_session(session.chat_id, session.to_json())
+
+    @contextlib.asynccontextmanager
+    async def lock(self, chat_id: int) -> AsyncIterator[None]:
+        """
+        Блокирует чат на время обработки сообщения: пока блок ``async with`` не завершится,
+        другие процессы и потоки ждут. Блокировка, которую не сняли за
+        :data:`config.BOT_CHAT_LOCK_TTL` секунд (например, процесс упал), снимается сама
+
+        :param chat_id: идентификатор чата
+        """
+        owner = uuid.uuid4().hex
+        while not await self.call(self._acquire, chat_id, owner,
+                                  time.time() + config.BOT_CHAT_LOCK_TTL):
+            await asyncio.sleep(config.BOT_CHAT_LOCK_RETRY)
+        try:
+            yield
+        finally:
+            await self.call(self._release, chat_id, owner)
+
+    @abstractmethod
+    def _load(self, chat_id: int) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def _save(self, chat_id: int, data: str) -> None:
+        pass
+
+    @abstractmethod
+    def _load_session(self, chat_id: int) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def _save_session(self, chat_id: int, data: str) -> None:
+        pass
+
+    @abstractmethod
+    def _acquire(self, chat_id: int, owner: str, expires_at: float) -> bool:
+        pass
+
+    @abstractmethod
+    def _release(self, chat_id: int, owner: str) -> None:
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """
+    Хранилище в памяти процесса. Состояния теряются при перезапуске
+    """
+
+    def __init__(self) -> None:
+        self._states: Dict[int, str] = {}
+        self._sessions: Dict[int, str] = {}
+        self._locks: Dict[int, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, chat_id: int) -> Optional[str]:
+        return self._states.get(chat_id)
+
+    def _save(self, chat_id: int, data: str) -> None:
+        self._states[chat_id] = data
+
+    def _load_session(self, chat_id: int) -> Optional[str]:
+        return self._sessions.get(chat_id)
+
+    def _save_session(self, chat_id: int, data: str) -> None:
+        self._sessions[chat_id] = data
+
+    def _acquire(self, chat_id: int, owner: str, expires_at: float) -> bool:
+        with self._lock:
+            current = self._locks.get(chat_id)
+            if current is not None and current[1] > time.time():
+                return False
+            self._locks[chat_id] = (owner, expires_at)
+            return True
+
+    def _release(self, chat_id: int, owner: str) -> None:
+        with self._lock:
+            if self._locks.get(chat_id, (None,))[0] == owner:
+                del self._locks[chat_id]
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Хранилище в файле SQLite. Им могут одновременно пользоваться несколько процессов бота.
+    Сессии Eduapp хранятся без паролей, см. :meth:`eduapp.sessions.EASession.to_json`
+    """
+
+    blocking = True
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: путь к файлу базы данных
+        """
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS chat_states '
+                               '(chat_id INTEGER PRIMARY KEY, status TEXT NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS chat_sessions '
+                               '(chat_id INTEGER PRIMARY KEY, session TEXT NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS chat_locks '
+                               '(chat_id INTEGER PRIMARY KEY, owner TEXT NOT NULL, '
+                               'expires_at REAL NOT NULL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # Соединение SQLite нельзя использовать из разных потоков
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def _load(self, chat_id: int) -> Optional[str]:
+        row = self._connection().execute('SELECT status FROM chat_states WHERE chat_id = ?',
+                                         (chat_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def _save(self, chat_id: int, data: str) -> None:
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO chat_states (chat_id, status) VALUES (?, ?)',
+                               (chat_id, data))
+
+    def _load_session(self, chat_id: int) -> Optional[str]:
+        row = self._connection().execute('SELECT session FROM chat_sessions WHERE chat_id = ?',
+                                         (chat_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def _save_session(self, chat_id: int, data: str) -> None:
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO chat_sessions (chat_id, session) '
+                               'VALUES (?, ?)', (chat_id, data))
+
+    def _acquire(self, chat_id: int, owner: str, expires_at: float) -> bool:
+        # Удаление просроченной блокировки и вставка новой выполняются в одной транзакции
+        with self._connection() as connection:
+            connection.execute('DELETE FROM chat_locks WHERE chat_id = ? AND expires_at <= ?',
+                               (chat_id, time.time()))
+            cursor = connection.execute('INSERT OR IGNORE INTO chat_locks '
+                                        '(chat_id, owner, expires_at) VALUES (?, ?, ?)',
+                                        (chat_id, owner, expires_at))
+            return cursor.rowcount == 1
+
+    def _release(self, chat_id: int, owner: str) -> None:
+        with self._connection() as connection:
+            connection.execute('DELETE FROM chat_locks WHERE chat_id = ? AND owner = ?',
+                               (chat_id, owner))
+
+
+def create_state_store(url: str) -> StateStore:
+    """
+    Создаёт хранилище по его адресу
+
+    :param url: ``memory`` - хранилище в памяти, ``sqlite:///путь/к/файлу.db`` - в файле SQLite
+    :raise ValueError: если адрес не распознан
+    :return: хранилище состояний
+    """
+    if url == 'memory':
+        return MemoryStateStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStateStore(url[len('sqlite:///'):])
+    raise ValueError(f'Неизвестное хранилище состояний: {url}')
@@ -0,0 +1,224 @@
+"""
+Приём обновлений телеграма через вебхук.
+
+Телеграм присылает обновления POST-запросами на встроенный HTTP-сервер. Сервер проверяет
+секретный токен, отвечает сразу и передаёт сообщения планировщику (:mod:`bot.scheduler`).
+Когда очередь планировщика заполнена, сервер отвечает 503 - телеграм повторит обновление позже.
+
+Проверить локально можно, отправив записанное обновление::
+
+    curl -X POST -H 'X-Telegram-Bot-Api-Secret-Token: secret' \\
+        -d @update.json http://localhost:8443/webhook
+"""
+
+import dataclasses
+import hmac
+import json
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Union
+
+import telebot
+from aiohttp import web
+from telebot.types import CallbackQuery, Message, Update
+
+import config
+from bot.scheduler import AsyncChatScheduler, ChatScheduler
+
+#: Заголовок, в котором телеграм передаёт секретный токен вебхука
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+@dataclasses.dataclass
+class WebhookSettings:
+    """
+    Настройки вебхука
+    """
+
+    #: Адрес и порт, на которых слушает HTTP-сервер
+    host: str = '0.0.0.0'
+    port: int = 8443
+
+    #: Путь, на который телеграм присылает обновления
+    path: str = '/webhook'
+
+    #: Секретный токен. Запросы без него отклоняются, без токена вебхук не запускается
+    secret: str = ''
+
+    #: Публичный адрес вебхука. Если указан - бот сам зарегистрирует его в телеграме
+    url: str = ''
+
+    @staticmethod
+    def from_env() -> 'WebhookSettings':
+        """
+        Читает настройки из переменных окружения ``WEBHOOK_*``
+
+        :raise ValueError: если не задан секретный токен ``WEBHOOK_SECRET``
+        """
+        settings = WebhookSettings(
+            host=os.environ.get('WEBHOOK_HOST', '0.0.0.0'),
+            port=int(os.environ.get('WEBHOOK_PORT', '8443')),
+            path=os.environ.get('WEBHOOK_PATH', '/webhook'),
+            secret=os.environ.get('WEBHOOK_SECRET', ''),
+            url=os.environ.get('WEBHOOK_URL', ''),
+        )
+        settings.check()
+        return settings
+
+    def check(self) -> None:
+        """
+        Проверяет, что вебхук можно запускать: без секретного токена любой, кто знает адрес сервера,
+        мог бы присылать боту поддельные обновления от имени любого чата
+
+        :raise ValueError: если не задан секретный токен
+        """
+        if not self.secret:
+            raise ValueError('Для вебхука нужно задать секретный токен в переменной WEBHOOK_SECRET')
+
+
+def register_webhook(token: str, settings: WebhookSettings) -> None:
+    """
+    Регистрирует вебхук в телеграме, если указан его публичный адрес.
+    pyTelegramBotAPI 4.4 не умеет передавать ``secret_token``, поэтому запрос отправляется напрямую
+
+    :param token: токен телеграм-бота
+    :param settings: настройки вебхука
+    """
+    if not settings.url:
+        return
+    # pylint: disable=W0212
+    telebot.apihelper._make_request(token, 'setWebhook', method='post', params={
+        'url': settings.url,
+        'secret_token': settings.secret,
+        'max_connections': config.BOT_WORKERS,
+    })
+    logging.info('Вебхук зарегистрирован: %s', settings.url)
+
+
+def is_authorized(headers, settings: WebhookSettings) -> bool:
+    """
+    Проверяет секретный токен запроса
+
+    :param headers: заголовки запроса
+    :param settings: настройки вебхука
+    :return: `True`, если токен задан и совпал
+    """
+    if not settings.secret:
+        return False
+    return hmac.compare_digest(headers.get(SECRET_HEADER, '').encode(), settings.secret.encode())
+
+
+def parse_update(body: bytes) -> Optional[Union[Message, CallbackQuery]]:
+    """
+    Достаёт сообщение или callback-запрос из обновления телеграма
+
+    :param body: тело запроса
+    :raise ValueError: если тело - не обновление телеграма
+    :return: сообщение, callback-запрос или `None`, если в обновлении их нет
+    """
+    try:
+        update = Update.de_json(json.loads(body))
+    except (KeyError, TypeError) as ex:
+        raise ValueError('Некорректное обновление') from ex
+    if update is None:
+        raise ValueError('Пустое обновление')
+    return update.message or update.callback_query
+
+
+class WebhookServer:
+    """
+    Вебхук для синхронного движка: многопоточный HTTP-сервер, передающий сообщения планировщику
+    """
+
+    def __init__(self, scheduler: ChatScheduler, settings: WebhookSettings) -> None:
+        """
+        :param scheduler: планировщик, обрабатывающий сообщения
+        :param settings: настройки вебхука
+        :raise ValueError: если не задан секретный токен
+        """
+        settings.check()
+        self.scheduler = scheduler
+        self.settings = settings
+        self.httpd = ThreadingHTTPServer((settings.host, settings.port), self._make_handler())
+
+    @property
+    def port(self) -> int:
+        """
+        Порт, на котором слушает сервер (полезно, если указан порт 0)
+        """
+        return self.httpd.server_address[1]
+
+    def _make_handler(self):
+        server = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):  # pylint: disable=C0103
+                if self.path != server.settings.path:
+                    self._reply(404)
+                    return
+                if not is_authorized(self.headers, server.settings):
+                    self._reply(403)
+                    return
+                try:
+                    message = parse_update(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                except ValueError:
+                    self._reply(400)
+                    return
+                if message is not None and not server.scheduler.submit(message):
+                    self._reply(503)
+                    return
+                self._reply(200)
+
+            def _reply(self, status: int) -> None:
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):  # pylint: disable=W0622
+                logging.debug('Вебхук: ' + format, *args)
+
+        return WebhookHandler
+
+    def serve_forever(self) -> None:
+        """
+        Принимает обновления, пока сервер не остановят
+        """
+        logging.info('Вебхук слушает %s:%s%s', self.settings.host, self.port, self.settings.path)
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        """
+        Останавливает сервер и дожидается обработки принятых сообщений
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.scheduler.shutdown()
+
+
+def create_webhook_app(scheduler: AsyncChatScheduler, settings: WebhookSettings) -> web.Application:
+    """
+    Вебхук для асинхронного движка: приложение aiohttp, передающее сообщения
+    планировщику в том же event loop
+
+    :param scheduler: планировщик, обрабатывающий сообщения
+    :param settings: настройки вебхука
+    :raise ValueError: если не задан секретный токен
+    :return: приложение aiohttp
+    """
+    settings.check()
+
+    async def handle(request: web.Request) -> web.Response:
+        if not is_authorized(request.headers, settings):
+            return web.Response(status=403)
+        try:
+            message = parse_update(await request.read())
+        except ValueError:
+            return web.Response(status=400)
+        if message is not None and not scheduler.submit(message):
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(settings.path, handle)
+    return app
@@ -1,5 +1,91 @@
-EDUAPP_BASE_URL = 'https://my.informatics.ru'
+import os
+import tempfile
+
+# Адрес сервера Eduapp. Переменная окружения нужна, чтобы направить бота
+# на локальную замену сервера, см. loadtest.mock_eduapp
+EDUAPP_BASE_URL = os.environ.get('EDUAPP_BASE_URL', 'https://my.informatics.ru')
 EDUAPP_API_URL = EDUAPP_BASE_URL + '/api/v1'
-EDUAPP_JWT = 'DEFINE ME'
-USER_LOGIN = 'testovyy_up1'
-USER_PASSWORD = 'test1234'
+
+# Настройки HTTP-клиента Eduapp
+EDUAPP_POOL_SIZE = 10
+EDUAPP_CONNECT_TIMEOUT = 3.05
+EDUAPP_READ_TIMEOUT = 15
+EDUAPP_RETRIES = 3
+EDUAPP_RETRY_BACKOFF = 0.3
+EDUAPP_DEFAULT_HEADERS = {
+    'referer': EDUAPP_BASE_URL + '/pupil/root/',
+}
+EDUAPP_DEFAULT_COOKIES = {}
+EDUAPP_PAGE_WORKERS = 8
+EDUAPP_CALENDAR_PAGE_SIZE = 100
+
+# Кэш HTTP-ответов. Каталог для хранения ответов на диске, None - только в памяти
+EDUAPP_HTTP_CACHE_BYTES = 32 * 1024 * 1024
+EDUAPP_HTTP_CACHE_DIR = None
+
+# Сессии пользователей
+EDUAPP_SESSIONS_MAX_SIZE = 10000
+EDUAPP_SESSION_TTL = 24 * 60 * 60
+EDUAPP_ACCOUNT_TTL = 60 * 60
+
+# Фоновое обновление токенов
+EDUAPP_TOKEN_REFRESH_MARGIN = 10 * 60
+EDUAPP_TOKEN_REFRESH_INTERVAL = 60
+EDUAPP_TOKEN_REFRESH_RETRY = 15 * 60
+
+# Кэш календаря
+EDUAPP_CALENDAR_CACHE_SIZE = 30000
+EDUAPP_CALENDAR_TTL = 5 * 60
+EDUAPP_CALENDAR_PAST_TTL = 7 * 24 * 60 * 60
+EDUAPP_CALENDAR_PREFETCH_WORKERS = 4
+
+# Обсуждения
+EDUAPP_QUESTIONS_PAGE_SIZE = 5
+EDUAPP_QUESTIONS_CACHE_SIZE = 10000
+EDUAPP_QUESTIONS_TTL = 60
+
+# Отслеживание новых ответов в обсуждениях
+EDUAPP_DISCUSSIONS_SYNC_PAGE_SIZE = 20
+EDUAPP_DISCUSSIONS_SYNC_SIZE = 10000
+
+# Метки времени
+EDUAPP_TIMESTAMPS_CACHE_SIZE = 50000
+
+# Обработка сообщений
+BOT_WORKERS = 16
+BOT_CHAT_QUEUE_SIZE = 10
+BOT_MAX_PENDING = 256
+
+# Блокировка чата в хранилище состояний на время обработки сообщения
+BOT_CHAT_LOCK_TTL = 5 * 60
+BOT_CHAT_LOCK_RETRY = 0.05
+
+# Отправка сообщений
+TELEGRAM_MESSAGE_LIMIT = 4096
+BOT_SEND_RATE = 30
+BOT_SEND_BURST = 30
+BOT_CHAT_SEND_RATE = 1
+BOT_CHAT_SEND_BURST = 3
+BOT_SEND_MAX_CHATS = 10000
+BOT_SEND_RETRIES = 3
+
+# Напоминания о занятиях
+BOT_REMINDER_LEAD = 15 * 60
+BOT_REMINDER_HORIZON = 24 * 60 * 60
+BOT_REMINDER_REFRESH_INTERVAL = 30 * 60
+BOT_REMINDER_REFRESH_BATCH = 20
+BOT_REMINDER_REFRESH_PAUSE = 5
+BOT_REMINDER_MAX_PENDING = 100000
+
+# Уведомления об ответах преподавателей
+BOT_REPLIES_POLL_INTERVAL = 5 * 60
+BOT_REPLIES_POLL_BATCH = 20
+BOT_REPLIES_POLL_PAUSE = 5
+
+# Шаблоны сообщений
+UI_TEMPLATES_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'eduapp-bot-templates')
+UI_RENDER_CACHE_BYTES = 16 * 1024 * 1024
+
+# Метрики. Границы интервалов гистограмм длительностей, в секундах
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BOT_METRICS_LOG_INTERVAL = 5 * 60
@@ -0,0 +1,148 @@
+"""
+Данные аккаунта пользователя Eduapp
+"""
+
+import dataclasses
+import logging
+from typing import Optional
+
+import requests
+
+import config
+from eduapp.cache import TTLCache
+from eduapp.client import ea_client
+from eduapp.exceptions import EAServerError, TokenRejectedError
+from eduapp.metrics import metrics
+from eduapp.sessions import EASession
+from eduapp.urls import EAUrls
+
+
+@dataclasses.dataclass
+class EAAccount:
+    """
+    Запись аккаунта пользователя, полученная с ``/account/``
+    """
+
+    # pylint: disable=C0103
+    # Имя поля совпадает с именем в API
+
+    #: Идентификатор пользователя в Eduapp
+    id: int
+    first_name: str
+    last_name: str
+    patronymic: str
+    phone: str
+    email: str
+
+    #: Часовой пояс пользователя, например ``Europe/Moscow``
+    timezone: str
+
+    @property
+    def full_name(self) -> str:
+        """
+        Фамилия и имя пользователя
+        """
+        return f'{self.last_name} {self.first_name}'
+
+    @staticmethod
+    def from_json(jsn: dict) -> 'EAAccount':
+        """
+        Создаёт запись аккаунта из ответа сервера
+
+        :param jsn: тело ответа ``/account/``
+        :return: запись аккаунта
+        """
+        return EAAccount(
+            id=jsn['id'],
+            first_name=jsn['first_name'],
+            last_name=jsn['last_name'],
+            patronymic=jsn['patronymic'],
+            phone=jsn['contact_number'],
+            email=jsn['email'],
+            timezone=jsn['timezone'],
+        )
+
+
+#: Кэш аккаунтов по идентификатору чата
+account_cache = TTLCache(max_size=config.EDUAPP_SESSIONS_MAX_SIZE, ttl=config.EDUAPP_ACCOUNT_TTL)
+metrics.add_cache('account', account_cache)
+
+
+def fetch_account(token: str) -> Optional[EAAccount]:
+    """
+    Запрашивает данные аккаунта с сервера
+
+    :param token: токен jwt-авторизации
+    :return: запись аккаунта или `None`, если токен не подошёл
+    """
+    logging.debug('Отправляем запрос на получение даных пользователя. URL: %s',
+                  EAUrls.ACCOUNT_URL)
+    return get_account_from_response(ea_client.get(EAUrls.ACCOUNT_URL, token=token))
+
+
+def get_account_from_response(response) -> Optional[EAAccount]:
+    """
+    Достаёт запись аккаунта из ответа ``/account/``
+
+    :param response: ответ сервера
+    :return: запись аккаунта или `None`, если токен не подошёл
+    """
+    # pylint: disable=E1101
+    if response.status_code != requests.codes.ok:
+        logging.info('Ошибка получения данных аккаунта. Status_code: %i', response.status_code)
+        return None
+    return EAAccount.from_json(response.json())
+
+
+def parse_account_response(response) -> EAAccount:
+    """
+    Достаёт запись аккаунта из ответа ``/account/`` на запрос с токеном сессии
+
+    :param response: ответ сервера
+    :raise TokenRejectedError: если сервер ответил 401 или 403
+    :raise EAServerError: если сервер ответил другой ошибкой
+    :return: запись аккаунта
+    """
+    # pylint: disable=E1101
+    if response.status_code in (requests.codes.unauthorized, requests.codes.forbidden):
+        raise TokenRejectedError()
+    if response.status_code != requests.codes.ok:
+        logging.info('Ошибка получения данных аккаунта. Status_code: %i', response.status_code)
+        raise EAServerError()
+    return EAAccount.from_json(response.json())
+
+
+def remember_account(chat_id: int, account: EAAccount) -> None:
+    """
+    Кладёт запись аккаунта в кэш. Вызывается сразу после авторизации
+
+    :param chat_id: идентификатор чата
+    :param account: запись аккаунта
+    """
+    account_cache.put(chat_id, account)
+
+
+def invalidate_account(chat_id: int) -> None:
+    """
+    Сбрасывает закэшированную запись аккаунта,
+    при следующем обращении она будет запрошена заново
+
+    :param chat_id: идентификатор чата
+    """
+    account_cache.invalidate(chat_id)
+
+
+def get_account(session: EASession) -> EAAccount:
+    """
+    Возвращает запись аккаунта пользователя: из кэша или, если её там нет, с сервера
+
+    :param session: сессия пользователя
+    :raise TokenRejectedError: если сервер не принял токен сессии
+    :raise EAServerError: если сервер ответил другой ошибкой
+    :return: запись аккаунта
+    """
+    account = account_cache.get(session.chat_id)
+    if account is None:
+        account = parse_account_response(ea_client.get(EAUrls.ACCOUNT_URL, token=session.token))
+        remember_account(session.chat_id, account)
+    return account
@@ -0,0 +1,225 @@
+"""
+Асинхронные версии функций для работы с API Eduapp.
+
+Функции называются так же, как синхронные из :mod:`eduapp.main`, :mod:`eduapp.calendar`
+и :mod:`eduapp.questions`, и пользуются теми же кэшами и функциями разбора ответов
+"""
+
+import asyncio
+import itertools
+import logging
+from typing import Iterable, Optional
+
+import config
+from eduapp.account import EAAccount, account_cache, get_account_from_response, \
+    parse_account_response, remember_account
+from eduapp.async_client import EAResponse, async_ea_client
+from eduapp.calendar import claim_prefetch, get_month_bounds, get_shifted_month, \
+    calendar_cache, release_prefetch, shift_month, store_month
+from eduapp.exceptions import CaptchaEnabledError, EAConnectionError, EAError, \
+    InvalidPasswordError, LoginRequiredError, UnknownError
+from eduapp.main import Authenticator, EaAuthStatus, calendar_lessons_to_good_json, \
+    check_server_response, get_page_results, get_profile_from_account, get_remaining_pages, \
+    refresh_session, save_session
+from eduapp.questions import EaQuestionResponseStatus, get_discussion_urls, \
+    parse_open_question_responses, parse_question_page_response, pick_question, \
+    question_page_cache
+from eduapp.sessions import EASession
+from eduapp.urls import EAUrls
+
+# Ссылки на фоновые задачи, чтобы их не удалил сборщик мусора
+_background_tasks = set()
+
+
+async def login(username: str, password: str) -> EaAuthStatus:
+    """
+    Авторизация в Eduapp. См. :func:`eduapp.main.login`
+
+    :param username: Имя пользователя
+    :param password: Пароль пользователя
+    :return: статус авторизации
+    """
+    auth = Authenticator(username, password, None)
+    try:
+        response = await async_ea_client.post(EAUrls.LOGIN_URL, data=auth.get_login_form())
+        auth.parse_status_code(response)
+        auth.set_account(await fetch_account(auth.token))
+    except (InvalidPasswordError, CaptchaEnabledError, UnknownError, EAConnectionError) as ex:
+        return EaAuthStatus(success=False, error=str(ex))
+    return EaAuthStatus(success=True, username=auth.user, token=auth.token, account=auth.account)
+
+
+async def open_session(chat_id: int, username: str, password: str) -> EaAuthStatus:
+    """
+    См. :func:`eduapp.main.open_session`
+    """
+    status = await login(username, password)
+    save_session(chat_id, username, password, status)
+    return status
+
+
+async def relogin(session: EASession) -> EaAuthStatus:
+    """
+    См. :func:`eduapp.main.relogin`
+    """
+    if session.password is None:
+        return EaAuthStatus(success=False, error=LoginRequiredError.message)
+    status = await login(session.login, session.password)
+    refresh_session(session, status)
+    return status
+
+
+async def fetch_account(token: str) -> Optional[EAAccount]:
+    """
+    См. :func:`eduapp.account.fetch_account`
+    """
+    return get_account_from_response(await async_ea_client.get(EAUrls.ACCOUNT_URL, token=token))
+
+
+async def get_account(session: EASession) -> EAAccount:
+    """
+    См. :func:`eduapp.account.get_account`
+    """
+    account = account_cache.get(session.chat_id)
+    if account is None:
+        response = await async_ea_client.get(EAUrls.ACCOUNT_URL, token=session.token)
+        account = parse_account_response(response)
+        remember_account(session.chat_id, account)
+    return account
+
+
+async def get_profile_data(session: EASession):
+    """
+    См. :func:`eduapp.main.get_profile_data`
+    """
+    return get_profile_from_account(await get_account(session))
+
+
+async def get_calendar_data_from_website(session: EASession, start, end, page=1) -> EAResponse:
+    """
+    См. :func:`eduapp.main.get_calendar_data_from_website`
+    """
+    url = EAUrls.get_calendar_data_url(start, end, str(session.user_id), page)
+    return await async_ea_client.get(url, token=session.token)
+
+
+async def get_calendar_lessons(session: EASession, start, end,
+                               first_page: EAResponse) -> Iterable[dict]:
+    """
+    Загружает занятия со всех страниц календаря. Если сервер сообщил общее количество
+    занятий, оставшиеся страницы запрашиваются одновременно.
+    См. :func:`eduapp.main.iter_calendar_lessons`
+
+    :return: занятия в порядке страниц
+    """
+    jsn = first_page.json()
+    pages = [jsn['results']]
+    if jsn.get('count') is not None:
+        responses = await asyncio.gather(*(
+            get_calendar_data_from_website(session, start, end, page)
+            for page in get_remaining_pages(jsn)
+        ))
+        pages.extend(get_page_results(response) for response in responses)
+    else:
+        next_url = jsn.get('next')
+        while next_url:
+            response = await async_ea_client.get(next_url, token=session.token)
+            pages.append(get_page_results(response))
+            next_url = response.json().get('next')
+    return itertools.chain.from_iterable(pages)
+
+
+async def _load_calendar(session: EASession, start, end) -> dict:
+    response = await get_calendar_data_from_website(session, start, end)
+    check_server_response(response)
+    return calendar_lessons_to_good_json(await get_calendar_lessons(session, start, end, response),
+                                         session.timezone)
+
+
+async def get_calendar_data(session: EASession, start, end):
+    """
+    Календарь за произвольный период. См. :func:`eduapp.main.get_calendar_data`
+    """
+    return await _load_calendar(session, start, end)
+
+
+async def load_month(session: EASession, year: int, month: int) -> dict:
+    """
+    См. :func:`eduapp.calendar.load_month`
+    """
+    data = await _load_calendar(session, *get_month_bounds(year, month))
+    store_month(session, year, month, data)
+    return data
+
+
+async def _prefetch(session: EASession, year: int, month: int) -> None:
+    try:
+        await load_month(session, year, month)
+    except EAError:
+        logging.info('Не удалось заранее загрузить календарь за %i.%i', month, year)
+    except Exception:  # pylint: disable=W0703
+        # Исключение фоновой задачи иначе никто бы не увидел
+        logging.exception('Ошибка фоновой загрузки календаря за %i.%i', month, year)
+    finally:
+        release_prefetch(session, year, month)
+
+
+def prefetch_month(session: EASession, year: int, month: int) -> None:
+    """
+    См. :func:`eduapp.calendar.prefetch_month`
+    """
+    if claim_prefetch(session, year, month):
+        task = asyncio.ensure_future(_prefetch(session, year, month))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+async def get_month_calendar_data(session: EASession, month: int = 0) -> dict:
+    """
+    См. :func:`eduapp.calendar.get_month_calendar_data`
+    """
+    year, month = get_shifted_month(month)
+    data = calendar_cache.get((session.user_id, year, month))
+    if data is None:
+        data = await load_month(session, year, month)
+    for delta in (-1, 1):
+        prefetch_month(session, *shift_month(year, month, delta))
+    return data
+
+
+async def get_question_page_json(session: EASession, page=1) -> EaQuestionResponseStatus:
+    """
+    См. :func:`eduapp.questions.get_question_page_json`
+    """
+    key = (session.user_id, page)
+    data = question_page_cache.get(key)
+    if data is not None:
+        return EaQuestionResponseStatus(success=True, data=data)
+    page_size = config.EDUAPP_QUESTIONS_PAGE_SIZE
+    url = EAUrls.get_question_page_url((page - 1) * page_size, page_size)
+    try:
+        response = await async_ea_client.get(url, token=session.token)
+    except EAConnectionError as ex:
+        return EaQuestionResponseStatus(False, {}, str(ex))
+    status = parse_question_page_response(response, page, session.timezone)
+    if status.success:
+        question_page_cache.put(key, status.data)
+    return status
+
+
+async def open_question(session: EASession, number: int) -> EaQuestionResponseStatus:
+    """
+    См. :func:`eduapp.questions.open_question`
+    """
+    page, index = divmod(number - 1, config.EDUAPP_QUESTIONS_PAGE_SIZE)
+    status = pick_question(await get_question_page_json(session, page + 1), index)
+    if not status.success:
+        return status
+    try:
+        urls = get_discussion_urls(status.data)
+        discussion, comments = await asyncio.gather(*(
+            async_ea_client.get(url, token=session.token) for url in urls
+        ))
+    except EAConnectionError as ex:
+        return EaQuestionResponseStatus(False, {}, str(ex))
+    return parse_open_question_responses(discussion, comments, status.data, session.timezone)
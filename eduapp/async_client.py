@@ -0,0 +1,168 @@
+"""
+Асинхронный HTTP-клиент для работы с API Eduapp
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Optional
+
+import aiohttp
+from multidict import CIMultiDict
+
+import config
+from eduapp.client import EAClient, record_request
+from eduapp.exceptions import EAConnectionError
+from eduapp.http_cache import CachedResponse, ResponseCache, response_cache
+
+
+class EAResponse:
+    """
+    Полностью прочитанный ответ сервера.
+
+    Повторяет ту часть интерфейса :class:`requests.Response`, которой пользуются
+    функции разбора ответов, поэтому их можно использовать с обоими клиентами
+    """
+
+    def __init__(self, status_code: int, url: str, content: bytes, headers) -> None:
+        """
+        :param status_code: код ответа
+        :param url: адрес запроса
+        :param content: тело ответа
+        :param headers: заголовки ответа
+        """
+        self.status_code = status_code
+        self.url = url
+        self.content = content
+        self.headers = headers
+        self._json: Any = None
+
+    def json(self) -> Any:
+        """
+        Разбирает тело ответа как JSON. Разбор выполняется один раз
+
+        :return: разобранное тело ответа
+        """
+        if self._json is None:
+            self._json = json.loads(self.content)
+        return self._json
+
+
+def get_cached_response(url: str, entry: CachedResponse) -> EAResponse:
+    """
+    См. :func:`eduapp.client.get_cached_response`
+    """
+    return EAResponse(200, url, entry.content, CIMultiDict(entry.headers))
+
+
+class AsyncEAClient:
+    """
+    Асинхронный клиент API Eduapp.
+
+    Работает поверх одного :class:`aiohttp.ClientSession` с ограниченным пулом соединений.
+    Настройки таймаутов, повторов и кэша ответов те же, что и у :class:`eduapp.client.EAClient`
+    """
+
+    def __init__(self, pool_size: int = config.EDUAPP_POOL_SIZE,
+                 connect_timeout: float = config.EDUAPP_CONNECT_TIMEOUT,
+                 read_timeout: float = config.EDUAPP_READ_TIMEOUT,
+                 retries: int = config.EDUAPP_RETRIES,
+                 backoff_factor: float = config.EDUAPP_RETRY_BACKOFF,
+                 cache: Optional[ResponseCache] = None) -> None:
+        """
+        :param pool_size: максимальное количество одновременно открытых соединений с сервером
+        :param connect_timeout: таймаут на установку соединения, в секундах
+        :param read_timeout: таймаут на чтение ответа, в секундах
+        :param retries: сколько раз повторять неудачный GET-запрос
+        :param backoff_factor: множитель экспоненциальной задержки между повторами
+        :param cache: кэш ответов на GET-запросы. `None` - не кэшировать
+        """
+        self.pool_size = pool_size
+        self.cache = cache
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.default_cookies = dict(config.EDUAPP_DEFAULT_COOKIES)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессию можно создать только внутри работающего event loop,
+        # поэтому она создаётся при первом запросе
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+                headers=config.EDUAPP_DEFAULT_HEADERS,
+                # Сессия общая для всех пользователей, куки сервера в ней не сохраняем
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._session
+
+    async def request(self, method: str, url: str, token: Optional[str] = None,
+                      **kwargs) -> EAResponse:
+        """
+        Выполняет запрос к серверу Eduapp через общий пул соединений
+
+        :param method: HTTP-метод
+        :param url: адрес запроса
+        :param token: токен jwt-авторизации. Если указан - передаётся в куке ``eduapp_jwt``
+        :param kwargs: остальные параметры :meth:`aiohttp.ClientSession.request`
+        :raise EAConnectionError: если сервер не ответил за отведённое время
+        :return: прочитанный ответ сервера
+        """
+        cookies = dict(self.default_cookies)
+        cookies.update(kwargs.pop('cookies', None) or {})
+        if token:
+            cookies['eduapp_jwt'] = token
+        attempts = self.retries + 1 if method == 'GET' else 1
+        started = time.perf_counter()
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                async with self._get_session().request(method, url, cookies=cookies,
+                                                       **kwargs) as response:
+                    content = await response.read()
+                if response.status not in EAClient.RETRY_STATUS_CODES or last_attempt:
+                    record_request(method, url, response.status, started)
+                    return EAResponse(response.status, str(response.url), content,
+                                      response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                logging.warning('Ошибка запроса к Eduapp. URL: %s, ошибка: %r', url, ex)
+                if last_attempt:
+                    record_request(method, url, 'error', started)
+                    raise EAConnectionError() from ex
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+        record_request(method, url, 'error', started)
+        raise EAConnectionError()
+
+    async def get(self, url: str, token: Optional[str] = None, **kwargs) -> EAResponse:
+        """
+        GET-запрос к серверу Eduapp через кэш ответов. См. :meth:`request`
+        """
+        if self.cache is None:
+            return await self.request('GET', url, token, **kwargs)
+        entry, kwargs['headers'] = self.cache.prepare_request(url, token, kwargs.get('headers'))
+        if kwargs['headers'] is None:
+            return get_cached_response(url, entry)
+        response = await self.request('GET', url, token, **kwargs)
+        entry = self.cache.process_response(url, token, entry, response.status_code,
+                                            response.content, response.headers)
+        return response if entry is None else get_cached_response(url, entry)
+
+    async def post(self, url: str, token: Optional[str] = None, **kwargs) -> EAResponse:
+        """
+        POST-запрос к серверу Eduapp. См. :meth:`request`
+        """
+        return await self.request('POST', url, token, **kwargs)
+
+    async def close(self) -> None:
+        """
+        Закрывает все соединения пула
+        """
+        if self._session is not None:
+            await self._session.close()
+
+
+#: Общий для асинхронного движка клиент Eduapp
+async_ea_client = AsyncEAClient(cache=response_cache)
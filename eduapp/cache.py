@@ -0,0 +1,120 @@
+"""
+Кэши данных, полученных из Eduapp
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш с ограниченным временем жизни записей.
+
+    Размер кэша ограничен: при переполнении удаляется запись,
+    к которой дольше всех не обращались.
+
+    Можно подписаться на удаление записей (см. :meth:`add_listener`), например, чтобы сбросить
+    данные, посчитанные из записи, когда её заменили или она устарела
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        """
+        :param max_size: максимальное количество записей
+        :param ttl: время жизни записи по умолчанию, в секундах
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Hashable, Any], None]] = []
+
+    def add_listener(self, listener: Callable[[Hashable, Any], None]) -> None:
+        """
+        Подписывает на удаление записей: замену, устаревание, вытеснение и :meth:`invalidate`.
+        Слушатель вызывается вне блокировки кэша
+
+        :param listener: функция, которая получает ключ и значение удалённой записи
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, removed: List[Tuple[Hashable, Any]]) -> None:
+        for key, value in removed:
+            for listener in self._listeners:
+                listener(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Возвращает значение из кэша
+
+        :param key: ключ записи
+        :param default: что вернуть, если записи нет или она устарела
+        :return: сохранённое значение или `default`
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+        if item is not None:
+            self._notify([(key, item[1])])
+        return default
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Сохраняет значение в кэш
+
+        :param key: ключ записи
+        :param value: значение
+        :param ttl: время жизни записи, в секундах. Если не указано - берётся общее для кэша
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        removed = []
+        with self._lock:
+            old = self._data.get(key)
+            if old is not None:
+                removed.append((key, old[1]))
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                evicted_key, (_, evicted) = self._data.popitem(last=False)
+                removed.append((evicted_key, evicted))
+        self._notify(removed)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """
+        Проверяет наличие свежей записи, не влияя на статистику попаданий и порядок вытеснения
+        """
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[0] > time.monotonic()
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Удаляет запись из кэша, если она есть
+
+        :param key: ключ записи
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is not None:
+            self._notify([(key, item[1])])
+
+    def clear(self) -> None:
+        """
+        Удаляет все записи
+        """
+        with self._lock:
+            removed = [(key, value) for key, (_, value) in self._data.items()]
+            self._data.clear()
+        self._notify(removed)
+
+    def __len__(self) -> int:
+        return len(self._data)
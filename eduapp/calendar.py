@@ -0,0 +1,185 @@
+"""
+Календарь пользователя с помесячным кэшем
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Tuple
+
+from dateutil.relativedelta import relativedelta
+
+import config
+from eduapp.cache import TTLCache
+from eduapp.exceptions import EAError
+from eduapp.main import calendar_lessons_to_good_json, check_server_response, \
+    get_calendar_data_from_website, iter_calendar_lessons
+from eduapp.metrics import metrics
+from eduapp.sessions import EASession
+
+#: Разобранные данные календаря по ключу (пользователь, год, месяц)
+calendar_cache = TTLCache(max_size=config.EDUAPP_CALENDAR_CACHE_SIZE,
+                          ttl=config.EDUAPP_CALENDAR_TTL)
+metrics.add_cache('calendar', calendar_cache)
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=config.EDUAPP_CALENDAR_PREFETCH_WORKERS,
+                                        thread_name_prefix='calendar-prefetch')
+_prefetch_in_flight = set()
+_prefetch_lock = threading.Lock()
+
+
+def shift_month(year: int, month: int, delta: int) -> Tuple[int, int]:
+    """
+    Сдвигает месяц на `delta` месяцев вперёд или назад
+
+    :return: пара (год, месяц)
+    """
+    index = year * 12 + month - 1 + delta
+    return index // 12, index % 12 + 1
+
+
+def get_shifted_month(delta: int) -> Tuple[int, int]:
+    """
+    Месяц, сдвинутый относительно текущего
+
+    :param delta: сдвиг: -1 - предыдущий месяц, 1 - следующий
+    :return: пара (год, месяц)
+    """
+    now = datetime.now()
+    return shift_month(now.year, now.month, delta)
+
+
+def get_month_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    """
+    Границы месяца для запроса календаря
+
+    :return: пара (первый день месяца, первый день следующего месяца)
+    """
+    start = datetime.now().astimezone().replace(year=year, month=month, day=1)
+    return start, start + relativedelta(months=1)
+
+
+def get_month_ttl(year: int, month: int) -> float:
+    """
+    Время жизни месяца в кэше. Прошедшие месяцы почти не меняются,
+    а в текущем и будущих меняются посещаемость и расписание
+
+    :return: время жизни в секундах
+    """
+    now = datetime.now()
+    if (year, month) < (now.year, now.month):
+        return config.EDUAPP_CALENDAR_PAST_TTL
+    return config.EDUAPP_CALENDAR_TTL
+
+
+def load_month(session: EASession, year: int, month: int) -> dict:
+    """
+    Загружает месяц с сервера и кладёт его в кэш.
+    Неуспешные ответы сервера (например, устаревший токен) не кэшируются
+
+    :param session: сессия пользователя
+    :param year: год
+    :param month: месяц
+    :raise TokenRejectedError: если сервер не принял токен
+    :raise EAServerError: если сервер ответил другой ошибкой
+    :return: красивый словарь с данными о календаре
+    """
+    start, end = get_month_bounds(year, month)
+    response = get_calendar_data_from_website(session, start, end)
+    check_server_response(response)
+    data = calendar_lessons_to_good_json(iter_calendar_lessons(session, start, end, response),
+                                         session.timezone)
+    store_month(session, year, month, data)
+    return data
+
+
+def store_month(session: EASession, year: int, month: int, data: dict) -> None:
+    """
+    Кладёт разобранный месяц в кэш
+
+    :param session: сессия пользователя
+    :param year: год
+    :param month: месяц
+    :param data: красивый словарь с данными о календаре
+    """
+    calendar_cache.put((session.user_id, year, month), data, get_month_ttl(year, month))
+
+
+def claim_prefetch(session: EASession, year: int, month: int) -> bool:
+    """
+    Отмечает, что месяц начали загружать в фоне
+
+    :return: `False`, если месяц уже есть в кэше или его уже загружают
+    """
+    key = (session.user_id, year, month)
+    with _prefetch_lock:
+        if key in _prefetch_in_flight or key in calendar_cache:
+            return False
+        _prefetch_in_flight.add(key)
+        return True
+
+
+def release_prefetch(session: EASession, year: int, month: int) -> None:
+    """
+    Отмечает, что фоновая загрузка месяца закончилась
+    """
+    with _prefetch_lock:
+        _prefetch_in_flight.discard((session.user_id, year, month))
+
+
+def _prefetch(session: EASession, year: int, month: int) -> None:
+    try:
+        load_month(session, year, month)
+    except EAError:
+        logging.info('Не удалось заранее загрузить календарь за %i.%i', month, year)
+    except Exception:  # pylint: disable=W0703
+        # Исключение фоновой задачи иначе никто бы не увидел
+        logging.exception('Ошибка фоновой загрузки календаря за %i.%i', month, year)
+    finally:
+        release_prefetch(session, year, month)
+
+
+def prefetch_month(session: EASession, year: int, month: int) -> None:
+    """
+    Загружает месяц в кэш в фоне, если его там ещё нет
+
+    :param session: сессия пользователя
+    :param year: год
+    :param month: месяц
+    """
+    if claim_prefetch(session, year, month):
+        _prefetch_executor.submit(_prefetch, session, year, month)
+
+
+def get_month(session: EASession, year: int, month: int) -> dict:
+    """
+    Возвращает календарь на месяц из кэша, а если его там нет - загружает с сервера.
+    Соседние месяцы не загружаются
+
+    :param session: сессия пользователя
+    :param year: год
+    :param month: месяц
+    :raise TokenRejectedError: если сервер не принял токен
+    :return: красивый словарь с данными о календаре
+    """
+    data = calendar_cache.get((session.user_id, year, month))
+    if data is None:
+        data = load_month(session, year, month)
+    return data
+
+
+def get_month_calendar_data(session: EASession, month: int = 0) -> dict:
+    """
+    Возвращает календарь на месяц - из кэша или с сервера.
+    Соседние месяцы после этого загружаются в кэш в фоне
+
+    :param session: сессия пользователя
+    :param month: сдвиг относительно текущего месяца: -1 - предыдущий, 1 - следующий
+    :return: красивый словарь с данными о календаре
+    """
+    year, month = get_shifted_month(month)
+    data = get_month(session, year, month)
+    for delta in (-1, 1):
+        prefetch_month(session, *shift_month(year, month, delta))
+    return data
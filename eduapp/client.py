@@ -0,0 +1,193 @@
+"""
+HTTP-клиент для работы с API Eduapp
+"""
+
+import logging
+import re
+import time
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Optional, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from eduapp.exceptions import EAConnectionError
+from eduapp.http_cache import CachedResponse, ResponseCache, response_cache
+from eduapp.metrics import metrics
+
+#: Время запросов к Eduapp, вместе с повторами, по методу и адресу
+request_seconds = metrics.histogram('eduapp_request_duration_seconds', 'Время запроса к Eduapp',
+                                    ('method', 'endpoint'))
+
+#: Ответы Eduapp по методу, адресу и коду ответа. ``error`` - сервер не ответил
+responses_total = metrics.counter('eduapp_responses_total', 'Ответы Eduapp по кодам',
+                                  ('method', 'endpoint', 'status'))
+
+_API_PATH = urlsplit(config.EDUAPP_API_URL).path
+_ID = re.compile(r'/\d+(?=/|$)')
+
+
+def get_endpoint(url: str) -> str:
+    """
+    Адрес запроса для метки метрики: без сервера, префикса API и параметров,
+    идентификаторы заменены на ``{id}``, чтобы у метрики было немного рядов
+
+    :param url: адрес запроса
+    :return: например ``/discussions/{id}/comments/``
+    """
+    path = urlsplit(url).path
+    if path.startswith(_API_PATH):
+        path = path[len(_API_PATH):]
+    return _ID.sub('/{id}', path)
+
+
+def record_request(method: str, url: str, status: Union[int, str], started: float) -> None:
+    """
+    Записывает запрос к Eduapp в метрики
+
+    :param method: HTTP-метод
+    :param url: адрес запроса
+    :param status: код ответа или ``error``, если сервер не ответил
+    :param started: начало запроса, по :func:`time.perf_counter`
+    """
+    endpoint = get_endpoint(url)
+    request_seconds.observe(time.perf_counter() - started, method, endpoint)
+    responses_total.inc(method, endpoint, str(status))
+
+
+class EAClient:
+    """
+    Клиент API Eduapp.
+
+    Держит один :class:`requests.Session` с пулом keep-alive соединений, поэтому
+    TCP- и TLS-рукопожатие с сервером выполняется один раз на соединение, а не на каждый запрос.
+    Все запросы выполняются с таймаутами, идемпотентные GET-запросы повторяются
+    с экспоненциальной задержкой. Ответы на GET-запросы проходят через кэш
+    (:mod:`eduapp.http_cache`): повторные запросы отправляются условными.
+    """
+
+    # pylint: disable=E1101
+    # Добавлено, чтобы не ругался на модуль requests
+
+    #: Коды ответа, при которых GET-запрос имеет смысл повторить
+    RETRY_STATUS_CODES = (
+        requests.codes.bad_gateway,
+        requests.codes.service_unavailable,
+        requests.codes.gateway_timeout,
+    )
+
+    def __init__(self, pool_size: int = config.EDUAPP_POOL_SIZE,
+                 connect_timeout: float = config.EDUAPP_CONNECT_TIMEOUT,
+                 read_timeout: float = config.EDUAPP_READ_TIMEOUT,
+                 retries: int = config.EDUAPP_RETRIES,
+                 backoff_factor: float = config.EDUAPP_RETRY_BACKOFF,
+                 cache: Optional[ResponseCache] = None) -> None:
+        """
+        Создаёт сессию и подключает к ней пул соединений
+
+        :param pool_size: максимальное количество одновременно открытых соединений с сервером
+        :param connect_timeout: таймаут на установку соединения, в секундах
+        :param read_timeout: таймаут на чтение ответа, в секундах
+        :param retries: сколько раз повторять неудачный GET-запрос
+        :param backoff_factor: множитель экспоненциальной задержки между повторами
+        :param cache: кэш ответов на GET-запросы. `None` - не кэшировать
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+        self.default_cookies: Dict[str, str] = dict(config.EDUAPP_DEFAULT_COOKIES)
+
+        self.session = requests.Session()
+        self.session.headers.update(config.EDUAPP_DEFAULT_HEADERS)
+        # Сессия общая для всех пользователей бота, поэтому куки, которые ставит сервер,
+        # в ней сохранять нельзя - иначе они уйдут в запросах другого пользователя
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method: str, url: str, token: Optional[str] = None, **kwargs) -> Response:
+        """
+        Выполняет запрос к серверу Eduapp через общий пул соединений
+
+        :param method: HTTP-метод
+        :param url: адрес запроса
+        :param token: токен jwt-авторизации. Если указан - передаётся в куке ``eduapp_jwt``
+        :param kwargs: остальные параметры :meth:`requests.Session.request`
+        :raise EAConnectionError: если сервер не ответил за отведённое время
+        :return: ответ сервера
+        """
+        cookies = dict(self.default_cookies)
+        cookies.update(kwargs.pop('cookies', None) or {})
+        if token:
+            cookies['eduapp_jwt'] = token
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, cookies=cookies, **kwargs)
+        except requests.RequestException as ex:
+            record_request(method, url, 'error', started)
+            logging.warning('Ошибка запроса к Eduapp. URL: %s, ошибка: %s', url, ex)
+            raise EAConnectionError() from ex
+        record_request(method, url, response.status_code, started)
+        return response
+
+    def get(self, url: str, token: Optional[str] = None, **kwargs) -> Response:
+        """
+        GET-запрос к серверу Eduapp через кэш ответов. См. :meth:`request`
+        """
+        if self.cache is None:
+            return self.request('GET', url, token, **kwargs)
+        entry, kwargs['headers'] = self.cache.prepare_request(url, token, kwargs.get('headers'))
+        if kwargs['headers'] is None:
+            return get_cached_response(url, entry)
+        response = self.request('GET', url, token, **kwargs)
+        entry = self.cache.process_response(url, token, entry, response.status_code,
+                                            response.content, response.headers)
+        return response if entry is None else get_cached_response(url, entry)
+
+    def post(self, url: str, token: Optional[str] = None, **kwargs) -> Response:
+        """
+        POST-запрос к серверу Eduapp. См. :meth:`request`
+        """
+        return self.request('POST', url, token, **kwargs)
+
+    def close(self) -> None:
+        """
+        Закрывает все соединения пула
+        """
+        self.session.close()
+
+
+def get_cached_response(url: str, entry: CachedResponse) -> Response:
+    """
+    Собирает ответ из сохранённого в кэше
+
+    :param url: адрес запроса
+    :param entry: сохранённый ответ
+    :return: ответ с кодом 200
+    """
+    response = Response()
+    response.status_code = requests.codes.ok  # pylint: disable=E1101
+    response.url = url
+    response.headers = CaseInsensitiveDict(entry.headers)
+    response._content = entry.content  # pylint: disable=W0212
+    response.encoding = 'utf-8'
+    return response
+
+
+#: Общий для всего приложения клиент Eduapp
+ea_client = EAClient(cache=response_cache)
@@ -0,0 +1,220 @@
+"""
+Инкрементальная синхронизация обсуждений.
+
+Чтобы узнать, ответил ли преподаватель, не нужно заново скачивать все обсуждения
+и все их реплики. Для каждого пользователя запоминается отметка - самое позднее
+``commented_at`` среди известных обсуждений. Список обсуждений запрашивается
+отсортированным по ``commented_at`` от новых к старым и читается только до первого
+обсуждения не новее отметки - обычно это одна короткая страница. Первая страница
+запрашивается условно (``If-None-Match``/``If-Modified-Since``), и если сервер
+поддерживает эти заголовки, без изменений он отвечает пустым ``304 Not Modified``.
+
+У изменившихся обсуждений запрашиваются только реплики после уже известных.
+При первой синхронизации запоминается только отметка: всё, что было до неё,
+новым не считается
+"""
+
+import dataclasses
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+import config
+from eduapp.cache import TTLCache
+from eduapp.client import ea_client
+from eduapp.exceptions import TokenRejectedError
+from eduapp.questions import parse_single_question_json, question_page_cache
+from eduapp.sessions import EASession
+from eduapp.timestamps import parse_ea_datetime
+from eduapp.urls import EAUrls
+
+
+@dataclasses.dataclass
+class DiscussionSyncState:
+    """
+    Что известно об обсуждениях пользователя после прошлой синхронизации
+    """
+
+    #: Самое позднее ``commented_at`` среди известных обсуждений
+    watermark: Optional[datetime] = None
+
+    #: Заголовок ``ETag`` первой страницы списка обсуждений
+    etag: Optional[str] = None
+
+    #: Заголовок ``Last-Modified`` первой страницы списка обсуждений
+    last_modified: Optional[str] = None
+
+    #: Разобранные обсуждения по идентификатору, см. :func:`eduapp.questions.parse_single_question_json`
+    discussions: Dict[int, dict] = dataclasses.field(default_factory=dict)
+
+    #: Количество известных реплик по идентификатору обсуждения
+    comment_counts: Dict[int, int] = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class DiscussionUpdate:
+    """
+    Изменившееся обсуждение
+    """
+
+    #: Разобранное обсуждение
+    question: dict
+
+    #: Реплики, появившиеся после прошлой синхронизации
+    comments: List[dict]
+
+
+#: Состояние синхронизации по идентификатору пользователя
+discussion_states = TTLCache(max_size=config.EDUAPP_DISCUSSIONS_SYNC_SIZE,
+                             ttl=config.EDUAPP_SESSION_TTL)
+
+
+def check_response(response) -> bool:
+    """
+    :param response: ответ сервера
+    :raise TokenRejectedError: если сервер не принял токен
+    :return: `True`, если сервер вернул данные
+    """
+    # pylint: disable=E1101
+    if response.status_code in (requests.codes.unauthorized, requests.codes.forbidden):
+        raise TokenRejectedError()
+    if response.status_code != requests.codes.ok:
+        logging.info('Ошибка синхронизации обсуждений. Status_code: %i', response.status_code)
+        return False
+    return True
+
+
+def get_conditional_headers(state: DiscussionSyncState) -> Dict[str, str]:
+    """
+    :param state: состояние синхронизации
+    :return: заголовки условного запроса первой страницы списка обсуждений
+    """
+    headers = {}
+    if state.etag:
+        headers['If-None-Match'] = state.etag
+    if state.last_modified:
+        headers['If-Modified-Since'] = state.last_modified
+    return headers
+
+
+def fetch_changed_discussions(session: EASession, state: DiscussionSyncState) \
+        -> Optional[Tuple[List[dict], Tuple[Optional[str], Optional[str]]]]:
+    """
+    Запрашивает обсуждения, изменившиеся после отметки. Без отметки - только первую страницу
+
+    :param session: сессия пользователя
+    :param state: состояние синхронизации
+    :raise TokenRejectedError: если сервер не принял токен
+    :return: обсуждения в том виде, в котором их отдаёт сервер, от старых изменений к новым,
+        и заголовки ``ETag`` и ``Last-Modified`` первой страницы, или `None`, если получить их не удалось
+    """
+    response = ea_client.get(EAUrls.get_changed_questions_url(0), token=session.token,
+                             headers=get_conditional_headers(state))
+    if response.status_code == requests.codes.not_modified:  # pylint: disable=E1101
+        return [], (state.etag, state.last_modified)
+    validators = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    changed = []
+    offset = 0
+    while True:
+        if not check_response(response):
+            return None
+        jsn = response.json()
+        results = jsn.get('results') or []
+        newer = [question for question in results
+                 if state.watermark is None
+                 or parse_ea_datetime(question['commented_at']) > state.watermark]
+        changed.extend(newer)
+        # Сервер, который не понял параметры страницы, сразу присылает все обсуждения без count
+        if state.watermark is None or len(newer) < len(results) or 'count' not in jsn \
+                or offset + len(results) >= jsn['count']:
+            break
+        offset += len(results)
+        response = ea_client.get(EAUrls.get_changed_questions_url(offset), token=session.token)
+    changed.sort(key=lambda question: parse_ea_datetime(question['commented_at']))
+    return changed, validators
+
+
+def fetch_new_comments(session: EASession, discussion: int, known: int) -> Optional[List[dict]]:
+    """
+    Запрашивает реплики обсуждения после уже известных
+
+    :param session: сессия пользователя
+    :param discussion: идентификатор обсуждения
+    :param known: сколько реплик уже известно
+    :raise TokenRejectedError: если сервер не принял токен
+    :return: новые реплики или `None`, если получить их не удалось
+    """
+    comments = []
+    while True:
+        response = ea_client.get(EAUrls.get_new_comments_url(discussion, known + len(comments)),
+                                 token=session.token)
+        if not check_response(response):
+            return None
+        jsn = response.json()
+        results = jsn.get('results') or []
+        count = jsn.get('count')
+        if count is None or known and len(results) == count:
+            # Сервер не понял параметры страницы и прислал все реплики
+            return results[known:]
+        comments.extend(results)
+        if not results or known + len(comments) >= count:
+            return comments
+
+
+def sync_discussions(session: EASession) -> List[DiscussionUpdate]:
+    """
+    Синхронизирует обсуждения пользователя с сервером
+
+    :param session: сессия пользователя
+    :raise TokenRejectedError: если сервер не принял токен
+    :raise EAConnectionError: если сервер не ответил
+    :return: изменившиеся обсуждения с новыми репликами. При первой синхронизации - пустой список
+    """
+    state = discussion_states.get(session.user_id)
+    first_sync = state is None
+    if first_sync:
+        state = DiscussionSyncState()
+    fetched = fetch_changed_discussions(session, state)
+    if fetched is None:
+        return []
+    changed, validators = fetched
+    updates = []
+    for question in changed:
+        parsed = parse_single_question_json(question, session.timezone)
+        discussion = parsed['id']
+        if not first_sync:
+            known = state.comment_counts.get(discussion)
+            comments = fetch_new_comments(session, discussion, known or 0)
+            if comments is None:
+                # Заголовки не сохраняются, и оставшиеся обсуждения запросятся снова в следующий раз
+                validators = None
+                break
+            if known is None:
+                # Сколько реплик было раньше, неизвестно - новой считается последняя
+                state.comment_counts[discussion] = len(comments)
+                comments = comments[-1:]
+            else:
+                state.comment_counts[discussion] = known + len(comments)
+            updates.append(DiscussionUpdate(parsed, comments))
+        state.discussions[discussion] = parsed
+        state.watermark = max(filter(None, (state.watermark, parse_ea_datetime(question['commented_at']))))
+    if validators is not None:
+        state.etag, state.last_modified = validators
+    discussion_states.put(session.user_id, state)
+    if updates:
+        forget_question_pages(session, len(state.discussions))
+    return updates
+
+
+def forget_question_pages(session: EASession, known: int) -> None:
+    """
+    Удаляет из кэша страницы списка обсуждений пользователя: порядок обсуждений изменился
+
+    :param session: сессия пользователя
+    :param known: сколько обсуждений пользователя известно
+    """
+    pages = known // config.EDUAPP_QUESTIONS_PAGE_SIZE + 1
+    for page in range(1, pages + 1):
+        question_page_cache.invalidate((session.user_id, page))
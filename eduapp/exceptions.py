@@ -42,3 +42,40 @@ class UnknownError(EAError):
 
     #: строка, хранящая информацию о деталях ошибки
     message = 'Произошло что-то непонятное =('
+
+
+class TokenRejectedError(EAError):
+    """
+    Исключение, генерируемое в случае, если сервер не принял токен пользователя
+    """
+
+    #: строка, хранящая информацию о деталях ошибки
+    message = 'Сессия Eduapp устарела. Попробуйте ещё раз или авторизуйтесь заново'
+
+
+class LoginRequiredError(EAError):
+    """
+    Исключение, генерируемое в случае, если токен нельзя обновить без пользователя:
+    сессия восстановлена из хранилища, а пароль туда не сохраняется
+    """
+
+    #: строка, хранящая информацию о деталях ошибки
+    message = 'Сессия Eduapp устарела. Авторизуйтесь заново'
+
+
+class EAServerError(EAError):
+    """
+    Исключение, генерируемое в случае, если сервер Eduapp ответил ошибкой
+    """
+
+    #: строка, хранящая информацию о деталях ошибки
+    message = 'Сервер Eduapp ответил ошибкой. Попробуйте позже'
+
+
+class EAConnectionError(EAError):
+    """
+    Исключение, генерируемое в случае, если сервер Eduapp недоступен или не ответил вовремя
+    """
+
+    #: строка, хранящая информацию о деталях ошибки
+    message = 'Не удалось связаться с сервером Eduapp. Попробуйте позже'
@@ -0,0 +1,314 @@
+"""
+Кэш HTTP-ответов Eduapp.
+
+Работает под клиентами Eduapp (:class:`eduapp.client.EAClient` и
+:class:`eduapp.async_client.AsyncEAClient`) и не зависит от того, какие данные
+запрашиваются. Успешные ответы на GET-запросы сохраняются по адресу и токену
+пользователя вместе с валидаторами (``ETag``, ``Last-Modified``). Повторный запрос
+уходит на сервер условным (``If-None-Match``/``If-Modified-Since``), и если данные
+не изменились, сервер отвечает пустым ``304 Not Modified``, а клиент возвращает
+сохранённое тело. Ответ, который по ``Cache-Control: max-age`` ещё свеж, отдаётся
+без запроса к серверу, ``no-store`` не сохраняется.
+
+Ключ - хэш адреса и токена, поэтому ответы одного пользователя не достаются другому,
+а сам токен в кэше не хранится. Размер кэша ограничен суммарным объёмом тел ответов.
+Если задан каталог, записи дублируются на диск и переживают перезапуск бота
+"""
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Mapping, Optional, Tuple
+
+import config
+from eduapp.metrics import metrics
+
+#: Заголовки ответа, которые сохраняются вместе с телом
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control')
+
+#: Заголовки условного запроса. Если их передал сам вызывающий код, кэш не используется
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+@dataclasses.dataclass
+class CachedResponse:
+    """
+    Сохранённый ответ сервера
+    """
+
+    #: Тело ответа
+    content: bytes
+
+    #: Сохранённые заголовки, см. :data:`STORED_HEADERS`
+    headers: Dict[str, str]
+
+    #: Когда ответ был получен или подтверждён сервером, по :func:`time.time`
+    stored_at: float
+
+    #: Сколько секунд ответ свеж и не требует запроса к серверу
+    max_age: float = 0.0
+
+    def is_fresh(self, now: float) -> bool:
+        """
+        :param now: текущий момент (:func:`time.time`)
+        :return: `True`, если ответ можно отдать без запроса к серверу
+        """
+        return now < self.stored_at + self.max_age
+
+    def to_bytes(self) -> bytes:
+        """
+        :return: ответ для записи на диск: строка JSON с заголовками и сроком свежести, затем тело
+        """
+        meta = {'headers': self.headers, 'stored_at': self.stored_at, 'max_age': self.max_age}
+        return json.dumps(meta).encode() + b'\n' + self.content
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'CachedResponse':
+        """
+        :param data: ответ, записанный :meth:`to_bytes`
+        :raise ValueError: если данные повреждены
+        :return: сохранённый ответ
+        """
+        meta, _, content = data.partition(b'\n')
+        try:
+            return CachedResponse(content, **json.loads(meta))
+        except TypeError as ex:
+            raise ValueError(ex) from ex
+
+    def get_conditional_headers(self) -> Dict[str, str]:
+        """
+        :return: заголовки условного запроса
+        """
+        headers = {}
+        if self.headers.get('ETag'):
+            headers['If-None-Match'] = self.headers['ETag']
+        if self.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+
+def parse_cache_control(value: Optional[str]) -> Tuple[bool, float]:
+    """
+    Разбирает заголовок ``Cache-Control``
+
+    :param value: значение заголовка
+    :return: пара (можно ли сохранять ответ, сколько секунд он свеж)
+    """
+    value = (value or '').lower()
+    if 'no-store' in value:
+        return False, 0.0
+    match = _MAX_AGE.search(value)
+    if match is None or 'no-cache' in value:
+        return True, 0.0
+    return True, float(match.group(1))
+
+
+def get_cache_key(url: str, token: Optional[str]) -> str:
+    """
+    :param url: адрес запроса
+    :param token: токен пользователя
+    :return: ключ записи кэша
+    """
+    return hashlib.blake2b(f'{url}\0{token or ""}'.encode(), digest_size=16).hexdigest()
+
+
+def has_conditional_headers(headers: Optional[Mapping[str, str]]) -> bool:
+    """
+    :param headers: заголовки запроса
+    :return: `True`, если вызывающий код сам отправляет условный запрос
+    """
+    return any(name in (headers or {}) for name in CONDITIONAL_HEADERS)
+
+
+class ResponseCache:
+    """
+    Потокобезопасный кэш ответов. При переполнении удаляются ответы,
+    к которым дольше всех не обращались.
+
+    Статистика: ``hits`` - свежие ответы, отданные без запроса к серверу,
+    ``revalidated`` - ответы, подтверждённые сервером кодом 304,
+    ``misses`` - ответы, полученные с сервера целиком
+    """
+
+    def __init__(self, max_bytes: int = config.EDUAPP_HTTP_CACHE_BYTES,
+                 directory: Optional[str] = config.EDUAPP_HTTP_CACHE_DIR) -> None:
+        """
+        :param max_bytes: максимальный суммарный объём тел ответов, в байтах
+        :param directory: каталог для записей на диске. `None` - хранить только в памяти
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._data: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._remove_stale_files()
+
+    def prepare_request(self, url: str, token: Optional[str], headers: Optional[Mapping[str, str]]) \
+            -> Tuple[Optional[CachedResponse], Optional[Dict[str, str]]]:
+        """
+        Готовит GET-запрос: находит сохранённый ответ и добавляет к запросу его валидаторы
+
+        :param url: адрес запроса
+        :param token: токен пользователя
+        :param headers: заголовки запроса
+        :return: пара (сохранённый ответ или `None`, заголовки запроса). Если сохранённый
+            ответ ещё свеж, вместо заголовков `None` - запрос отправлять не нужно
+        """
+        headers = dict(headers or {})
+        if has_conditional_headers(headers):
+            return None, headers
+        entry = self.get(url, token)
+        if entry is None:
+            return None, headers
+        if entry.is_fresh(time.time()):
+            with self._lock:
+                self.hits += 1
+            return entry, None
+        headers.update(entry.get_conditional_headers())
+        return entry, headers
+
+    def process_response(self, url: str, token: Optional[str], entry: Optional[CachedResponse],
+                         status_code: int, content: bytes,
+                         headers: Mapping[str, str]) -> Optional[CachedResponse]:
+        """
+        Обрабатывает ответ на запрос, подготовленный :meth:`prepare_request`
+
+        :param url: адрес запроса
+        :param token: токен пользователя
+        :param entry: сохранённый ответ из :meth:`prepare_request`
+        :param status_code: код ответа
+        :param content: тело ответа
+        :param headers: заголовки ответа
+        :return: сохранённый ответ, который нужно вернуть вместо ``304``, иначе `None`
+        """
+        if status_code == 304 and entry is not None:
+            _, max_age = parse_cache_control(headers.get('Cache-Control',
+                                                         entry.headers.get('Cache-Control')))
+            with self._lock:
+                self.revalidated += 1
+                entry.max_age = max_age
+                entry.stored_at = time.time()
+            # Без перезаписи файла ответ после перезапуска снова считался бы устаревшим
+            self._write_file(get_cache_key(url, token), entry)
+            return entry
+        if status_code == 200:
+            with self._lock:
+                self.misses += 1
+            self.store(url, token, content, headers)
+        return None
+
+    def get(self, url: str, token: Optional[str]) -> Optional[CachedResponse]:
+        """
+        :param url: адрес запроса
+        :param token: токен пользователя
+        :return: сохранённый ответ или `None`
+        """
+        key = get_cache_key(url, token)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                return entry
+        entry = self._read_file(key)
+        if entry is not None:
+            with self._lock:
+                self._add(key, entry)
+        return entry
+
+    def store(self, url: str, token: Optional[str], content: bytes,
+              headers: Mapping[str, str]) -> None:
+        """
+        Сохраняет успешный ответ, если у него есть валидаторы или срок свежести
+
+        :param url: адрес запроса
+        :param token: токен пользователя
+        :param content: тело ответа
+        :param headers: заголовки ответа
+        """
+        cacheable, max_age = parse_cache_control(headers.get('Cache-Control'))
+        if not cacheable or not (max_age or headers.get('ETag') or headers.get('Last-Modified')):
+            return
+        stored_headers = {name: headers[name] for name in STORED_HEADERS if name in headers}
+        entry = CachedResponse(content, stored_headers, time.time(), max_age)
+        key = get_cache_key(url, token)
+        with self._lock:
+            self._add(key, entry)
+        self._write_file(key, entry)
+
+    def clear(self) -> None:
+        """
+        Удаляет все ответы из памяти
+        """
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _add(self, key: str, entry: CachedResponse) -> None:
+        previous = self._data.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.content)
+        self._data[key] = entry
+        self.size += len(entry.content)
+        while self.size > self.max_bytes and self._data:
+            evicted_key, evicted = self._data.popitem(last=False)
+            self.size -= len(evicted.content)
+            self._remove_file(evicted_key)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _read_file(self, key: str) -> Optional[CachedResponse]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'rb') as file:
+                return CachedResponse.from_bytes(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as ex:
+            logging.warning('Не удалось прочитать ответ из кэша %s: %s', key, ex)
+            return None
+
+    def _write_file(self, key: str, entry: CachedResponse) -> None:
+        if not self.directory:
+            return
+        temp_path = f'{self._path(key)}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(entry.to_bytes())
+            os.replace(temp_path, self._path(key))
+        except OSError as ex:
+            logging.warning('Не удалось сохранить ответ в кэш %s: %s', key, ex)
+
+    def _remove_file(self, key: str) -> None:
+        if not self.directory:
+            return
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _remove_stale_files(self) -> None:
+        # Ключи содержат токен, а токены живут не дольше сессии - старые записи уже не пригодятся
+        deadline = time.time() - config.EDUAPP_SESSION_TTL
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                self._remove_file(entry.name)
+
+
+#: Общий для клиентов Eduapp кэш ответов
+response_cache = ResponseCache()
+metrics.add_cache('http', response_cache)
@@ -0,0 +1,48 @@
+"""
+Модель занятий календаря.
+
+Календари закэшированы на месяцы вперёд для каждого ученика, поэтому занятия
+хранятся в компактных неизменяемых кортежах, а не в словарях
+"""
+
+import enum
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+
+class TimeRange(NamedTuple):
+    """
+    Время начала и окончания занятия
+    """
+
+    start: datetime
+    finish: datetime
+
+
+class Visit(enum.Enum):
+    """
+    Посещение занятия учеником
+    """
+
+    VISITED = 'Посещено'
+    MISSED = 'Пропущено'
+    PLANNED = 'Предстоит'
+
+
+class Lesson(NamedTuple):
+    """
+    Занятие из календаря пользователя
+    """
+
+    #: Название курса
+    name: str
+
+    time: TimeRange
+
+    #: Занятие основного курса (а не дополнительного)
+    base: bool
+
+    visit: Visit
+
+    #: Тема занятия, если она указана
+    theme: Optional[str] = None
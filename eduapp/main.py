@@ -3,19 +3,32 @@
 """
 
 import dataclasses
+import itertools
 import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import requests
 from dateutil.relativedelta import relativedelta
 from requests import Response
 
 import config
-from eduapp.exceptions import CaptchaEnabledError, InvalidPasswordError, UnknownError
+from eduapp.account import EAAccount, fetch_account, get_account, remember_account
+from eduapp.client import ea_client
+from eduapp.exceptions import CaptchaEnabledError, EAConnectionError, EAServerError, \
+    InvalidPasswordError, LoginRequiredError, TokenRejectedError, UnknownError
+from eduapp.lessons import Lesson, TimeRange, Visit
+from eduapp.timestamps import parse_ea_datetime, parse_ea_datetimes
+from eduapp.sessions import EASession, create_session, get_session_expiry, sessions
 from eduapp.urls import EAUrls
 
 
+_page_executor = ThreadPoolExecutor(max_workers=config.EDUAPP_PAGE_WORKERS,
+                                    thread_name_prefix='eduapp-pages')
+
+
 class InvalidPassword(RuntimeError):
     pass
 
@@ -50,6 +63,7 @@ class Authenticator:
         self.password: str = password
         self.token: str = token
         self.user: Optional[str] = None
+        self.account: Optional[EAAccount] = None
 
     def login(self) -> Tuple[str, str]:
         """
@@ -61,10 +75,18 @@ class Authenticator:
         :return: Пара из имени/фамилии и токена
         """
         response = self.__get_login_response()
-        self.__parse_status_code(response)
+        self.parse_status_code(response)
         self.__request_user_data()
         return self.user, self.token
 
+    def get_login_form(self) -> dict:
+        """
+        Данные формы запроса на авторизацию
+
+        :return: словарь с полями формы
+        """
+        return {'username': self.username, 'password': self.password, 'add_captcha': False}
+
     def __get_login_response(self) -> Response:
         """
         Отправка запроса на авторизацию и возвращение ответа
@@ -72,13 +94,10 @@ class Authenticator:
         :return: ответ на запрос авторизации
         """
         logging.debug('Отправляем запрос на авторизацию. URL: %s', EAUrls.LOGIN_URL)
-        response = requests.post(
-            EAUrls.LOGIN_URL,
-            data={'username': self.username, 'password': self.password, 'add_captcha': False}
-        )
+        response = ea_client.post(EAUrls.LOGIN_URL, data=self.get_login_form())
         return response
 
-    def __parse_status_code(self, response: Response) -> None:
+    def parse_status_code(self, response: Response) -> None:
         """
         Обрабатываем код ответа сервера и кидаем исключения, если что-то идёт не так
         :param response: ответ от сервера
@@ -89,7 +108,6 @@ class Authenticator:
         if response.status_code == requests.codes.ok:
             logging.info('Авторизация успешна')
             self.token = response.json()['token']
-            config.EDUAPP_JWT = self.token
             return
         if response.status_code == requests.codes.bad_request:
             logging.info('Ошибка авторизации. Status code: %i', response.status_code)
@@ -105,38 +123,24 @@ class Authenticator:
     def __request_user_data(self) -> None:
         """
         Запрашиваем данные пользователя. Если получилось - сохраняем их, иначе - кидаем исключение
-        return True
 
         :raise InvalidPasswordError: в случае, если данные для входа указаны некорректно
         """
         logging.debug('Пробуем получить данные пользователя')
-        self.user = self.__get_account_data()
-        if not self.user:
-            logging.info('Ошибка авторизации')
-            raise InvalidPasswordError()
+        self.set_account(fetch_account(self.token))
 
-    def __get_account_data(self) -> Optional[str]:
+    def set_account(self, account: Optional[EAAccount]) -> None:
         """
-        Отправка запроса на получение данных аккаунта и возвращение ответа
+        Сохраняет полученную запись аккаунта, чтобы потом положить её в кэш
 
-        :return: Имя и фамилия, если авторизация успешна и None в случае неуспешной авторизации
+        :param account: запись аккаунта или `None`, если токен не подошёл
+        :raise InvalidPasswordError: если записи аккаунта нет
         """
-        logging.debug('Отправляем запрос на получение даных пользователя. URL: %s',
-                      EAUrls.ACCOUNT_URL)
-        response = requests.get(
-            EAUrls.ACCOUNT_URL,
-            cookies={
-                'eduapp_jwt': self.token
-            },
-            headers={
-                'host': 'my.informatics.ru',
-                'referer': 'https://my.informatics.ru/pupil/root/'
-            }
-        )
-        if response.status_code in Authenticator.BAD_STATUS_CODES:
-            logging.info('Ошибка авторизации. Status_code: %i', response.status_code)
-            return None
-        return f"{response.json()['last_name']} {response.json()['first_name']}"
+        if account is None:
+            logging.info('Ошибка авторизации')
+            raise InvalidPasswordError()
+        self.account = account
+        self.user = account.full_name
 
 
 @dataclasses.dataclass
@@ -159,6 +163,9 @@ class EaAuthStatus:
     #: если поле `success` приняло значение `False`
     error: str = ''
 
+    #: Запись аккаунта пользователя. Заполняется только при успешной авторизации
+    account: Optional[EAAccount] = None
+
 
 def login(username: str, password: str) -> EaAuthStatus:
     """
@@ -172,34 +179,190 @@ def login(username: str, password: str) -> EaAuthStatus:
     auth = Authenticator(username, password, None)
     try:
         username, token = auth.login()
-    except (InvalidPasswordError, CaptchaEnabledError, UnknownError) as ex:
+    except (InvalidPasswordError, CaptchaEnabledError, UnknownError, EAConnectionError) as ex:
         return EaAuthStatus(success=False, error=str(ex))
-    return EaAuthStatus(success=True, username=username, token=token)
-
-
-def get_profile_data():
-    response = requests.get(EAUrls.ACCOUNT_URL, cookies={'eduapp_jwt': config.EDUAPP_JWT})
-    jsn = response.json()
-    return {'first_name': jsn['first_name'],
-            'last_name': jsn['last_name'],
-            'patronymic': jsn['patronymic'],
-            'phone': jsn['contact_number'],
-            'email': jsn['email'],
-            'timezone': jsn['timezone']
+    return EaAuthStatus(success=True, username=username, token=token, account=auth.account)
+
+
+def open_session(chat_id: int, username: str, password: str) -> EaAuthStatus:
+    """
+    Авторизует пользователя чата и сохраняет его сессию и запись аккаунта
+
+    :param chat_id: идентификатор чата
+    :param username: Имя пользователя
+    :param password: Пароль пользователя
+    :return: статус авторизации
+    """
+    status = login(username, password)
+    save_session(chat_id, username, password, status)
+    return status
+
+
+def save_session(chat_id: int, username: str, password: str, status: EaAuthStatus) -> None:
+    """
+    После успешной авторизации сохраняет сессию пользователя и запись аккаунта
+
+    :param chat_id: идентификатор чата
+    :param username: Имя пользователя
+    :param password: Пароль пользователя
+    :param status: статус авторизации
+    """
+    if status.success:
+        sessions.put(create_session(chat_id, username, password, status.token,
+                                    status.account.id, status.account.timezone))
+        remember_account(chat_id, status.account)
+
+
+def relogin(session: EASession) -> EaAuthStatus:
+    """
+    Повторная авторизация пользователя с сохранёнными в сессии данными для входа.
+    В случае успеха обновляет токен сессии и запись аккаунта в кэше
+
+    :param session: сессия пользователя
+    :return: статус авторизации. Если пароля в сессии нет (она восстановлена из хранилища),
+        авторизация не выполняется и пользователя просят авторизоваться заново
+    """
+    if session.password is None:
+        return EaAuthStatus(success=False, error=LoginRequiredError.message)
+    status = login(session.login, session.password)
+    refresh_session(session, status)
+    return status
+
+
+def refresh_session(session: EASession, status: EaAuthStatus) -> None:
+    """
+    После успешной повторной авторизации обновляет токен сессии и запись аккаунта в кэше
+
+    :param session: сессия пользователя
+    :param status: статус авторизации
+    """
+    if status.success:
+        session.token = status.token
+        session.expires_at = get_session_expiry(status.token)
+        session.refresh_after = 0.0
+        session.user_id = status.account.id
+        session.timezone = status.account.timezone
+        remember_account(session.chat_id, status.account)
+
+
+def get_profile_data(session: EASession):
+    return get_profile_from_account(get_account(session))
+
+
+def get_profile_from_account(account: Optional[EAAccount]):
+    """
+    Данные для отображения профиля
+
+    :param account: запись аккаунта
+    :return: словарь с данными профиля или `None`, если записи аккаунта нет
+    """
+    if account is None:
+        return None
+    return {'first_name': account.first_name,
+            'last_name': account.last_name,
+            'patronymic': account.patronymic,
+            'phone': account.phone,
+            'email': account.email,
+            'timezone': account.timezone
             }
 
 
-def get_calendar_data_from_website(cookies, start, end):
+def get_calendar_data_from_website(session: EASession, start, end, page=1):
     """
-    Эта функция получает данные о календаре с eduapp
+    Эта функция получает одну страницу данных о календаре с eduapp
 
-    :param cookies: нужные куки
+    :param session: сессия пользователя
     :param start: получение данных о календаре с этой даты
     :param end: получение данных о календаре до этой даты
-    :return: словарь с данными
+    :param page: номер страницы
+    :return: ответ сервера
     """
-    user_id = str(requests.get(EAUrls.ACCOUNT_URL, cookies=cookies).json()['id'])
-    return requests.get(EAUrls.get_calendar_data_url(start, end, user_id), cookies=cookies)
+    url = EAUrls.get_calendar_data_url(start, end, str(session.user_id), page)
+    return ea_client.get(url, token=session.token)
+
+
+def check_token_accepted(response: Response) -> None:
+    """
+    Проверяет, что сервер принял токен пользователя
+
+    :param response: ответ сервера
+    :raise TokenRejectedError: если сервер ответил 401 или 403
+    """
+    # pylint: disable=E1101
+    if response.status_code in (requests.codes.unauthorized, requests.codes.forbidden):
+        logging.info('Сервер не принял токен. Status code: %i', response.status_code)
+        raise TokenRejectedError()
+
+
+def check_server_response(response: Response) -> None:
+    """
+    Проверяет, что сервер принял токен пользователя и ответил без ошибки
+
+    :param response: ответ сервера
+    :raise TokenRejectedError: если сервер ответил 401 или 403
+    :raise EAServerError: если сервер ответил другой ошибкой
+    """
+    # pylint: disable=E1101
+    check_token_accepted(response)
+    if response.status_code != requests.codes.ok:
+        logging.info('Ошибка сервера. Status code: %i', response.status_code)
+        raise EAServerError()
+
+
+def get_page_results(response: Response) -> list:
+    """
+    Достаёт список записей из страницы ответа
+
+    :param response: ответ сервера
+    :raise TokenRejectedError: если сервер не принял токен
+    :raise EAServerError: если сервер вернул ошибку
+    :return: записи страницы
+    """
+    check_server_response(response)
+    return response.json()['results']
+
+
+def get_remaining_pages(first_page: dict) -> range:
+    """
+    Номера оставшихся страниц календаря. Размер страницы берётся из первой страницы,
+    а не из запроса: сервер может отдавать меньше записей, чем просили в ``limit``
+
+    :param first_page: разобранная первая страница с общим количеством занятий ``count``
+    :return: номера страниц, начиная со второй
+    """
+    page_size = len(first_page['results'])
+    if not page_size:
+        return range(0)
+    return range(2, math.ceil(first_page['count'] / page_size) + 1)
+
+
+def iter_calendar_lessons(session: EASession, start, end, first_page: Response) -> Iterator[dict]:
+    """
+    Потоково отдаёт занятия со всех страниц календаря.
+
+    Если сервер сообщил общее количество занятий, оставшиеся страницы запрашиваются
+    параллельно, иначе - последовательно по ссылкам ``next``
+
+    :param session: сессия пользователя
+    :param start: получение данных о календаре с этой даты
+    :param end: получение данных о календаре до этой даты
+    :param first_page: уже полученная первая страница
+    :return: генератор занятий в порядке страниц
+    """
+    jsn = first_page.json()
+    yield from jsn['results']
+    if jsn.get('count') is not None:
+        responses = _page_executor.map(
+            lambda page: get_calendar_data_from_website(session, start, end, page),
+            get_remaining_pages(jsn))
+        for response in responses:
+            yield from get_page_results(response)
+        return
+    next_url = jsn.get('next')
+    while next_url:
+        response = ea_client.get(next_url, token=session.token)
+        yield from get_page_results(response)
+        next_url = response.json().get('next')
 
 
 def calendar_data_to_good_json(response):
@@ -209,80 +372,111 @@ def calendar_data_to_good_json(response):
     :param response: ответ с сайта
     :return: красивый словарь
     """
-    if not response.json()['results']:
-        return {'success': False}
+    return calendar_lessons_to_good_json(response.json()['results'])
 
-    res_json = get_meta_data(response)
 
-    for lesson in response.json()['results']:
-        res = get_main_data_of_lesson(lesson)
-
-        get_data_about_visit(lesson, res)
-
-        classes_date = datetime.strptime(lesson['classes']['date_of'], "%Y-%m-%d")
-        classes_date_str = classes_date.strftime("%d.%m")
+def calendar_lessons_to_good_json(lessons: Iterable[dict], timezone: Optional[str] = None):
+    """
+    Преобразует занятия в удобный для использования словарь.
+    Занятия обрабатываются пачками по мере поступления, поэтому сюда можно передавать генератор
 
-        if classes_date_str in res_json['days']:
-            res_json['days'][classes_date_str].append(res)
-        else:
-            res_json['days'][classes_date_str] = [res]
+    :param lessons: занятия в том виде, в котором их отдаёт сервер
+    :param timezone: часовой пояс пользователя, в который переводится время занятий
+    :return: красивый словарь, занятия в нём - :class:`eduapp.lessons.Lesson`
+    """
+    res_json = None
+    lessons = iter(lessons)
+
+    while True:
+        batch = list(itertools.islice(lessons, config.EDUAPP_CALENDAR_PAGE_SIZE))
+        if not batch:
+            break
+        if res_json is None:
+            res_json = get_meta_data(batch[0]['classes']['date_of'])
+        for lesson in get_lessons(batch, timezone):
+            start = lesson.time.start
+            res_json['days'].setdefault(f'{start.day:02}.{start.month:02}', []).append(lesson)
+    if res_json is None:
+        return {'success': False}
     res_json['success'] = True
     return res_json
 
 
-def get_datetime_from_ea_string(data):
-    data_without_timezone = data[:-6]
-    ea_datetime_format = "%Y-%m-%dT%H:%M:%S"
-    return datetime.strptime(data_without_timezone, ea_datetime_format)
+def get_datetime_from_ea_string(data, timezone: Optional[str] = None):
+    """
+    См. :func:`eduapp.timestamps.parse_ea_datetime`
+    """
+    return parse_ea_datetime(data, timezone)
 
 
-def get_main_data_of_lesson(lesson):
-    start_time = get_datetime_from_ea_string(lesson['classes']['datetime_begin'])
-    finish_time = get_datetime_from_ea_string(lesson['classes']['datetime_end'])
-    res = {
-        'name': lesson['classes']['course']['simplest_name'],
-        'time': {
-            'start': start_time,
-            'finish': finish_time,
-        },
-        'base': lesson['classes']['course']['diary_type'] == 'D',
-    }
-    if len(lesson['classes']['classes_lessons']) > 0:
-        res['theme'] = lesson['classes']['classes_lessons'][0]['lesson']['name']
-    return res
+def get_lessons(lessons, timezone: Optional[str] = None) -> List[Lesson]:
+    """
+    Разбирает пачку занятий из ответа сервера. Время всех занятий разбирается одним вызовом
 
+    :param lessons: занятия в том виде, в котором их отдаёт сервер
+    :param timezone: часовой пояс пользователя
+    :return: занятия
+    """
+    times = parse_ea_datetimes(
+        itertools.chain.from_iterable(
+            (lesson['classes']['datetime_begin'], lesson['classes']['datetime_end'])
+            for lesson in lessons),
+        timezone)
+    return [get_lesson(lesson, TimeRange(times[2 * i], times[2 * i + 1]))
+            for i, lesson in enumerate(lessons)]
 
-def get_data_about_visit(lesson, res):
-    try:
-        if not lesson['pupil_attendances'][0]['is_begun']:
-            res['visited'] = 'Предстоит'
-        elif lesson['pupil_attendances'][0]['status'] == 'н':
-            res['visited'] = 'Пропущено'
-        else:
-            res['visited'] = 'Посещено'
-    except IndexError:
-        res['visited'] = 'Предстоит'
 
+def get_lesson(lesson, time_range: TimeRange) -> Lesson:
+    """
+    Разбирает занятие из ответа сервера
 
-def get_meta_data(response):
+    :param lesson: занятие в том виде, в котором его отдаёт сервер
+    :param time_range: уже разобранное время занятия
+    :return: занятие
+    """
+    classes = lesson['classes']
+    course = classes['course']
+    classes_lessons = classes['classes_lessons']
+    return Lesson(
+        name=course['simplest_name'],
+        time=time_range,
+        base=course['diary_type'] == 'D',
+        visit=get_visit(lesson),
+        theme=classes_lessons[0]['lesson']['name'] if classes_lessons else None,
+    )
+
+
+def get_visit(lesson) -> Visit:
+    attendances = lesson['pupil_attendances']
+    if not attendances or not attendances[0]['is_begun']:
+        return Visit.PLANNED
+    if attendances[0]['status'] == 'н':
+        return Visit.MISSED
+    return Visit.VISITED
+
+
+def get_meta_data(date_of):
+    year, month, _ = date_of.split('-')
     res_json = {
         'date': {
-            'year': int(response.json()['results'][0]['classes']['date_of'].split('-')[0]),
-            'name': datetime(1, int(response.json()['results'][0]['classes']['date_of'].split('-')[1]),
-                             1).strftime('%B').lower()
+            'year': int(year),
+            'name': datetime(1, int(month), 1).strftime('%B').lower()
         },
         'days': {}
     }
     return res_json
 
 
-def get_calendar_data(start=None, end=None, month=0):
+def get_calendar_data(session: EASession, start=None, end=None, month=0):
     """
     Получает данные с сайта преобразует в красивый словарь
 
+    :param session: сессия пользователя
     :param start: получение данных о календаре с этой даты
     :param end: получение данных о календаре до этой даты
     :param month: либо -1, либо 1. Соответственно предыдущий или следующий месяц. Если 0, то берём текущий месяц
+    :raise TokenRejectedError: если сервер не принял токен
+    :raise EAServerError: если сервер ответил другой ошибкой
     :return: красивый словарь с данными о календаре
     """
     if not start and not end:
@@ -292,6 +486,7 @@ def get_calendar_data(start=None, end=None, month=0):
     start += relativedelta(months=month)
     end += relativedelta(months=month)
 
-    response = get_calendar_data_from_website({'eduapp_jwt': config.EDUAPP_JWT}, start, end)
-
-    return calendar_data_to_good_json(response)
+    response = get_calendar_data_from_website(session, start, end)
+    check_server_response(response)
+    return calendar_lessons_to_good_json(iter_calendar_lessons(session, start, end, response),
+                                         session.timezone)
@@ -0,0 +1,395 @@
+"""
+Метрики работы бота.
+
+Метрики хранятся в памяти процесса в общем реестре :data:`metrics`. Код, который что-то
+замеряет, создаёт метрику один раз при импорте модуля, а дальше только увеличивает её значения -
+это дёшево и потокобезопасно. Значения, которые уже считаются в другом месте (очередь отправки,
+статистика кэшей), не дублируются: реестр читает их функцией в момент выгрузки.
+
+Реестр выгружает все метрики в текстовом формате Prometheus (:meth:`MetricsRegistry.render`),
+HTTP-сервер и периодическая сводка в логе - в :mod:`bot.monitoring`
+"""
+
+import bisect
+import contextlib
+import dataclasses
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import config
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+#: Значения меток одного ряда метрики, в порядке имён меток
+Labels = Tuple[str, ...]
+
+#: Строка выгрузки: суффикс имени, метки, значение
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def escape_label(value: str) -> str:
+    """
+    :param value: значение метки
+    :return: значение, экранированное для формата Prometheus
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    """
+    :param name: имя ряда
+    :param labels: метки ряда
+    :param value: значение
+    :return: строка выгрузки в формате Prometheus
+    """
+    if labels:
+        name += '{' + ','.join(f'{key}="{escape_label(str(label))}"'
+                               for key, label in labels.items()) + '}'
+    return f'{name} {value!r}' if isinstance(value, float) else f'{name} {value}'
+
+
+class Metric(ABC):
+    """
+    Базовый абстрактный класс метрики с метками
+    """
+
+    kind = GAUGE
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        """
+        :param name: имя метрики
+        :param documentation: описание метрики
+        :param label_names: имена меток
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def get_labels(self, values: Labels) -> Dict[str, str]:
+        """
+        :param values: значения меток
+        :return: метки по именам
+        """
+        return dict(zip(self.label_names, values))
+
+    @abstractmethod
+    def samples(self) -> Iterator[Sample]:
+        """
+        :return: строки выгрузки метрики
+        """
+
+
+class Counter(Metric):
+    """
+    Счётчик, который только растёт
+    """
+
+    kind = COUNTER
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """
+        Увеличивает счётчик
+
+        :param labels: значения меток
+        :param amount: на сколько увеличить
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> Dict[Labels, float]:
+        """
+        :return: значения счётчика по значениям меток
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> Iterator[Sample]:
+        for labels, value in sorted(self.snapshot().items()):
+            yield '', self.get_labels(labels), value
+
+
+@dataclasses.dataclass
+class HistogramData:
+    """
+    Значения одного ряда гистограммы
+    """
+
+    #: Количество наблюдений в каждом интервале, последний - выше всех границ
+    buckets: List[int]
+
+    #: Сумма наблюдений
+    total: float = 0.0
+
+    #: Количество наблюдений
+    count: int = 0
+
+    def __sub__(self, other: 'HistogramData') -> 'HistogramData':
+        return HistogramData([a - b for a, b in zip(self.buckets, other.buckets)],
+                             self.total - other.total, self.count - other.count)
+
+    def quantile(self, q: float, bounds: Sequence[float]) -> float:
+        """
+        Оценка квантиля сверху: граница интервала, в который попал квантиль
+
+        :param q: квантиль, от 0 до 1
+        :param bounds: границы интервалов гистограммы
+        :return: оценка или бесконечность, если квантиль выше всех границ
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Histogram(Metric):
+    """
+    Гистограмма длительностей, например времени обработки сообщений
+    """
+
+    kind = HISTOGRAM
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 bounds: Sequence[float] = config.METRICS_LATENCY_BUCKETS) -> None:
+        """
+        :param name: имя метрики
+        :param documentation: описание метрики
+        :param label_names: имена меток
+        :param bounds: верхние границы интервалов, по возрастанию
+        """
+        super().__init__(name, documentation, label_names)
+        self.bounds = tuple(bounds)
+        self._values: Dict[Labels, HistogramData] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """
+        Добавляет наблюдение
+
+        :param value: значение, например длительность в секундах
+        :param labels: значения меток
+        """
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = HistogramData([0] * (len(self.bounds) + 1))
+            data.buckets[index] += 1
+            data.total += value
+            data.count += 1
+
+    @contextlib.contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """
+        Замеряет длительность блока ``with``, в том числе завершившегося исключением
+
+        :param labels: значения меток
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def snapshot(self) -> Dict[Labels, HistogramData]:
+        """
+        :return: копии значений гистограммы по значениям меток
+        """
+        with self._lock:
+            return {labels: dataclasses.replace(data, buckets=list(data.buckets))
+                    for labels, data in self._values.items()}
+
+    def samples(self) -> Iterator[Sample]:
+        for labels, data in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), data.buckets):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                yield '_bucket', dict(self.get_labels(labels), le=le), cumulative
+            yield '_sum', self.get_labels(labels), data.total
+            yield '_count', self.get_labels(labels), data.count
+
+
+class CollectedMetric(Metric):
+    """
+    Метрика, значения которой читаются функцией в момент выгрузки
+    """
+
+    def __init__(self, name: str, documentation: str,
+                 collect: Callable[[], Union[float, Dict[Labels, float]]],
+                 label_names: Sequence[str] = (), kind: str = GAUGE) -> None:
+        """
+        :param name: имя метрики
+        :param documentation: описание метрики
+        :param collect: функция, возвращающая значение или, если есть метки,
+            значения по значениям меток
+        :param label_names: имена меток
+        :param kind: тип метрики: :data:`GAUGE` или :data:`COUNTER`
+        """
+        super().__init__(name, documentation, label_names)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> Iterator[Sample]:
+        values = self.collect()
+        if not self.label_names:
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            yield '', self.get_labels(labels), value
+
+
+def get_cache_stats(cache) -> Dict[str, int]:
+    """
+    Статистика кэша: у кэшей бота это поля ``hits``, ``misses`` и, у кэша HTTP-ответов,
+    ``revalidated``, у :func:`functools.lru_cache` - ``cache_info()``
+
+    :param cache: кэш
+    :return: количество обращений по результату: ``hit``, ``miss``, ``revalidated``
+    """
+    if hasattr(cache, 'cache_info'):
+        info = cache.cache_info()
+        return {'hit': info.hits, 'miss': info.misses}
+    stats = {'hit': cache.hits, 'miss': cache.misses}
+    if hasattr(cache, 'revalidated'):
+        stats['revalidated'] = cache.revalidated
+    return stats
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._caches: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.collected_counter('cache_requests_total', 'Обращения к кэшам по результату',
+                               self._collect_caches, ('cache', 'result'))
+
+    def _add(self, metric: Metric, replace: bool = False) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not replace:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f'Метрика {metric.name} уже зарегистрирована с другими метками')
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        """
+        Создаёт счётчик или возвращает уже созданный
+
+        :param name: имя метрики
+        :param documentation: описание метрики
+        :param label_names: имена меток
+        :return: счётчик
+        """
+        return self._add(Counter(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  bounds: Sequence[float] = config.METRICS_LATENCY_BUCKETS) -> Histogram:
+        """
+        Создаёт гистограмму или возвращает уже созданную
+
+        :param name: имя метрики
+        :param documentation: описание метрики
+        :param label_names: имена меток
+        :param bounds: верхние границы интервалов
+        :return: гистограмма
+        """
+        return self._add(Histogram(name, documentation, label_names, bounds))
+
+    def gauge(self, name: str, documentation: str,
+              collect: Callable[[], Union[float, Dict[Labels, float]]],
+              label_names: Sequence[str] = ()) -> CollectedMetric:
+        """
+        Регистрирует метрику, значения которой читаются функцией. Метрика с тем же именем
+        заменяется - например, когда пересоздан объект, из которого читаются значения
+
+        :param name: имя метрики
+        :param documentation: описание метрики
+        :param collect: функция, возвращающая значение или значения по значениям меток
+        :param label_names: имена меток
+        :return: метрика
+        """
+        return self._add(CollectedMetric(name, documentation, collect, label_names), replace=True)
+
+    def collected_counter(self, name: str, documentation: str,
+                          collect: Callable[[], Union[float, Dict[Labels, float]]],
+                          label_names: Sequence[str] = ()) -> CollectedMetric:
+        """
+        Регистрирует счётчик, значения которого уже считаются в другом месте
+        и читаются функцией. См. :meth:`gauge`
+
+        :param name: имя метрики
+        :param documentation: описание метрики
+        :param collect: функция, возвращающая значение или значения по значениям меток
+        :param label_names: имена меток
+        :return: метрика
+        """
+        return self._add(CollectedMetric(name, documentation, collect, label_names, COUNTER),
+                         replace=True)
+
+    def add_cache(self, name: str, cache) -> None:
+        """
+        Добавляет статистику кэша в метрику ``cache_requests_total``, см. :func:`get_cache_stats`
+
+        :param name: имя кэша в метке ``cache``
+        :param cache: кэш
+        """
+        with self._lock:
+            self._caches[name] = cache
+
+    def get(self, name: str) -> Optional[Metric]:
+        """
+        :param name: имя метрики
+        :return: метрика или `None`
+        """
+        return self._metrics.get(name)
+
+    def get_cache_hit_rates(self) -> Dict[str, float]:
+        """
+        :return: доля попаданий в каждый кэш, к которому обращались
+        """
+        rates = {}
+        for name, cache in sorted(self._caches.items()):
+            stats = get_cache_stats(cache)
+            total = sum(stats.values())
+            if total:
+                rates[name] = stats['hit'] / total
+        return rates
+
+    def _collect_caches(self) -> Dict[Labels, float]:
+        values = {}
+        for name, cache in list(self._caches.items()):
+            for result, count in get_cache_stats(cache).items():
+                values[(name, result)] = count
+        return values
+
+    def render(self) -> str:
+        """
+        :return: все метрики в текстовом формате Prometheus
+        """
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda item: item.name):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(format_sample(metric.name + suffix, labels, value)
+                         for suffix, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+#: Общий реестр метрик
+metrics = MetricsRegistry()
@@ -1,12 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 import requests
 
-import bot.bot_states
 import config
-from eduapp.main import get_datetime_from_ea_string
+from eduapp.cache import TTLCache
+from eduapp.client import ea_client
+from eduapp.exceptions import EAConnectionError, TokenRejectedError
+from eduapp.metrics import metrics
+from eduapp.timestamps import parse_ea_datetime
+from eduapp.sessions import EASession
 from eduapp.urls import EAUrls
 
 
@@ -28,9 +32,18 @@ class EaQuestionResponseStatus:
     error: str = ''
 
 
+#: Разобранные страницы обсуждений по ключу (пользователь, номер страницы)
+question_page_cache = TTLCache(max_size=config.EDUAPP_QUESTIONS_CACHE_SIZE,
+                               ttl=config.EDUAPP_QUESTIONS_TTL)
+metrics.add_cache('question_pages', question_page_cache)
+
+_discussion_executor = ThreadPoolExecutor(max_workers=config.EDUAPP_PAGE_WORKERS,
+                                          thread_name_prefix='eduapp-discussions')
+
+
 def get_concrete_questions_page(questions_data: List[dict], page_number: int) -> List[dict]:
-    start_question_index = (page_number - 1) * 5
-    finish_question_index = page_number * 5
+    start_question_index = (page_number - 1) * config.EDUAPP_QUESTIONS_PAGE_SIZE
+    finish_question_index = page_number * config.EDUAPP_QUESTIONS_PAGE_SIZE
     if start_question_index >= len(questions_data):
         raise RuntimeError('Некорректный номер страницы')
     return questions_data[start_question_index: finish_question_index]
@@ -48,12 +61,60 @@ def get_teacher(question) -> str:
     return f'{first_name} {last_name}'
 
 
-def get_question_page_json(page=1) -> EaQuestionResponseStatus:
-    cookies = {'eduapp_jwt': config.EDUAPP_JWT}
-    response = requests.get(EAUrls.QUESTION_URL, cookies=cookies)
+def get_question_page_json(session: EASession, page=1) -> EaQuestionResponseStatus:
+    """
+    Возвращает страницу обсуждений пользователя: из кэша или с сервера
+
+    :param session: сессия пользователя
+    :param page: номер страницы, начиная с 1
+    :return: статус с разобранной страницей или с описанием ошибки
+    """
+    key = (session.user_id, page)
+    data = question_page_cache.get(key)
+    if data is not None:
+        return EaQuestionResponseStatus(success=True, data=data)
+    status = fetch_question_page(session, page)
+    if status.success:
+        question_page_cache.put(key, status.data)
+    return status
+
+
+def fetch_question_page(session: EASession, page=1) -> EaQuestionResponseStatus:
+    """
+    Запрашивает с сервера только нужную страницу обсуждений
+
+    :param session: сессия пользователя
+    :param page: номер страницы, начиная с 1
+    :return: статус с разобранной страницей или с описанием ошибки
+    """
+    page_size = config.EDUAPP_QUESTIONS_PAGE_SIZE
+    url = EAUrls.get_question_page_url((page - 1) * page_size, page_size)
+    try:
+        response = ea_client.get(url, token=session.token)
+    except EAConnectionError as ex:
+        return EaQuestionResponseStatus(False, {}, str(ex))
+    return parse_question_page_response(response, page, session.timezone)
+
+
+def parse_question_page_response(response, page,
+                                 timezone: Optional[str] = None) -> EaQuestionResponseStatus:
+    """
+    Разбирает ответ сервера со страницей обсуждений
+
+    :param response: ответ сервера
+    :param page: номер страницы, начиная с 1
+    :param timezone: часовой пояс пользователя
+    :return: статус с разобранной страницей или с описанием ошибки
+    """
+    # pylint: disable=E1101
+    if response.status_code in (requests.codes.unauthorized, requests.codes.forbidden):
+        return EaQuestionResponseStatus(False, {}, TokenRejectedError.message)
     if response.status_code != requests.codes.ok:
         return EaQuestionResponseStatus(False, {}, 'Пришёл некорректный ответ от сервера')
-    questions = response.json().get('results', None)
+    jsn = response.json()
+    questions = jsn.get('results', None)
+    if not questions and page > 1:
+        return EaQuestionResponseStatus(False, {}, 'Некорректный номер страницы')
     if not questions:
         return EaQuestionResponseStatus(
             success=False,
@@ -63,7 +124,7 @@ def get_question_page_json(page=1) -> EaQuestionResponseStatus:
                   'Обратитесь к администратору'
         )
     try:
-        data = parse_questions_json(page, questions)
+        data = parse_questions_json(page, questions, jsn.get('count'), timezone)
     except RuntimeError:
         return EaQuestionResponseStatus(
             success=False,
@@ -73,17 +134,29 @@ def get_question_page_json(page=1) -> EaQuestionResponseStatus:
     return EaQuestionResponseStatus(success=True, data=data)
 
 
-def parse_questions_json(page, questions):
-    questionss = get_concrete_questions_page(questions, page)
-    questions_list = [parse_single_question_json(question) for question in questionss]
-    result = {'page': page, 'real_count': len(questions), 'questions': questions_list}
+def parse_questions_json(page, questions, count=None, timezone: Optional[str] = None):
+    """
+    Разбирает страницу обсуждений
+
+    :param page: номер страницы, начиная с 1
+    :param questions: обсуждения, которые вернул сервер
+    :param count: общее количество обсуждений. Если сервер его не прислал,
+        значит он проигнорировал параметры страницы и вернул все обсуждения сразу
+    :param timezone: часовой пояс пользователя
+    :return: словарь с разобранной страницей
+    """
+    if count is None or len(questions) > config.EDUAPP_QUESTIONS_PAGE_SIZE:
+        count = len(questions)
+        questions = get_concrete_questions_page(questions, page)
+    questions_list = [parse_single_question_json(question, timezone) for question in questions]
+    result = {'page': page, 'real_count': count, 'questions': questions_list}
     return result
 
 
-def parse_single_question_json(question):
+def parse_single_question_json(question, timezone: Optional[str] = None):
     current_question = {
         'id': question['id'],
-        'date': get_datetime_from_ea_string(question['commented_at']),
+        'date': parse_ea_datetime(question['commented_at'], timezone),
         'reason': question['related_text'],
         'first_que': question['preview'],
         'teacher': get_teacher(question)
@@ -91,9 +164,108 @@ def parse_single_question_json(question):
     return current_question
 
 
-def open_question(message):
-    jsn = get_question_page_json(bot.bot_states.QuestionsState.page).data['questions'][int(message.text) % 5 - 1]
-    phrases = requests.get(EAUrls.get_chat_comments_url(jsn['id']),
-                           cookies={'eduapp_jwt': config.EDUAPP_JWT}).json()['results']
-    return jsn, phrases
+def find_question(session: EASession, number: int) -> EaQuestionResponseStatus:
+    """
+    Находит обсуждение по его номеру в списке. Страница списка, на которой
+    пользователь выбрал обсуждение, обычно уже лежит в кэше, и запрос к серверу не нужен
+
+    :param session: сессия пользователя
+    :param number: номер обсуждения в списке, начиная с 1
+    :return: статус с разобранным обсуждением со страницы списка или с описанием ошибки
+    """
+    page, index = divmod(number - 1, config.EDUAPP_QUESTIONS_PAGE_SIZE)
+    return pick_question(get_question_page_json(session, page + 1), index)
+
+
+def pick_question(status: EaQuestionResponseStatus, index: int) -> EaQuestionResponseStatus:
+    """
+    :param status: статус со страницей обсуждений
+    :param index: номер обсуждения на странице, начиная с 0
+    :return: статус с разобранным обсуждением или с описанием ошибки,
+        если страница не загрузилась или на ней нет такого обсуждения
+    """
+    if not status.success:
+        return status
+    questions = status.data['questions']
+    if index >= len(questions):
+        return EaQuestionResponseStatus(False, {}, 'Вопроса с таким номером нет')
+    return EaQuestionResponseStatus(True, questions[index])
+
+
+def get_discussion_urls(question: dict) -> List[str]:
+    """
+    Адреса, которые нужно запросить, чтобы открыть обсуждение
+
+    :param question: разобранное обсуждение со страницы списка
+    :return: адреса самого обсуждения и его реплик
+    """
+    return [EAUrls.get_discussion_url(question['id']), EAUrls.get_chat_comments_url(question['id'])]
+
+
+def get_discussion_from_response(response, question: dict,
+                                 timezone: Optional[str] = None) -> dict:
+    """
+    Разбирает ответ с обсуждением. Если сервер не ответил или ответил неожиданно,
+    используется обсуждение со страницы списка
+
+    :param response: ответ сервера на запрос обсуждения
+    :param question: разобранное обсуждение со страницы списка
+    :param timezone: часовой пояс пользователя
+    :return: разобранное обсуждение
+    """
+    # pylint: disable=E1101
+    if response.status_code != requests.codes.ok:
+        return question
+    try:
+        return parse_single_question_json(response.json(), timezone)
+    except (KeyError, RuntimeError):
+        return question
+
+
+def parse_open_question_responses(discussion, comments, question: dict,
+                                  timezone: Optional[str] = None) -> EaQuestionResponseStatus:
+    """
+    Разбирает ответы сервера на запросы обсуждения и его реплик
+
+    :param discussion: ответ сервера на запрос обсуждения
+    :param comments: ответ сервера на запрос реплик
+    :param question: разобранное обсуждение со страницы списка
+    :param timezone: часовой пояс пользователя
+    :return: статус с разобранным обсуждением (``question``) и его репликами (``comments``)
+        или с описанием ошибки
+    """
+    # pylint: disable=E1101
+    if comments.status_code in (requests.codes.unauthorized, requests.codes.forbidden):
+        return EaQuestionResponseStatus(False, {}, TokenRejectedError.message)
+    if comments.status_code != requests.codes.ok:
+        return EaQuestionResponseStatus(False, {}, 'Пришёл некорректный ответ от сервера')
+    try:
+        results = comments.json()['results']
+    except (KeyError, TypeError, ValueError):
+        return EaQuestionResponseStatus(False, {}, 'Произошла ошибка распознавания данных из ЕА')
+    return EaQuestionResponseStatus(True, {
+        'question': get_discussion_from_response(discussion, question, timezone),
+        'comments': results,
+    })
+
+
+def open_question(session: EASession, number: int) -> EaQuestionResponseStatus:
+    """
+    Открывает обсуждение, номер которого выбрал пользователь.
+    Обсуждение и его реплики запрашиваются одновременно
+
+    :param session: сессия пользователя
+    :param number: номер обсуждения в списке, начиная с 1
+    :return: статус с разобранным обсуждением (``question``) и его репликами (``comments``)
+        или с описанием ошибки
+    """
+    status = find_question(session, number)
+    if not status.success:
+        return status
+    try:
+        discussion, comments = _discussion_executor.map(
+            lambda url: ea_client.get(url, token=session.token), get_discussion_urls(status.data))
+    except EAConnectionError as ex:
+        return EaQuestionResponseStatus(False, {}, str(ex))
+    return parse_open_question_responses(discussion, comments, status.data, session.timezone)
 
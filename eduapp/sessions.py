@@ -0,0 +1,231 @@
+"""
+Хранилище сессий пользователей Eduapp
+"""
+
+import base64
+import dataclasses
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import config
+
+
+@dataclasses.dataclass
+class EASession:
+    """
+    Сессия пользователя Eduapp, привязанная к чату телеграма
+    """
+
+    #: Идентификатор чата, из которого пользователь авторизовался
+    chat_id: int
+
+    #: Токен jwt-авторизации
+    token: str
+
+    #: Логин пользователя в Eduapp
+    login: str
+
+    #: Пароль пользователя. Нужен для повторной авторизации и хранится только в памяти процесса:
+    #: у сессии, восстановленной из хранилища, его нет
+    password: Optional[str]
+
+    #: Идентификатор пользователя в Eduapp
+    user_id: Optional[int] = None
+
+    #: Часовой пояс пользователя из его аккаунта, например ``Europe/Moscow``
+    timezone: Optional[str] = None
+
+    #: Момент времени (:func:`time.time`), после которого токен считается устаревшим
+    expires_at: float = 0.0
+
+    #: Момент последнего обращения к сессии
+    last_used_at: float = dataclasses.field(default_factory=time.time)
+
+    #: Раньше этого момента не нужно пытаться обновить токен - предыдущая попытка не удалась
+    refresh_after: float = 0.0
+
+    def is_expired(self) -> bool:
+        """
+        Проверяет, не истёк ли срок действия токена
+
+        :return: `True`, если токен устарел
+        """
+        return time.time() >= self.expires_at
+
+    def to_json(self) -> str:
+        """
+        :return: сессия, сериализованная в JSON, без пароля
+        """
+        data = dataclasses.asdict(self)
+        del data['password']
+        return json.dumps(data, ensure_ascii=False)
+
+    @staticmethod
+    def from_json(data: str) -> 'EASession':
+        """
+        :param data: сессия, сериализованная в JSON
+        :return: сессия пользователя без пароля
+        """
+        fields = json.loads(data)
+        fields['password'] = None
+        return EASession(**fields)
+
+
+class SessionRegistry:
+    """
+    Реестр сессий: по идентификатору чата выдаёт сессию пользователя Eduapp.
+
+    Поиск сессии выполняется за O(1). Количество хранимых сессий ограничено:
+    при переполнении удаляется сессия, которой дольше всех не пользовались.
+    """
+
+    def __init__(self, max_size: int = config.EDUAPP_SESSIONS_MAX_SIZE) -> None:
+        """
+        :param max_size: максимальное количество одновременно хранимых сессий
+        """
+        self.max_size = max_size
+        self._sessions: 'OrderedDict[int, EASession]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: int) -> Optional[EASession]:
+        """
+        Возвращает сессию чата
+
+        :param chat_id: идентификатор чата
+        :return: сессия или `None`, если пользователь не авторизован
+        """
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is not None:
+                self._sessions.move_to_end(chat_id)
+                session.last_used_at = time.time()
+            return session
+
+    def put(self, session: EASession) -> None:
+        """
+        Сохраняет сессию, вытесняя самую давно использованную при переполнении
+
+        :param session: сессия пользователя
+        """
+        with self._lock:
+            self._sessions[session.chat_id] = session
+            self._sessions.move_to_end(session.chat_id)
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+
+    def restore(self, session: EASession) -> EASession:
+        """
+        Кладёт в реестр сессию, сохранённую вне процесса (например, другим процессом бота).
+        Если в реестре уже есть сессия того же пользователя с более свежим токеном
+        (его могли обновить в фоне, см. :mod:`eduapp.tokens`), остаётся она.
+        Пароль из сессии в реестре переносится в сохранённую
+
+        :param session: сохранённая сессия
+        :return: сессия, которая теперь лежит в реестре
+        """
+        with self._lock:
+            current = self._sessions.get(session.chat_id)
+            if current is not None and current.login == session.login and session.password is None:
+                session.password = current.password
+            if current is None or current.login != session.login \
+                    or current.expires_at < session.expires_at:
+                self._sessions[session.chat_id] = current = session
+            self._sessions.move_to_end(session.chat_id)
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+            return current
+
+    def remove(self, chat_id: int) -> None:
+        """
+        Удаляет сессию чата, если она есть
+
+        :param chat_id: идентификатор чата
+        """
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+
+    def expiring(self, deadline: float, active_since: float) -> List[EASession]:
+        """
+        Сессии, токены которых истекут до указанного момента
+
+        :param deadline: момент времени (:func:`time.time`)
+        :param active_since: сессии, которыми не пользовались с этого момента, пропускаются
+        :return: список сессий
+        """
+        now = time.time()
+        with self._lock:
+            return [session for session in self._sessions.values()
+                    if session.expires_at <= deadline and session.refresh_after <= now
+                    and session.last_used_at >= active_since]
+
+    def active(self, active_since: float) -> List[EASession]:
+        """
+        Сессии, которыми пользовались после указанного момента
+
+        :param active_since: момент времени (:func:`time.time`)
+        :return: список сессий, начиная с самой давно использованной
+        """
+        with self._lock:
+            return [session for session in self._sessions.values()
+                    if session.last_used_at >= active_since]
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+def get_token_expiry(token: str) -> Optional[float]:
+    """
+    Достаёт срок действия из jwt-токена. Подпись не проверяется - она нужна серверу, а не нам
+
+    :param token: токен jwt-авторизации
+    :return: момент времени (:func:`time.time`), когда токен истечёт,
+        или `None`, если его не удалось определить
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def get_session_expiry(token: str) -> float:
+    """
+    Срок действия сессии: срок действия токена, а если его нет в токене - :data:`config.EDUAPP_SESSION_TTL`
+
+    :param token: токен jwt-авторизации
+    :return: момент времени (:func:`time.time`), когда сессия устареет
+    """
+    expiry = get_token_expiry(token)
+    return time.time() + config.EDUAPP_SESSION_TTL if expiry is None else expiry
+
+
+def create_session(chat_id: int, login: str, password: str, token: str,
+                   user_id: Optional[int] = None, timezone: Optional[str] = None) -> EASession:
+    """
+    Создаёт сессию после успешной авторизации
+
+    :param chat_id: идентификатор чата
+    :param login: логин пользователя
+    :param password: пароль пользователя
+    :param token: полученный токен
+    :param user_id: идентификатор пользователя в Eduapp
+    :param timezone: часовой пояс пользователя
+    :return: новая сессия
+    """
+    return EASession(
+        chat_id=chat_id,
+        token=token,
+        login=login,
+        password=password,
+        user_id=user_id,
+        timezone=timezone,
+        expires_at=get_session_expiry(token),
+    )
+
+
+#: Общий реестр сессий бота
+sessions = SessionRegistry()
@@ -0,0 +1,50 @@
+"""
+Разбор меток времени из ответов Eduapp.
+
+Сервер отдаёт время в формате ISO 8601 со смещением, например ``2022-03-01T10:00:00+03:00``.
+Смещение сохраняется, а время переводится в часовой пояс пользователя из его аккаунта.
+В календаре одни и те же метки времени повторяются у многих занятий и учеников,
+поэтому результаты разбора запоминаются
+"""
+
+import functools
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from dateutil import tz
+
+import config
+from eduapp.metrics import metrics
+
+
+@functools.lru_cache(maxsize=config.EDUAPP_TIMESTAMPS_CACHE_SIZE)
+def parse_ea_datetime(value: str, timezone: Optional[str] = None) -> datetime:
+    """
+    Разбирает метку времени Eduapp
+
+    :param value: метка времени в формате ISO 8601
+    :param timezone: часовой пояс пользователя, например ``Europe/Moscow``.
+        Если не указан или неизвестен - время остаётся со смещением, которое прислал сервер
+    :return: время с часовым поясом
+    """
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    moment = datetime.fromisoformat(value)
+    user_tz = tz.gettz(timezone) if timezone else None
+    if user_tz is not None and moment.tzinfo is not None:
+        moment = moment.astimezone(user_tz)
+    return moment
+
+
+def parse_ea_datetimes(values: Iterable[str], timezone: Optional[str] = None) -> List[datetime]:
+    """
+    Разбирает сразу все метки времени, например со всей страницы занятий
+
+    :param values: метки времени в формате ISO 8601
+    :param timezone: часовой пояс пользователя
+    :return: время с часовым поясом в том же порядке
+    """
+    return [parse_ea_datetime(value, timezone) for value in values]
+
+
+metrics.add_cache('timestamps', parse_ea_datetime)
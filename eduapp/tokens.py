@@ -0,0 +1,97 @@
+"""
+Фоновое обновление токенов пользователей.
+
+Срок действия токена берётся из самого jwt-токена (см. :func:`eduapp.sessions.get_token_expiry`).
+Незадолго до его истечения сессия авторизуется заново в фоновом потоке,
+так что команды пользователей не ждут авторизации
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+import config
+from eduapp.main import relogin
+from eduapp.sessions import EASession, SessionRegistry, sessions
+
+
+class TokenRefresher:
+    """
+    Фоновый поток, который заранее обновляет истекающие токены сессий.
+
+    Сессии обновляются по одной, а после неудачной попытки следующая делается
+    не раньше чем через :data:`config.EDUAPP_TOKEN_REFRESH_RETRY` - частые
+    повторные авторизации приводят к включению каптчи
+    """
+
+    def __init__(self, registry: SessionRegistry = sessions,
+                 margin: float = config.EDUAPP_TOKEN_REFRESH_MARGIN,
+                 interval: float = config.EDUAPP_TOKEN_REFRESH_INTERVAL,
+                 retry_delay: float = config.EDUAPP_TOKEN_REFRESH_RETRY) -> None:
+        """
+        :param registry: реестр сессий
+        :param margin: за сколько секунд до истечения обновлять токен
+        :param interval: как часто проверять сессии, в секундах
+        :param retry_delay: через сколько секунд повторять неудачное обновление
+        """
+        self.registry = registry
+        self.margin = margin
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh_expiring(self) -> int:
+        """
+        Обновляет токены сессий, которые скоро истекут. Сессии, которыми
+        не пользовались дольше :data:`config.EDUAPP_SESSION_TTL`, не обновляются
+
+        :return: количество успешно обновлённых сессий
+        """
+        now = time.time()
+        expiring = self.registry.expiring(now + self.margin, now - config.EDUAPP_SESSION_TTL)
+        return sum(self.refresh(session) for session in expiring)
+
+    def refresh(self, session: EASession) -> bool:
+        """
+        Обновляет токен сессии
+
+        :param session: сессия пользователя
+        :return: `True`, если токен обновлён
+        """
+        if session.password is None:
+            # Сессия восстановлена из хранилища без пароля: обновить токен может только пользователь
+            session.refresh_after = float('inf')
+            return False
+        status = relogin(session)
+        if not status.success:
+            logging.warning('Не удалось обновить токен чата %s: %s', session.chat_id, status.error)
+            session.refresh_after = time.time() + self.retry_delay
+        return status.success
+
+    def start(self) -> None:
+        """
+        Запускает фоновый поток
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='token-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Останавливает фоновый поток
+        """
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh_expiring()
+            except Exception:  # pylint: disable=W0703
+                logging.exception('Ошибка фонового обновления токенов')
+
+
+#: Общий для бота поток обновления токенов
+token_refresher = TokenRefresher()
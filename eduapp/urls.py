@@ -2,7 +2,7 @@
 Хранилище всех URL системы Eduapp, необходимых для работы бота
 """
 
-from config import EDUAPP_API_URL
+from config import EDUAPP_API_URL, EDUAPP_CALENDAR_PAGE_SIZE, EDUAPP_DISCUSSIONS_SYNC_PAGE_SIZE
 
 
 class EAUrls:
@@ -27,23 +27,40 @@ class EAUrls:
         'orderBy': 'classes__datetime_begin',
         'classes__course__usage__in': 'M,D,B,S',
         'page': '1',
-        'limit': '100'
+        'limit': str(EDUAPP_CALENDAR_PAGE_SIZE)
     }
 
     #: URL для получения информации об обсуждениях пользователя
     QUESTION_URL = EDUAPP_API_URL + '/discussions/'
 
     @staticmethod
-    def get_calendar_data_url(start, end, user_id):
+    def get_calendar_data_url(start, end, user_id, page=1):
         url = EAUrls.CALENDAR_DATA_URL_PATTERN
-        params = EAUrls.CALENDAR_DATA_URL_PARAMS
+        params = dict(EAUrls.CALENDAR_DATA_URL_PARAMS)
         params['classes__datetime_begin__gte'] = str(start.date())
         params['classes__datetime_begin__lte'] = str(end.date())
         params['user_id'] = user_id
+        params['page'] = str(page)
         params_list = [f'{key}={value}' for key, value in params.items()]
         params_url = '&'.join(params_list)
         return f'{url}?{params_url}'
 
+    @staticmethod
+    def get_question_page_url(offset, limit):
+        return f'{EAUrls.QUESTION_URL}?limit={limit}&offset={offset}'
+
+    @staticmethod
+    def get_discussion_url(discussion):
+        return EAUrls.QUESTION_URL + str(discussion) + '/'
+
     @staticmethod
     def get_chat_comments_url(discussion):
         return EAUrls.QUESTION_URL + str(discussion) + '/comments/'
+
+    @staticmethod
+    def get_changed_questions_url(offset, limit=EDUAPP_DISCUSSIONS_SYNC_PAGE_SIZE):
+        return f'{EAUrls.QUESTION_URL}?ordering=-commented_at&limit={limit}&offset={offset}'
+
+    @staticmethod
+    def get_new_comments_url(discussion, offset, limit=EDUAPP_DISCUSSIONS_SYNC_PAGE_SIZE):
+        return f'{EAUrls.get_chat_comments_url(discussion)}?limit={limit}&offset={offset}'
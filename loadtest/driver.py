@@ -0,0 +1,260 @@
+"""
+Нагрузочный тест бота.
+
+Поднимает локальную замену Eduapp (:mod:`loadtest.mock_eduapp`) и прогоняет через настоящие
+состояния и хэндлеры бота сценарии нескольких одновременных пользователей. Обновления телеграма
+подаются через те же планировщики, что и в работающем боте (:mod:`bot.scheduler`). Каждый
+пользователь отправляет следующее сообщение, как только бот обработал предыдущее, поэтому
+количество пользователей - это количество одновременно обрабатываемых диалогов.
+
+Запуск::
+
+    python -m loadtest.driver --users 200 --engine async --latency 0.05
+
+В отчёте - задержка обработки обновления (от постановки в очередь до конца обработки)
+по шагам сценария и в целом, пропускная способность и статистика кэшей
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from telebot.types import Message
+
+from loadtest.mock_eduapp import MockServer, MockSettings
+
+#: Вход в бота: тексты сообщений по порядку, ``{login}`` и ``{password}`` подставляются
+LOGIN_SCENARIO = ('/start', 'Авторизация', '{login}', '{password}')
+
+#: Действия пользователя после входа. Повторяются несколько раз
+BROWSE_SCENARIO = (
+    'Профиль',
+    'Календарь',
+    'Расписание на текущий месяц',
+    'Расписание на следующий месяц',
+    'Расписание на предыдущий месяц',
+    'Назад',
+    'Вопросы',
+    'Отобразить следующие пять вопросов',
+    'Открыть вопрос',
+    '7',
+    'Назад',
+    'Назад',
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Перцентиль по ближайшему рангу
+
+    :param values: значения
+    :param q: перцентиль, от 0 до 100
+    :return: значение, не меньше которого ``q`` процентов значений
+    """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def make_message(chat_id: int, message_id: int, text: str) -> Message:
+    """
+    Сообщение пользователя в том виде, в котором его присылает телеграм
+
+    :param chat_id: идентификатор чата
+    :param message_id: номер сообщения в чате
+    :param text: текст сообщения
+    :return: сообщение
+    """
+    return Message.de_json({
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Ученик', 'username': f'user{chat_id}'},
+        'text': text,
+    })
+
+
+class LoadDriver:
+    """
+    Подаёт сообщения пользователей в планировщик и замеряет задержку их обработки
+    """
+
+    def __init__(self, users: int, rounds: int, password: str) -> None:
+        """
+        :param users: количество пользователей
+        :param rounds: сколько раз каждый пользователь повторяет :data:`BROWSE_SCENARIO`
+        :param password: пароль пользователей на сервере
+        """
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors = 0
+        self._scripts: Dict[int, List[Tuple[str, str]]] = {}
+        for chat_id in range(1, users + 1):
+            steps = [(text, text.format(login=f'user{chat_id}', password=password))
+                     for text in LOGIN_SCENARIO + BROWSE_SCENARIO * rounds]
+            self._scripts[chat_id] = steps[::-1]
+        self._submitted: Dict[int, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def first_messages(self) -> List[Message]:
+        """
+        :return: первые сообщения всех пользователей
+        """
+        return [message for message in map(self.next_message, list(self._scripts)) if message]
+
+    def next_message(self, chat_id: int) -> Optional[Message]:
+        """
+        Следующее сообщение пользователя. Время его постановки в очередь запоминается
+
+        :param chat_id: идентификатор чата пользователя
+        :return: сообщение или `None`, если сценарий пользователя закончился
+        """
+        with self._lock:
+            script = self._scripts[chat_id]
+            if not script:
+                return None
+            step, text = script.pop()
+            self._submitted[chat_id] = (step, time.perf_counter())
+            return make_message(chat_id, len(script), text)
+
+    def done(self, message: Message, error: bool) -> Optional[Message]:
+        """
+        Отмечает, что сообщение обработано
+
+        :param message: сообщение
+        :param error: обработка завершилась исключением
+        :return: следующее сообщение пользователя или `None`
+        """
+        finished = time.perf_counter()
+        with self._lock:
+            step, submitted = self._submitted.pop(message.chat.id)
+            self.latencies[step].append(finished - submitted)
+            self.errors += error
+        return self.next_message(message.chat.id)
+
+    def run_sync(self, engine) -> None:
+        """
+        Прогоняет сценарии через синхронный движок и пул потоков планировщика
+
+        :param engine: движок с :class:`bot.engine.SyncEduapp`
+        """
+        from bot.scheduler import ChatScheduler  # pylint: disable=C0415
+
+        def process(message: Message) -> None:
+            error = False
+            try:
+                asyncio.run(engine.process_update(message))
+            except Exception:  # pylint: disable=W0703
+                logging.exception('Ошибка обработки сообщения')
+                error = True
+            following = self.done(message, error)
+            if following is not None:
+                scheduler.submit(following)
+
+        scheduler = ChatScheduler(process, max_pending=len(self._scripts) + 1)
+        for message in self.first_messages():
+            scheduler.submit(message)
+        scheduler.shutdown()
+
+    async def run_async(self, engine) -> None:
+        """
+        Прогоняет сценарии через асинхронный движок и его планировщик
+
+        :param engine: движок с :mod:`eduapp.async_api`
+        """
+        from bot.scheduler import AsyncChatScheduler  # pylint: disable=C0415
+
+        async def process(message: Message) -> None:
+            error = False
+            try:
+                await engine.process_update(message)
+            except Exception:  # pylint: disable=W0703
+                logging.exception('Ошибка обработки сообщения')
+                error = True
+            following = self.done(message, error)
+            if following is not None:
+                scheduler.submit(following)
+
+        scheduler = AsyncChatScheduler(process, max_pending=len(self._scripts) + 1)
+        for message in self.first_messages():
+            scheduler.submit(message)
+        await scheduler.join()
+
+    def report(self, elapsed: float) -> str:
+        """
+        :param elapsed: время прогона, в секундах
+        :return: таблица задержек по шагам сценария и итог
+        """
+        lines = [f'{"шаг":<40} {"кол-во":>7} {"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9}']
+        rows = list(self.latencies.items()) + [('ВСЕГО', sum(self.latencies.values(), []))]
+        for step, values in rows:
+            lines.append(f'{step:<40} {len(values):>7} ' + ' '.join(
+                f'{percentile(values, q) * 1000:>9.1f}' for q in (50, 95, 99)))
+        total = len(rows[-1][1])
+        lines.append(f'Обработано {total} обновлений за {elapsed:.2f} с: '
+                     f'{total / elapsed:.1f} обновлений/с, необработанных ошибок: {self.errors}')
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота на локальной замене Eduapp')
+    parser.add_argument('--users', type=int, default=100, help='количество одновременных пользователей')
+    parser.add_argument('--rounds', type=int, default=3, help='сколько раз повторить сценарий после входа')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='async', help='движок бота')
+    parser.add_argument('--latency', type=float, default=MockSettings.latency,
+                        help='средняя задержка ответа сервера, в секундах')
+    parser.add_argument('--error-rate', type=float, default=MockSettings.error_rate,
+                        help='доля ответов сервера с ошибкой 503')
+    parser.add_argument('--eduapp-url', help='адрес уже запущенной замены Eduapp. '
+                                             'По умолчанию она запускается в этом же процессе')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='[%(levelname)s] %(asctime)s: %(message)s')
+
+    settings = MockSettings(latency=args.latency, error_rate=args.error_rate)
+    server = None
+    if args.eduapp_url is None:
+        server = MockServer(settings)
+        server.start()
+    # Адрес Eduapp читается из окружения при импорте config, поэтому модули бота
+    # импортируются только после запуска сервера
+    os.environ['EDUAPP_BASE_URL'] = args.eduapp_url or server.url
+    # pylint: disable=C0415
+    import eduapp.async_api
+    from bot.engine import SyncEduapp, update_errors
+    from eduapp.http_cache import response_cache
+    from loadtest.engine import LoadEngine
+    from ui.cache import render_cache
+
+    driver = LoadDriver(args.users, args.rounds, settings.password)
+    started = time.perf_counter()
+    if args.engine == 'async':
+        engine = LoadEngine(eduapp.async_api)
+
+        async def run_async():
+            try:
+                await driver.run_async(engine)
+            finally:
+                await eduapp.async_api.async_ea_client.close()
+
+        asyncio.run(run_async())
+    else:
+        engine = LoadEngine(SyncEduapp)
+        driver.run_sync(engine)
+    print(driver.report(time.perf_counter() - started))
+    print(f'Ответов бота: {engine.replies}, '
+          f'ошибок обработки: {int(sum(update_errors.snapshot().values()))}')
+    print(f'HTTP-кэш: {response_cache.hits} свежих, {response_cache.revalidated} подтверждено 304, '
+          f'{response_cache.misses} загружено целиком')
+    print(f'Кэш сообщений: {render_cache.hit_rate:.0%} попаданий')
+    if server is not None:
+        # Сервер не останавливается явно: после обработки сообщений ещё могут догружаться
+        # соседние месяцы календаря, а поток сервера завершится вместе с процессом
+        print(f'Сервер: {server.stats}')
+
+
+if __name__ == '__main__':
+    main()
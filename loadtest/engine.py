@@ -0,0 +1,33 @@
+"""
+Движок бота для нагрузочного теста: сообщения обрабатываются настоящими состояниями
+и хэндлерами, а ответы бота в телеграм не отправляются, а только считаются
+"""
+
+from typing import List
+
+from bot.engine import BotEngine
+from bot.outbox import OutgoingMessage
+from bot.state_store import MemoryStateStore
+
+
+class LoadEngine(BotEngine):
+    """
+    Движок без телеграм-бота
+    """
+
+    def __init__(self, ea) -> None:
+        """
+        :param ea: API Eduapp: :class:`bot.engine.SyncEduapp` или :mod:`eduapp.async_api`
+        """
+        super().__init__(tele_bot=None, state_store=MemoryStateStore())
+        self.ea = ea
+        self.replies = 0
+
+    async def send(self, reply: OutgoingMessage) -> None:
+        self.replies += 1
+
+    async def flush(self, messages: List[OutgoingMessage]) -> None:
+        pass
+
+    async def answer_callback_query(self, callback_query_id):
+        pass
@@ -0,0 +1,347 @@
+"""
+Локальная замена сервера Eduapp для нагрузочного тестирования.
+
+Отвечает на те же запросы, что и настоящий сервер: авторизация, аккаунт, календарь,
+обсуждения и их реплики. Данные синтетические и зависят только от номера пользователя,
+поэтому повторные запуски дают одинаковые ответы. Войти можно под любым логином вида
+``user<номер>`` с паролем из :attr:`MockSettings.password`.
+
+Задержка ответа и доля ответов с ошибкой ``503`` настраиваются. Списки обсуждений
+и реплик отдаются с ``ETag`` и отвечают ``304`` на условные запросы.
+
+Запуск::
+
+    python -m loadtest.mock_eduapp --port 8800 --latency 0.05 --error-rate 0.01
+
+Бот направляется на этот сервер переменной окружения ``EDUAPP_BASE_URL=http://127.0.0.1:8800``
+"""
+
+import argparse
+import asyncio
+import base64
+import dataclasses
+import functools
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from aiohttp import web
+
+API_PREFIX = '/api/v1'
+
+COURSES = ('Python', 'Алгоритмы', 'Веб-разработка', 'Анализ данных', 'Олимпиадное программирование')
+THEMES = ('Циклы', 'Функции', 'Словари', 'Рекурсия', 'Сортировки', 'Графы', 'Классы', 'Файлы')
+MOSCOW = timezone(timedelta(hours=3))
+#: Идентификатор преподавателя, отвечающего в обсуждениях. Номера учеников неотрицательны
+TEACHER_ID = -1
+
+
+@dataclasses.dataclass
+class MockSettings:
+    """
+    Настройки сервера
+    """
+
+    #: Средняя задержка ответа, в секундах
+    latency: float = 0.05
+
+    #: Разброс задержки относительно средней: 0.5 - от половины до полутора средних
+    jitter: float = 0.5
+
+    #: Доля ответов с ошибкой ``503 Service Unavailable``
+    error_rate: float = 0.0
+
+    #: Пароль всех пользователей
+    password: str = 'password'
+
+    #: Сколько обсуждений у каждого пользователя
+    discussions: int = 12
+
+    #: Сколько реплик в каждом обсуждении
+    comments: int = 15
+
+    #: Время жизни выданных токенов, в секундах
+    token_ttl: float = 3600
+
+
+def make_token(user_id: int, ttl: float) -> str:
+    """
+    Токен в формате jwt: бот читает из него только срок действия, подпись не проверяется
+
+    :param user_id: номер пользователя
+    :param ttl: время жизни токена, в секундах
+    :return: токен
+    """
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+    return f'{encode({"alg": "none"})}.{encode({"user_id": user_id, "exp": time.time() + ttl})}.mock'
+
+
+def get_token_user(token: Optional[str]) -> Optional[int]:
+    """
+    :param token: токен из куки ``eduapp_jwt``
+    :return: номер пользователя или `None`, если токен не подходит или истёк
+    """
+    try:
+        payload = token.split('.')[1]
+        data = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return None
+    if data.get('exp', 0) < time.time():
+        return None
+    return data.get('user_id')
+
+
+def get_day_lessons(user_id: int, day: date) -> List[dict]:
+    """
+    Занятия пользователя за день в том виде, в котором их отдаёт сервер
+
+    :param user_id: номер пользователя
+    :param day: день
+    :return: занятия
+    """
+    rng = random.Random(user_id * 100003 + day.toordinal())
+    lessons = []
+    for number in range(rng.choice((0, 0, 0, 1, 1, 2))):
+        begin = datetime(day.year, day.month, day.day, 10 + 3 * number, tzinfo=MOSCOW)
+        course = rng.choice(COURSES)
+        attendances = []
+        if begin.date() < date.today():
+            attendances = [{'is_begun': True, 'status': 'н' if rng.random() < 0.1 else 'п'}]
+        lessons.append({
+            'classes': {
+                'date_of': day.isoformat(),
+                'datetime_begin': begin.isoformat(),
+                'datetime_end': (begin + timedelta(minutes=90)).isoformat(),
+                'course': {'simplest_name': course, 'diary_type': 'D' if course == 'Python' else 'B'},
+                'classes_lessons': [{'lesson': {'name': rng.choice(THEMES)}}] if rng.random() < 0.8 else [],
+            },
+            'pupil_attendances': attendances,
+        })
+    return lessons
+
+
+@functools.lru_cache(maxsize=10000)
+def get_discussions(user_id: int, count: int, comments: int) -> List[dict]:
+    """
+    Обсуждения пользователя в том виде, в котором их отдаёт сервер, с репликами
+
+    :param user_id: номер пользователя
+    :param count: сколько обсуждений
+    :param comments: сколько реплик в каждом
+    :return: обсуждения, у каждого в поле ``comments`` - его реплики
+    """
+    rng = random.Random(user_id)
+    now = datetime.now(MOSCOW).replace(microsecond=0)
+    discussions = []
+    for number in range(count):
+        theme = rng.choice(THEMES)
+        replies = [{
+            'author': {'id': user_id, 'username': f'user{user_id}'} if index % 2 == 0
+                      else {'id': TEACHER_ID, 'username': 'teacher'},
+            'message': f'{"Вопрос" if index % 2 == 0 else "Ответ"} про {theme.lower()} №{index + 1}',
+        } for index in range(comments)]
+        discussions.append({
+            'id': user_id * 1000 + number,
+            'commented_at': (now - timedelta(hours=number * 7 + rng.randint(0, 6))).isoformat(),
+            'related_text': f'{rng.choice(COURSES)}: {theme}',
+            'preview': replies[0]['message'] if replies else '',
+            'discussion_users': [
+                {'is_client': True, 'user': {'first_name': 'Ученик', 'last_name': str(user_id)}},
+                {'is_client': False, 'user': {'first_name': 'Мария', 'last_name': 'Преподавателева'}},
+            ],
+            'comments': replies,
+        })
+    return discussions
+
+
+def get_page(request: web.Request, items: list) -> web.Response:
+    """
+    Страница списка по параметрам ``limit``/``offset`` или ``page``/``limit``
+    с ``ETag`` и ответом ``304`` на условный запрос
+    """
+    limit = int(request.query.get('limit', 100))
+    if 'offset' in request.query:
+        offset = int(request.query['offset'])
+    else:
+        offset = (int(request.query.get('page', 1)) - 1) * limit
+    body = json.dumps({'count': len(items), 'next': None, 'results': items[offset:offset + limit]},
+                      ensure_ascii=False).encode()
+    etag = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={'ETag': etag})
+    return web.Response(body=body, content_type='application/json',
+                        headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+
+def create_app(settings: MockSettings) -> web.Application:
+    """
+    Приложение сервера
+
+    :param settings: настройки сервера
+    :return: приложение aiohttp
+    """
+    stats = {'requests': 0, 'errors': 0, 'not_modified': 0}
+
+    @web.middleware
+    async def simulate(request: web.Request, handler) -> web.StreamResponse:
+        stats['requests'] += 1
+        await asyncio.sleep(random.uniform(settings.latency * (1 - settings.jitter),
+                                           settings.latency * (1 + settings.jitter)))
+        if random.random() < settings.error_rate:
+            stats['errors'] += 1
+            return web.json_response({'detail': 'Service Unavailable'}, status=503)
+        response = await handler(request)
+        if response.status == 304:
+            stats['not_modified'] += 1
+        return response
+
+    def get_user(request: web.Request) -> int:
+        user_id = get_token_user(request.cookies.get('eduapp_jwt'))
+        if user_id is None:
+            raise web.HTTPUnauthorized(text='{"detail": "Invalid token"}', content_type='application/json')
+        return user_id
+
+    async def login(request: web.Request) -> web.Response:
+        form = await request.post()
+        match = re.fullmatch(r'user(\d+)', form.get('username', ''))
+        if match is None or form.get('password') != settings.password:
+            return web.json_response({'non_field_errors': ['Неверный логин или пароль']}, status=400)
+        return web.json_response({'token': make_token(int(match.group(1)), settings.token_ttl)})
+
+    async def account(request: web.Request) -> web.Response:
+        user_id = get_user(request)
+        return web.json_response({
+            'id': user_id, 'first_name': 'Ученик', 'last_name': f'Тестовый {user_id}',
+            'patronymic': '', 'contact_number': '', 'email': f'user{user_id}@example.com',
+            'timezone': 'Europe/Moscow',
+        })
+
+    async def calendar(request: web.Request) -> web.Response:
+        user_id = get_user(request)
+        start = date.fromisoformat(request.query['classes__datetime_begin__gte'])
+        end = date.fromisoformat(request.query['classes__datetime_begin__lte'])
+        lessons = []
+        for offset in range((end - start).days + 1):
+            lessons.extend(get_day_lessons(user_id, start + timedelta(days=offset)))
+        return get_page(request, lessons)
+
+    def find_discussion(request: web.Request) -> dict:
+        user_id = get_user(request)
+        discussion_id = int(request.match_info['discussion'])
+        for discussion in get_discussions(user_id, settings.discussions, settings.comments):
+            if discussion['id'] == discussion_id:
+                return discussion
+        raise web.HTTPNotFound()
+
+    async def discussions(request: web.Request) -> web.Response:
+        user_id = get_user(request)
+        items = [{key: value for key, value in discussion.items() if key != 'comments'}
+                 for discussion in get_discussions(user_id, settings.discussions, settings.comments)]
+        if request.query.get('ordering') == 'commented_at':
+            items.reverse()
+        return get_page(request, items)
+
+    async def discussion(request: web.Request) -> web.Response:
+        found = find_discussion(request)
+        return web.json_response({key: value for key, value in found.items() if key != 'comments'})
+
+    async def comments(request: web.Request) -> web.Response:
+        return get_page(request, find_discussion(request)['comments'])
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application(middlewares=[simulate])
+    app['stats'] = stats
+    app.router.add_post(API_PREFIX + '/rest-auth/login/', login)
+    app.router.add_get(API_PREFIX + '/account/', account)
+    app.router.add_get(API_PREFIX + '/teaching_situation/classes_users/extended/', calendar)
+    app.router.add_get(API_PREFIX + '/discussions/', discussions)
+    app.router.add_get(API_PREFIX + '/discussions/{discussion:\\d+}/', discussion)
+    app.router.add_get(API_PREFIX + '/discussions/{discussion:\\d+}/comments/', comments)
+    app.router.add_get('/stats/', get_stats)
+    return app
+
+
+class MockServer:
+    """
+    Сервер в фоновом потоке со своим event loop. Нужен нагрузочному тесту,
+    который запускает сервер в том же процессе, что и бота
+    """
+
+    def __init__(self, settings: MockSettings, host: str = '127.0.0.1', port: int = 0) -> None:
+        """
+        :param settings: настройки сервера
+        :param host: адрес, на котором слушает сервер
+        :param port: порт. 0 - выбрать свободный
+        """
+        self.app = create_app(settings)
+        self.host = host
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._runner = web.AppRunner(self.app)
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mock-eduapp', daemon=True)
+
+    @property
+    def url(self) -> str:
+        """
+        Адрес сервера для :data:`config.EDUAPP_BASE_URL`
+        """
+        return f'http://{self.host}:{self.port}'
+
+    @property
+    def stats(self) -> dict:
+        """
+        Сколько запросов обработано, сколько из них завершились ошибкой и ответом 304
+        """
+        return dict(self.app['stats'])
+
+    def start(self) -> None:
+        """
+        Запускает сервер и дожидается, пока он начнёт принимать соединения
+        """
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self) -> None:
+        """
+        Останавливает сервер
+        """
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]  # pylint: disable=W0212
+        self._started.set()
+        self._loop.run_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальная замена сервера Eduapp')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=MockSettings.latency,
+                        help='средняя задержка ответа, в секундах')
+    parser.add_argument('--error-rate', type=float, default=MockSettings.error_rate,
+                        help='доля ответов с ошибкой 503')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(asctime)s: %(message)s')
+    settings = MockSettings(latency=args.latency, error_rate=args.error_rate)
+    web.run_app(create_app(settings), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
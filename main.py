@@ -1,12 +1,51 @@
+import argparse
+import asyncio
+import importlib
 import logging
+import os
 
-import bot.main
+from dotenv import load_dotenv
+
+from bot.monitoring import MetricsServer, metrics_logger
+from eduapp.tokens import token_refresher
+from ui.main import templates
+
+#: Модули с точками входа движков бота
+ENGINES = {
+    'sync': 'bot.main',
+    'async': 'bot.async_main',
+}
 
 
 def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Телеграм-бот для Eduapp')
+    parser.add_argument('--engine', choices=ENGINES.keys(),
+                        default=os.environ.get('BOT_ENGINE', 'sync'),
+                        help='движок бота: sync - TeleBot, async - AsyncTeleBot и aiohttp')
+    parser.add_argument('--mode', choices=['polling', 'webhook'],
+                        default=os.environ.get('BOT_MODE', 'polling'),
+                        help='как получать обновления: polling - опрос телеграма, '
+                             'webhook - встроенный HTTP-сервер, настройки в переменных WEBHOOK_*')
+    parser.add_argument('--metrics-port', type=int,
+                        default=int(os.environ.get('BOT_METRICS_PORT', '0')),
+                        help='порт HTTP-сервера с метриками в формате Prometheus, 0 - не запускать')
+    args = parser.parse_args()
+
     fmt = '[%(levelname)s] %(asctime)s: %(message)s'
     logging.basicConfig(level=logging.INFO, format=fmt)
-    bot.main.tele_bot.infinity_polling()
+    templates.compile_all()
+    token_refresher.start()
+    metrics_logger.start()
+    if args.metrics_port:
+        MetricsServer(os.environ.get('BOT_METRICS_HOST', '127.0.0.1'), args.metrics_port).start()
+    logging.info('Запускаем бота на движке %s в режиме %s', args.engine, args.mode)
+    engine = importlib.import_module(ENGINES[args.engine])
+    run = engine.run_webhook if args.mode == 'webhook' else engine.run
+    if args.engine == 'async':
+        asyncio.run(run())
+    else:
+        run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,25 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.suite import find_regressions, get_benchmarks, load_baselines, save_baselines
+
+
+class BenchmarksTestCase(unittest.TestCase):
+    def test_benchmarks_run(self):
+        for benchmark in get_benchmarks():
+            with self.subTest(benchmark.name):
+                self.assertIsNotNone(benchmark.func())
+
+    def test_find_regressions(self):
+        baselines = {'fast': 1.0, 'slow': 1.0}
+        results = {'fast': 1.2, 'slow': 1.5, 'new': 100.0}
+        self.assertEqual(find_regressions(results, baselines, threshold=0.3), ['slow'])
+
+    def test_save_keeps_other_baselines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baselines.json')
+            self.assertEqual(load_baselines(path), {})
+            save_baselines(path, {'a': 1.0, 'b': 2.0})
+            save_baselines(path, {'b': 3.0})
+            self.assertEqual(load_baselines(path), {'a': 1.0, 'b': 3.0})
@@ -0,0 +1,27 @@
+import unittest
+
+from eduapp.cache import TTLCache
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_expired_entry_is_a_miss(self):
+        cache = TTLCache(max_size=10, ttl=60)
+        cache.put('fresh', 1)
+        cache.put('stale', 2, ttl=0)
+        self.assertEqual(cache.get('fresh'), 1)
+        self.assertIsNone(cache.get('stale'))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_invalidate(self):
+        cache = TTLCache(max_size=10, ttl=60)
+        cache.put('key', 'value')
+        cache.invalidate('key')
+        self.assertEqual(cache.get('key', 'default'), 'default')
+
+    def test_size_is_bounded(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        for key in range(5):
+            cache.put(key, key)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.get(4), 4)
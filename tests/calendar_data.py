@@ -0,0 +1,75 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from eduapp import calendar
+from eduapp.account import parse_account_response
+from eduapp.exceptions import EAServerError, TokenRejectedError
+from eduapp.lessons import Visit
+from eduapp.main import calendar_lessons_to_good_json, check_server_response, get_remaining_pages
+
+
+def make_lesson(date_of, name='Python'):
+    return {
+        'classes': {
+            'date_of': date_of,
+            'datetime_begin': f'{date_of}T10:00:00+03:00',
+            'datetime_end': f'{date_of}T11:30:00+03:00',
+            'course': {'simplest_name': name, 'diary_type': 'D'},
+            'classes_lessons': [],
+        },
+        'pupil_attendances': [],
+    }
+
+
+class CalendarLessonsToGoodJsonTestCase(unittest.TestCase):
+    def test_lessons_from_several_pages(self):
+        pages = [[make_lesson('2022-03-01')], [make_lesson('2022-03-01'), make_lesson('2022-03-02')]]
+        result = calendar_lessons_to_good_json(lesson for page in pages for lesson in page)
+        self.assertTrue(result['success'])
+        self.assertEqual(result['date']['year'], 2022)
+        self.assertEqual(len(result['days']['01.03']), 2)
+        self.assertEqual(len(result['days']['02.03']), 1)
+
+    def test_lesson_model(self):
+        lesson = make_lesson('2022-03-01')
+        lesson['classes']['classes_lessons'] = [{'lesson': {'name': 'Циклы'}}]
+        lesson['pupil_attendances'] = [{'is_begun': True, 'status': 'н'}]
+        result = calendar_lessons_to_good_json([lesson, make_lesson('2022-03-02')])
+        missed, planned = result['days']['01.03'][0], result['days']['02.03'][0]
+        self.assertEqual(missed.theme, 'Циклы')
+        self.assertEqual(missed.visit, Visit.MISSED)
+        self.assertEqual(missed.time.start.hour, 10)
+        self.assertIsNone(planned.theme)
+        self.assertEqual(planned.visit, Visit.PLANNED)
+
+    def test_no_lessons(self):
+        self.assertEqual(calendar_lessons_to_good_json(iter([])), {'success': False})
+
+
+class RemainingPagesTestCase(unittest.TestCase):
+    def test_page_size_is_taken_from_first_page(self):
+        lessons = [make_lesson('2022-03-01')] * 20
+        self.assertEqual(list(get_remaining_pages({'count': 95, 'results': lessons})), [2, 3, 4, 5])
+        self.assertEqual(list(get_remaining_pages({'count': 20, 'results': lessons})), [])
+        self.assertEqual(list(get_remaining_pages({'count': 0, 'results': []})), [])
+
+
+class ServerResponseTestCase(unittest.TestCase):
+    def test_only_401_and_403_reject_token(self):
+        for check in (check_server_response, parse_account_response):
+            with self.assertRaises(TokenRejectedError):
+                check(SimpleNamespace(status_code=403))
+            with self.assertRaises(EAServerError):
+                check(SimpleNamespace(status_code=500))
+
+
+class PrefetchTestCase(unittest.TestCase):
+    def test_unexpected_error_is_logged_and_released(self):
+        session = SimpleNamespace(user_id=1)
+        self.assertTrue(calendar.claim_prefetch(session, 2022, 3))
+        with mock.patch.object(calendar, 'load_month', side_effect=KeyError('results')), \
+                self.assertLogs(level='ERROR'):
+            calendar._prefetch(session, 2022, 3)
+        self.assertTrue(calendar.claim_prefetch(session, 2022, 3))
+        calendar.release_prefetch(session, 2022, 3)
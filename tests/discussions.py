@@ -0,0 +1,163 @@
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from bot.replies import ReplyPoller, is_teacher_reply
+from eduapp.discussions import discussion_states, sync_discussions
+from eduapp.exceptions import TokenRejectedError
+from eduapp.questions import EaQuestionResponseStatus, parse_open_question_responses, \
+    pick_question
+from eduapp.sessions import SessionRegistry, create_session
+
+
+def make_discussion(discussion_id, commented_at):
+    return {
+        'id': discussion_id,
+        'commented_at': commented_at,
+        'related_text': f'Тема {discussion_id}',
+        'preview': 'Вопрос',
+        'discussion_users': [{'is_client': False, 'user': {'first_name': 'Иван', 'last_name': 'Петров'}}],
+    }
+
+
+PUPIL_ID = 900
+
+
+def make_comment(username, message):
+    author_id = PUPIL_ID if username == 'pupil' else 1
+    return {'author': {'id': author_id, 'username': username}, 'message': message}
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+
+class FakeEduapp:
+    """
+    Сервер обсуждений с поддержкой сортировки, страниц и ETag
+    """
+
+    def __init__(self):
+        self.discussions = {}
+        self.comments = {}
+        self.requests = []
+
+    def add_comment(self, discussion_id, commented_at, comment):
+        self.discussions[discussion_id] = make_discussion(discussion_id, commented_at)
+        self.comments.setdefault(discussion_id, []).append(comment)
+
+    def get(self, url, token=None, headers=None):
+        self.requests.append(url)
+        parsed = urlparse(url)
+        params = {key: int(values[0]) for key, values in parse_qs(parsed.query).items() if key != 'ordering'}
+        if parsed.path.endswith('/comments/'):
+            items = self.comments[int(parsed.path.split('/')[-3])]
+        else:
+            items = sorted(self.discussions.values(), key=lambda item: item['commented_at'], reverse=True)
+        etag = str(hash(repr(items)))
+        if (headers or {}).get('If-None-Match') == etag:
+            return FakeResponse(304)
+        page = items[params['offset']:params['offset'] + params['limit']]
+        return FakeResponse(200, {'count': len(items), 'results': page}, {'ETag': etag})
+
+
+class SyncDiscussionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeEduapp()
+        self.server.add_comment(1, '2022-03-01T10:00:00+03:00', make_comment('pupil', 'Вопрос'))
+        self.server.add_comment(1, '2022-03-01T11:00:00+03:00', make_comment('teacher', 'Старый ответ'))
+        self.server.add_comment(2, '2022-03-02T10:00:00+03:00', make_comment('pupil', 'Другой вопрос'))
+        patcher = mock.patch('eduapp.discussions.ea_client', self.server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(discussion_states.clear)
+        self.session = create_session(9, 'pupil', 'pass', 'token', PUPIL_ID)
+
+    def test_first_sync_only_remembers_watermark(self):
+        self.assertEqual(sync_discussions(self.session), [])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_unchanged_discussions_are_not_downloaded(self):
+        sync_discussions(self.session)
+        self.assertEqual(sync_discussions(self.session), [])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_only_new_comments_are_downloaded(self):
+        sync_discussions(self.session)
+        self.server.add_comment(1, '2022-03-03T10:00:00+03:00', make_comment('teacher', 'Новый ответ'))
+        update, = sync_discussions(self.session)
+        self.assertEqual(update.question['id'], 1)
+        self.assertEqual(update.comments, [make_comment('teacher', 'Новый ответ')])
+        self.server.add_comment(1, '2022-03-04T10:00:00+03:00', make_comment('pupil', 'Спасибо'))
+        update, = sync_discussions(self.session)
+        self.assertEqual(update.comments, [make_comment('pupil', 'Спасибо')])
+        self.assertIn('offset=3', self.server.requests[-1])
+
+    def test_poller_sends_teacher_replies(self):
+        registry = SessionRegistry()
+        registry.put(self.session)
+        sent = []
+        poller = ReplyPoller(lambda chat_id, text: sent.append((chat_id, text)), registry=registry)
+        poller.poll_all()
+        self.server.add_comment(2, '2022-03-03T10:00:00+03:00', make_comment('teacher', 'Ответ'))
+        self.server.add_comment(1, '2022-03-03T11:00:00+03:00', make_comment('pupil', 'Ещё вопрос'))
+        self.assertEqual(poller.poll_all(), 1)
+        chat_id, text = sent[0]
+        self.assertEqual(chat_id, 9)
+        self.assertIn('Тема 2', text)
+        self.assertIn('Ответ', text)
+
+    def test_broken_session_does_not_stop_others(self):
+        registry = SessionRegistry()
+        broken = create_session(8, 'broken', 'pass', 'token', 800)
+        registry.put(broken)
+        registry.put(self.session)
+        sent = []
+        poller = ReplyPoller(lambda chat_id, text: sent.append(chat_id), registry=registry)
+        original = poller.poll
+
+        def poll(session):
+            if session is broken:
+                raise KeyError('author')
+            return original(session)
+
+        poller.poll = poll
+        poller.poll_all()
+        self.server.add_comment(2, '2022-03-03T10:00:00+03:00', make_comment('teacher', 'Ответ'))
+        self.assertEqual(poller.poll_all(), 1)
+        self.assertEqual(sent, [9])
+
+    def test_replies_are_told_apart_by_author_id(self):
+        self.session.login = 'Pupil@example.com'
+        comments = [make_comment('pupil', 'Вопрос'), make_comment('teacher', 'Ответ'),
+                    {'message': 'Без автора'}, {'author': {'username': 'teacher'}, 'message': '?'}]
+        self.assertEqual([is_teacher_reply(comment, self.session) for comment in comments],
+                         [False, True, False, False])
+
+
+class OpenQuestionTestCase(unittest.TestCase):
+    def test_missing_question_is_an_error(self):
+        page = EaQuestionResponseStatus(True, {'questions': [{'id': 1}]})
+        self.assertEqual(pick_question(page, 0).data, {'id': 1})
+        self.assertFalse(pick_question(page, 3).success)
+        failed = EaQuestionResponseStatus(False, {}, 'Ошибка')
+        self.assertIs(pick_question(failed, 0), failed)
+
+    def test_failed_comments_are_an_error(self):
+        question = {'id': 1}
+        status = parse_open_question_responses(FakeResponse(500), FakeResponse(403), question)
+        self.assertEqual(status.error, TokenRejectedError.message)
+        status = parse_open_question_responses(FakeResponse(200), FakeResponse(502), question)
+        self.assertFalse(status.success)
+        status = parse_open_question_responses(FakeResponse(500), FakeResponse(200, {}), question)
+        self.assertFalse(status.success)
+        comments = [make_comment('teacher', 'Ответ')]
+        status = parse_open_question_responses(
+            FakeResponse(500), FakeResponse(200, {'results': comments}), question)
+        self.assertEqual(status.data, {'question': question, 'comments': comments})
@@ -0,0 +1,278 @@
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import bot.bot_states
+from bot.auth import request_with_relogin
+from bot.engine import BotEngine, SyncEngine
+from bot.outbox import Outbox
+from bot.scheduler import BUSY_MESSAGE, ChatScheduler
+from bot.state_store import MemoryStateStore, SQLiteStateStore
+from eduapp.exceptions import EAConnectionError, TokenRejectedError
+from eduapp.main import EaAuthStatus
+from eduapp.sessions import create_session, sessions
+
+
+class RecordingEngine(BotEngine):
+    def __init__(self, state_store):
+        super().__init__(tele_bot=None, state_store=state_store)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    async def reply_to(self, message, text, **kwargs):
+        self.sent.append((message.chat.id, text))
+
+    async def send(self, reply):
+        self.sent.append((reply.chat_id, reply.text))
+
+    async def flush(self, messages):
+        pass
+
+    async def answer_callback_query(self, callback_query_id):
+        pass
+
+
+def make_message(chat_id, text):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text,
+                           from_user=SimpleNamespace(username='user'))
+
+
+class BotEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryStateStore()
+        self.engine = RecordingEngine(self.store)
+
+    def process(self, chat_id, text, engine=None):
+        asyncio.run((engine or self.engine).process_message(make_message(chat_id, text)))
+
+    def test_next_step_is_kept_per_chat(self):
+        self.process(1, '/start')
+        self.process(2, '/start')
+        self.process(1, 'Авторизация')
+        self.assertEqual(self.store.load(1).step, 'bot.auth:auth_enter_login_handler')
+        self.assertEqual(self.store.load(2).state, 'bot.bot_states:GuestState')
+
+    def test_unknown_command_shows_menu_again(self):
+        self.process(1, '/start')
+        self.engine.sent.clear()
+        self.process(1, 'Неизвестная команда')
+        self.assertEqual(self.engine.sent[0], (1, 'Команда не распознана'))
+        self.assertIsNotNone(self.store.load(1).step)
+
+    def test_hidden_buttons_are_not_accepted(self):
+        status = self.store.load(1)
+        status.state = 'bot.bot_states:QuestionsState'
+        status.register_next_step_handler(bot.bot_states.BotState.processing, status.state,
+                                          [bot.bot_states.QuestionsState.NEXT_PAGE])
+        self.store.save(status)
+        self.process(1, bot.bot_states.QuestionsState.NEXT_PAGE)
+        self.assertEqual(self.engine.sent[0], (1, 'Команда не распознана'))
+        self.assertEqual(self.store.load(1).questions_page, 1)
+
+    def test_keyboards_are_built_once(self):
+        state = 'bot.bot_states:QuestionsState'
+        hidden = (bot.bot_states.QuestionsState.PREVIOUS_PAGE,)
+        keyboard = bot.bot_states.get_keyboard(state, hidden)
+        self.assertIs(bot.bot_states.get_keyboard(state, hidden), keyboard)
+        buttons = [row[0]['text'] for row in json.loads(keyboard)['keyboard']]
+        self.assertEqual(buttons, ['Открыть вопрос', bot.bot_states.QuestionsState.NEXT_PAGE, 'Назад'])
+
+    def test_message_without_handler_is_ignored(self):
+        self.process(1, 'Календарь')
+        self.assertEqual(self.engine.sent, [])
+
+    def test_dialog_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'states.db')
+            self.process(1, '/start', RecordingEngine(SQLiteStateStore(path)))
+            self.process(1, 'Авторизация', RecordingEngine(SQLiteStateStore(path)))
+            restarted = RecordingEngine(SQLiteStateStore(path))
+            self.process(1, 'login', restarted)
+            self.assertEqual(restarted.sent[-1], (1, 'Введите пароль'))
+            self.assertEqual(SQLiteStateStore(path).load(1).step_params, ['login'])
+
+    def test_session_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'states.db')
+            sessions.put(create_session(42, 'login', 'pass', 'token', 7, 'Europe/Moscow'))
+            self.process(42, '/start', RecordingEngine(SQLiteStateStore(path)))
+            sessions.remove(42)
+            self.process(42, '/start', RecordingEngine(SQLiteStateStore(path)))
+            session = sessions.get(42)
+            sessions.remove(42)
+            self.assertEqual((session.token, session.user_id, session.timezone),
+                             ('token', 7, 'Europe/Moscow'))
+
+    def test_failed_handler_keeps_step_and_flushes_replies(self):
+        engine = SyncEngine(None, self.store)
+        sent = []
+        engine.outbox = Outbox(sent.append)
+        self.process(1, '/start', engine)
+        self.process(1, 'Авторизация', engine)
+        sent.clear()
+
+        async def failing_handler(message, t_bot, status_of_bot):
+            await t_bot.send_message(message.chat.id, 'Проверяем логин')
+            raise EAConnectionError()
+
+        with mock.patch('bot.auth.auth_enter_login_handler', failing_handler):
+            self.process(1, 'login', engine)
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0].text.split('\n\n'), ['Проверяем логин', EAConnectionError.message])
+        self.assertEqual(self.store.load(1).step, 'bot.auth:auth_enter_login_handler')
+
+    def test_rejected_update_gets_a_reply(self):
+        tele_bot = FloodBot([make_message(1, str(number)) for number in range(3)])
+        engine = SyncEngine(tele_bot, self.store)
+        engine.handle = lambda update: tele_bot.submitted.wait(5)
+        scheduler = functools.partial(ChatScheduler, chat_queue_size=1)
+        with mock.patch('bot.engine.ChatScheduler', scheduler):
+            engine.run()
+        self.assertEqual(tele_bot.sent, [(1, BUSY_MESSAGE), (1, BUSY_MESSAGE)])
+
+
+class FloodBot:
+    """
+    Телеграм-бот, который при опросе сразу присылает несколько сообщений
+    """
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.submitted = threading.Event()
+        self.sent = []
+        self._handle_message = None
+
+    def message_handler(self, func):
+        def register(handler):
+            self._handle_message = handler
+            return handler
+        return register
+
+    def callback_query_handler(self, func):
+        return lambda handler: handler
+
+    def infinity_polling(self):
+        for message in self.messages:
+            self._handle_message(message)
+        self.submitted.set()
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+class RequestWithReloginTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = RecordingEngine(MemoryStateStore())
+        self.session = create_session(1, 'login', 'pass', 'old', 7)
+        self.logins = []
+
+    def relogin(self, success):
+        async def relogin(session):
+            self.logins.append(session.login)
+            if success:
+                session.token = 'new'
+                return EaAuthStatus(True, token=session.token)
+            return EaAuthStatus(False, error='Ошибка входа')
+        self.engine.ea = SimpleNamespace(relogin=relogin)
+
+    def request(self, is_rejected=lambda result: False):
+        async def request(session):
+            if session.token == 'old':
+                raise TokenRejectedError()
+            return session.token
+        return asyncio.run(request_with_relogin(make_message(1, 'Профиль'), self.engine,
+                                                self.session, request, is_rejected))
+
+    def test_rejected_token_is_renewed(self):
+        self.relogin(success=True)
+        self.assertEqual(self.request(), 'new')
+        self.assertEqual(self.request(), 'new')
+        self.assertEqual(self.logins, ['login'])
+
+    def test_rejected_result_is_renewed(self):
+        self.relogin(success=True)
+        self.session.token = 'stale'
+        self.assertEqual(self.request(lambda token: token == 'stale'), 'new')
+
+    def test_failed_relogin_is_reported(self):
+        self.relogin(success=False)
+        self.assertIsNone(self.request())
+        self.assertEqual(self.engine.sent, [(1, 'Ошибка входа')])
+
+
+class StateStoreLockTestCase(unittest.TestCase):
+    def check_lock(self, store):
+        self.assertTrue(store._acquire(1, 'first', time.time() + 60))
+        self.assertFalse(store._acquire(1, 'second', time.time() + 60))
+        self.assertTrue(store._acquire(2, 'second', time.time() + 60))
+        store._release(1, 'second')
+        self.assertFalse(store._acquire(1, 'second', time.time() + 60))
+        store._release(1, 'first')
+        self.assertTrue(store._acquire(1, 'second', time.time() + 60))
+        self.assertTrue(store._acquire(3, 'first', time.time() - 1))
+        self.assertTrue(store._acquire(3, 'second', time.time() + 60))
+
+    def test_memory_lock(self):
+        self.check_lock(MemoryStateStore())
+
+    def test_sqlite_lock_is_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'states.db')
+            first, second = SQLiteStateStore(path), SQLiteStateStore(path)
+            self.check_lock(first)
+            self.assertFalse(second._acquire(1, 'third', time.time() + 60))
+
+    def test_chats_are_processed_one_at_a_time(self):
+        store = MemoryStateStore()
+        order = []
+
+        async def handle(name):
+            async with store.lock(1):
+                order.append(f'{name} start')
+                await asyncio.sleep(0.01)
+                order.append(f'{name} end')
+
+        async def run():
+            await asyncio.gather(handle('first'), handle('second'))
+
+        asyncio.run(run())
+        self.assertEqual(order, ['first start', 'first end', 'second start', 'second end'])
+
+    def test_offloaded_sqlite_store_does_not_block_the_loop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SQLiteStateStore(os.path.join(directory, 'states.db'))
+            store.offload = True
+            threads = []
+            acquire = store._acquire
+
+            def record_acquire(*args):
+                threads.append(threading.get_ident())
+                return acquire(*args)
+
+            async def handle(order, name):
+                async with store.lock(1):
+                    order.append(f'{name} start')
+                    status = await store.call(store.load, 1)
+                    status.question = 7
+                    await store.call(store.save, status)
+                    order.append(f'{name} end')
+
+            async def run():
+                order = []
+                await asyncio.gather(handle(order, 'first'), handle(order, 'second'))
+                return order
+
+            with mock.patch.object(store, '_acquire', record_acquire):
+                order = asyncio.run(run())
+            self.assertEqual(order, ['first start', 'first end', 'second start', 'second end'])
+            self.assertNotIn(threading.get_ident(), threads)
+            self.assertEqual(store.load(1).question, 7)
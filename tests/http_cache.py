@@ -0,0 +1,96 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eduapp.async_client import AsyncEAClient
+from eduapp.client import EAClient
+from eduapp.http_cache import ResponseCache, get_cache_key, parse_cache_control
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    body = b'{"results": [1, 2, 3]}'
+    cache_control = 'private'
+    not_modified = 0
+
+    def do_GET(self):  # pylint: disable=C0103
+        etag = '"v%d"' % len(self.body)
+        if self.headers.get('If-None-Match') == etag:
+            type(self).not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', self.cache_control)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        ETagHandler.not_modified = 0
+        ETagHandler.cache_control = 'private'
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ETagHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/discussions/'
+        self.cache = ResponseCache(max_bytes=1024, directory=None)
+
+    def test_not_modified_response_reuses_body(self):
+        client = EAClient(retries=0, cache=self.cache)
+        first = client.get(self.url, token='token')
+        second = client.get(self.url, token='token')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(ETagHandler.not_modified, 1)
+        self.assertEqual((self.cache.misses, self.cache.revalidated), (1, 1))
+
+    def test_responses_are_separated_by_token(self):
+        client = EAClient(retries=0, cache=self.cache)
+        client.get(self.url, token='first')
+        client.get(self.url, token='second')
+        self.assertEqual(ETagHandler.not_modified, 0)
+
+    def test_fresh_response_is_not_requested(self):
+        ETagHandler.cache_control = 'max-age=60'
+        client = AsyncEAClient(retries=0, cache=self.cache)
+
+        async def get_twice():
+            try:
+                await client.get(self.url, token='token')
+                return await client.get(self.url, token='token')
+            finally:
+                await client.close()
+
+        response = asyncio.run(get_twice())
+        self.assertEqual(response.json(), {'results': [1, 2, 3]})
+        self.assertEqual(response.headers.get('etag'), '"v22"')
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+
+    def test_disk_entry_is_refreshed_by_not_modified(self):
+        with tempfile.TemporaryDirectory() as directory:
+            client = EAClient(retries=0, cache=ResponseCache(max_bytes=1024, directory=directory))
+            client.get(self.url, token='token')
+            with open(os.path.join(directory, get_cache_key(self.url, 'token')), 'rb') as file:
+                self.assertTrue(file.readline().startswith(b'{'))
+            stored = ResponseCache(max_bytes=1024, directory=directory).get(self.url, 'token')
+            self.assertEqual(stored.content, ETagHandler.body)
+            self.assertEqual(stored.headers['ETag'], '"v22"')
+            client.get(self.url, token='token')
+            refreshed = ResponseCache(max_bytes=1024, directory=directory).get(self.url, 'token')
+            self.assertEqual(ETagHandler.not_modified, 1)
+            self.assertGreater(refreshed.stored_at, stored.stored_at)
+            self.assertEqual(refreshed.content, ETagHandler.body)
+
+    def test_cache_control(self):
+        self.assertEqual(parse_cache_control('private, max-age=30'), (True, 30.0))
+        self.assertEqual(parse_cache_control('no-cache, max-age=30'), (True, 0.0))
+        self.assertEqual(parse_cache_control('no-store'), (False, 0.0))
@@ -0,0 +1,39 @@
+import unittest
+
+import requests
+
+from loadtest.driver import percentile
+from loadtest.mock_eduapp import API_PREFIX, MockServer, MockSettings
+
+
+class MockEduappTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = MockServer(MockSettings(latency=0.0))
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def login(self, username, password):
+        return requests.post(f'{self.server.url}{API_PREFIX}/rest-auth/login/',
+                             data={'username': username, 'password': password, 'add_captcha': False})
+
+    def test_login(self):
+        self.assertEqual(self.login('user5', 'password').status_code, 200)
+        self.assertEqual(self.login('user5', 'wrong').status_code, 400)
+
+    def test_discussions_are_revalidated(self):
+        cookies = {'eduapp_jwt': self.login('user5', 'password').json()['token']}
+        url = f'{self.server.url}{API_PREFIX}/discussions/?limit=5&offset=0'
+        response = requests.get(url, cookies=cookies)
+        self.assertEqual(len(response.json()['results']), 5)
+        response = requests.get(url, cookies=cookies, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
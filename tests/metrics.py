@@ -0,0 +1,58 @@
+import unittest
+
+import requests
+
+from bot.monitoring import MetricsLogger, MetricsServer
+from eduapp.client import get_endpoint
+from eduapp.metrics import Metric, MetricsRegistry
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.histogram = self.registry.histogram('bot_handler_duration_seconds', 'Время',
+                                                 ('handler',), bounds=(0.1, 1))
+
+    def test_histogram_exposition(self):
+        for value in (0.05, 0.5, 5):
+            self.histogram.observe(value, 'MainState')
+        text = self.registry.render()
+        self.assertIn('# TYPE bot_handler_duration_seconds histogram', text)
+        self.assertIn('bot_handler_duration_seconds_bucket{handler="MainState",le="0.1"} 1', text)
+        self.assertIn('bot_handler_duration_seconds_bucket{handler="MainState",le="1.0"} 2', text)
+        self.assertIn('bot_handler_duration_seconds_bucket{handler="MainState",le="+Inf"} 3', text)
+        self.assertIn('bot_handler_duration_seconds_count{handler="MainState"} 3', text)
+
+    def test_cache_stats(self):
+        cache = type('Cache', (), {'hits': 3, 'misses': 1})()
+        self.registry.add_cache('calendar', cache)
+        text = self.registry.render()
+        self.assertIn('# TYPE cache_requests_total counter', text)
+        self.assertIn('cache_requests_total{cache="calendar",result="hit"} 3', text)
+        self.assertEqual(self.registry.get_cache_hit_rates(), {'calendar': 0.75})
+
+    def test_metric_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Metric('metric', 'Метрика')  # pylint: disable=E0110
+
+    def test_summary_covers_last_interval(self):
+        logger = MetricsLogger(registry=self.registry)
+        self.histogram.observe(0.05, 'MainState')
+        self.assertIn('MainState: 1 шт.', logger.summary())
+        self.histogram.observe(0.5, 'CalendarState')
+        summary = logger.summary()
+        self.assertIn('CalendarState: 1 шт.', summary)
+        self.assertNotIn('MainState', summary)
+
+    def test_server(self):
+        self.histogram.observe(0.05, 'MainState')
+        server = MetricsServer('127.0.0.1', 0, self.registry)
+        server.start()
+        self.addCleanup(server.stop)
+        response = requests.get(f'http://127.0.0.1:{server.port}/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('bot_handler_duration_seconds_count{handler="MainState"} 1', response.text)
+
+    def test_endpoint_label(self):
+        url = 'https://my.informatics.ru/api/v1/discussions/42/comments/?limit=10'
+        self.assertEqual(get_endpoint(url), '/discussions/{id}/comments/')
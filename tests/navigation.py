@@ -0,0 +1,75 @@
+import asyncio
+import json
+import unittest
+from types import SimpleNamespace
+
+from telebot.types import InlineKeyboardMarkup
+
+import bot.bot_states
+from bot.navigation import calendar_keyboard, chat_keyboard, is_shown, parse_callback_data, \
+    questions_keyboard
+from bot.state_store import BotStatus
+
+
+def get_buttons(keyboard):
+    return [(button['text'], button['callback_data']) for button in json.loads(keyboard)['inline_keyboard'][0]]
+
+
+class NavigationTestCase(unittest.TestCase):
+    def test_keyboards_carry_page_tokens(self):
+        self.assertEqual(get_buttons(questions_keyboard(2, has_next=True)), [('◀', 'q:1'), ('▶', 'q:3')])
+        self.assertIsNone(questions_keyboard(1, has_next=False))
+        self.assertEqual(get_buttons(chat_keyboard(7, 1, has_previous=True)), [('⬆ Раньше', 'c:7:2')])
+        self.assertEqual([data for _, data in get_buttons(calendar_keyboard(2022, 1))], ['m:2021-12', 'm:2022-2'])
+
+    def test_parse_callback_data(self):
+        self.assertEqual(parse_callback_data('q:3'), ('q', (3,)))
+        self.assertEqual(parse_callback_data('c:7:2'), ('c', (7, 2)))
+        self.assertEqual(parse_callback_data('m:2022-12'), ('m', (2022, 12)))
+        self.assertEqual(parse_callback_data('a:5:1'), ('a', (5, 1)))
+        for data in ('q:0', 'q:x', 'c:7', 'm:2022-13', 'x:1', 'a:5', '', None):
+            self.assertIsNone(parse_callback_data(data))
+
+    def test_page_keyboard_carries_menu(self):
+        menu = bot.bot_states.QuestionsState.get_inline_menu()
+        self.assertEqual([text for text, _ in menu], ['Открыть вопрос', 'Назад'])
+        rows = json.loads(questions_keyboard(1, has_next=True, menu=menu))['inline_keyboard']
+        self.assertEqual([[button['text'] for button in row] for row in rows],
+                         [['▶'], ['Открыть вопрос'], ['Назад']])
+
+    def test_unchanged_page_is_not_edited(self):
+        keyboard = questions_keyboard(2, has_next=True)
+        message = SimpleNamespace(text='Вопрос 6 & ответ',
+                                  reply_markup=InlineKeyboardMarkup.de_json(keyboard))
+        self.assertTrue(is_shown(message, '<b>Вопрос 6</b> &amp; ответ\n', keyboard))
+        self.assertFalse(is_shown(message, '<b>Вопрос 7</b> &amp; ответ', keyboard))
+        self.assertFalse(is_shown(message, '<b>Вопрос 6</b> &amp; ответ', questions_keyboard(2, False)))
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+
+
+class MenuActionTestCase(unittest.TestCase):
+    def press(self, status, data):
+        t_bot = RecordingBot()
+        message = SimpleNamespace(chat=SimpleNamespace(id=1), message_id=10, text='страница')
+        call = SimpleNamespace(data=data, message=message, from_user=SimpleNamespace(username='user'))
+        asyncio.run(bot.navigation.handle_callback(call, t_bot, status))
+        return t_bot.sent
+
+    def test_menu_button_acts_like_text(self):
+        status = BotStatus(1, state='bot.bot_states:QuestionsState')
+        _, data = bot.bot_states.QuestionsState.get_inline_menu()[0]
+        self.assertEqual(self.press(status, data), ['Введите номер вопроса, который хотите открыть'])
+        self.assertEqual(status.step, 'bot.questions:parse_question_number')
+
+    def test_menu_button_of_other_state_is_ignored(self):
+        status = BotStatus(1, state='bot.bot_states:MainState')
+        _, data = bot.bot_states.QuestionsState.get_inline_menu()[0]
+        self.assertEqual(self.press(status, data), [])
+        self.assertIsNone(status.step)
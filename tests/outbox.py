@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+
+import aiohttp
+import requests
+from telebot import apihelper, asyncio_helper
+
+from bot.outbox import EDIT, AsyncOutbox, OutgoingMessage, Outbox, RateLimiter, TokenBucket, \
+    coalesce
+
+
+class CoalesceTestCase(unittest.TestCase):
+    def test_consecutive_messages_are_merged(self):
+        messages = coalesce([
+            OutgoingMessage(1, 'Команда <не> распознана'),
+            OutgoingMessage(1, '<b>Меню</b>', {'parse_mode': 'HTML', 'reply_markup': 'menu'}),
+            OutgoingMessage(2, 'Другой чат'),
+        ])
+        self.assertEqual([(m.chat_id, m.text) for m in messages],
+                         [(1, 'Команда &lt;не&gt; распознана\n\n<b>Меню</b>'), (2, 'Другой чат')])
+        self.assertEqual(messages[0].kwargs, {'parse_mode': 'HTML', 'reply_markup': 'menu'})
+
+    def test_incompatible_messages_are_kept(self):
+        messages = [
+            OutgoingMessage(1, 'a', {'reply_markup': 'first'}),
+            OutgoingMessage(1, 'b', {'reply_markup': 'second'}),
+            OutgoingMessage(1, 'c', {'reply_to_message_id': 5}),
+            OutgoingMessage(1, 'd' * 4096),
+        ]
+        self.assertEqual(len(coalesce(messages)), 4)
+
+
+class RateLimitTestCase(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1, capacity=2, now=0)
+        self.assertEqual([bucket.reserve(0), bucket.reserve(0), bucket.reserve(0)], [0, 0, 1])
+        self.assertEqual(bucket.reserve(3), 0)
+        bucket.pause(10)
+        self.assertEqual(bucket.reserve(4), 6)
+
+    def test_retry_after_is_respected(self):
+        attempts = []
+
+        def send(message):
+            attempts.append(message.text)
+            if len(attempts) == 1:
+                raise apihelper.ApiTelegramException('sendMessage', None, {
+                    'error_code': 429, 'description': 'Too Many Requests',
+                    'parameters': {'retry_after': 0.01},
+                })
+
+        outbox = Outbox(send, limiter=RateLimiter(rate=100, burst=100, chat_rate=100, chat_burst=100))
+        outbox.flush([OutgoingMessage(1, 'a'), OutgoingMessage(1, 'b', {'reply_markup': 'menu'}),
+                      OutgoingMessage(1, 'c', {'reply_markup': 'menu'})])
+        self.assertEqual(attempts, ['a\n\nb', 'a\n\nb', 'c'])
+        stats = outbox.stats.snapshot()
+        self.assertEqual((stats['queued'], stats['sent'], stats['merged'], stats['retries']), (0, 2, 1, 1))
+
+    def test_not_modified_edit_is_not_a_failure(self):
+        def send(message):
+            raise apihelper.ApiTelegramException('editMessageText', None, {
+                'error_code': 400,
+                'description': 'Bad Request: message is not modified: specified new message content '
+                               'and reply markup are exactly the same',
+            })
+
+        outbox = Outbox(send)
+        outbox.flush([OutgoingMessage(1, 'a', {'message_id': 5}, method=EDIT)])
+        stats = outbox.stats.snapshot()
+        self.assertEqual((stats['queued'], stats['failed']), (0, 0))
+
+    def test_failed_message_does_not_stop_batch(self):
+        sent = []
+
+        def send(message):
+            if message.text == 'a':
+                raise requests.ConnectionError('connection reset')
+            sent.append(message.text)
+
+        outbox = Outbox(send)
+        outbox.flush([OutgoingMessage(1, 'a', {'reply_markup': 'menu'}),
+                      OutgoingMessage(1, 'b', {'reply_markup': 'menu'})])
+        self.assertEqual(sent, ['b'])
+        stats = outbox.stats.snapshot()
+        self.assertEqual((stats['queued'], stats['sent'], stats['failed']), (0, 1, 1))
+
+    def test_async_failed_message_does_not_stop_batch(self):
+        sent = []
+
+        async def send(message):
+            if message.text == 'a':
+                raise aiohttp.ClientConnectionError('connection reset')
+            sent.append(message.text)
+
+        async def flush():
+            # Телеграм-бот создаёт сессию aiohttp при импорте, для этого нужен цикл событий
+            outbox = AsyncOutbox(send)
+            await outbox.flush([OutgoingMessage(1, 'a', {'reply_markup': 'menu'}),
+                                OutgoingMessage(2, 'b')])
+            await asyncio_helper.session_manager.session.close()
+            return outbox
+
+        outbox = asyncio.run(flush())
+        self.assertEqual(sent, ['b'])
+        stats = outbox.stats.snapshot()
+        self.assertEqual((stats['queued'], stats['sent'], stats['failed']), (0, 1, 1))
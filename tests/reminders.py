@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from bot.reminders import ReminderQueue, ReminderScheduler, get_months
+from eduapp.calendar import calendar_cache
+from eduapp.lessons import Lesson, TimeRange, Visit
+from eduapp.sessions import SessionRegistry, create_session
+
+
+def make_lesson(start, name='Python'):
+    return Lesson(name, TimeRange(start, start + timedelta(minutes=90)), True, Visit.PLANNED)
+
+
+class ReminderQueueTestCase(unittest.TestCase):
+    def test_reminders_are_popped_in_order(self):
+        queue = ReminderQueue()
+        queue.replace(1, [(30, 'first late'), (10, 'first early')])
+        queue.replace(2, [(20, 'second')])
+        self.assertEqual(queue.next_time(), 10)
+        self.assertEqual(queue.pop_due(25), [(1, 'first early'), (2, 'second')])
+        self.assertEqual(queue.pop_due(100), [(1, 'first late')])
+        self.assertIsNone(queue.next_time())
+        self.assertEqual(queue.chat_ids(), set())
+
+    def test_replaced_reminders_are_not_sent(self):
+        queue = ReminderQueue()
+        queue.replace(1, [(10, 'old')])
+        queue.replace(1, [(20, 'new')])
+        queue.replace(2, [(5, 'removed')])
+        queue.remove(2)
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.next_time(), 20)
+        self.assertEqual(queue.pop_due(100), [(1, 'new')])
+
+    def test_memory_is_bounded(self):
+        queue = ReminderQueue(max_size=100)
+        for _ in range(1000):
+            queue.replace(1, [(10, 'lesson'), (20, 'lesson')])
+        self.assertLess(len(queue._heap), 100)
+        queue.replace(2, [(i, 'lesson') for i in range(1000)])
+        self.assertEqual(len(queue), 100)
+
+
+class ReminderSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = SessionRegistry()
+        self.session = create_session(7, 'pupil', 'pass', 'token', 700)
+        self.registry.put(self.session)
+        self.sent = []
+        self.scheduler = ReminderScheduler(lambda chat_id, text: self.sent.append((chat_id, text)),
+                                           registry=self.registry, lead=60, horizon=3600)
+        self.addCleanup(self.scheduler.stop)
+        self.addCleanup(calendar_cache.clear)
+
+    def store_lessons(self, *lessons):
+        now = time.time()
+        for year, month in get_months(now, now + 3660):
+            days = {}
+            for lesson in lessons:
+                if (lesson.time.start.year, lesson.time.start.month) == (year, month):
+                    days.setdefault(lesson.time.start.strftime('%d.%m'), []).append(lesson)
+            calendar_cache.put((700, year, month), {'success': True, 'days': days})
+
+    def test_only_lessons_within_horizon_are_scheduled(self):
+        now = datetime.now().astimezone()
+        self.store_lessons(make_lesson(now + timedelta(seconds=30), 'Уже скоро'),
+                           make_lesson(now + timedelta(minutes=30), 'Python & C'),
+                           make_lesson(now + timedelta(hours=3), 'Завтра'))
+        self.assertEqual(self.scheduler.refresh_all(), 1)
+        self.assertEqual(self.scheduler.dispatch_due(), 0)
+        self.scheduler.queue.replace(7, [(time.time(), 'text')])
+        self.assertEqual(self.scheduler.dispatch_due(), 1)
+
+    def test_reminder_text(self):
+        now = datetime.now().astimezone()
+        self.store_lessons(make_lesson(now + timedelta(minutes=30), 'Python & C'))
+        self.scheduler.refresh(self.session)
+        self.scheduler.refresh(self.session)
+        self.assertAlmostEqual(self.scheduler.queue.next_time(),
+                               (now + timedelta(minutes=29)).timestamp(), places=3)
+        (chat_id, text), = self.scheduler.queue.pop_due(time.time() + 3600)
+        self.assertEqual(chat_id, 7)
+        self.assertIn('Python &amp; C', text)
+
+    def test_dispatcher_wakes_for_earlier_reminder(self):
+        delivered = threading.Event()
+        self.scheduler.send = lambda chat_id, text: delivered.set()
+        self.scheduler.queue.replace(1, [(time.time() + 3600, 'later')])
+        threading.Thread(target=self.scheduler._run_dispatch, daemon=True).start()
+        self.store_lessons(make_lesson(datetime.now().astimezone() + timedelta(seconds=60.2)))
+        self.scheduler.refresh(self.session)
+        self.assertTrue(delivered.wait(5))
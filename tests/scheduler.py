@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from bot.scheduler import AsyncChatScheduler, ChatScheduler
+from tests.engine import make_message
+
+
+class ChatSchedulerTestCase(unittest.TestCase):
+    def test_messages_of_chat_are_processed_in_order(self):
+        processed = []
+        lock = threading.Lock()
+
+        def process(message):
+            time.sleep(0.001)
+            with lock:
+                processed.append((message.chat.id, message.text))
+
+        scheduler = ChatScheduler(process, workers=4, chat_queue_size=100)
+        for i in range(20):
+            for chat_id in (1, 2, 3):
+                scheduler.submit(make_message(chat_id, i))
+        scheduler.shutdown()
+        for chat_id in (1, 2, 3):
+            self.assertEqual([text for chat, text in processed if chat == chat_id], list(range(20)))
+
+    def test_chats_are_processed_in_parallel(self):
+        release = threading.Event()
+        processed = []
+
+        def process(message):
+            if message.chat.id == 1:
+                release.wait(5)
+            processed.append(message.chat.id)
+            release.set()
+
+        scheduler = ChatScheduler(process, workers=2)
+        scheduler.submit(make_message(1, 'slow'))
+        scheduler.submit(make_message(2, 'fast'))
+        scheduler.shutdown()
+        self.assertEqual(processed, [2, 1])
+
+    def test_full_chat_queue_rejects_messages(self):
+        release = threading.Event()
+        scheduler = ChatScheduler(lambda message: release.wait(5), workers=2, chat_queue_size=2)
+        self.assertTrue(scheduler.submit(make_message(1, 'a')))
+        self.assertTrue(scheduler.submit(make_message(1, 'b')))
+        self.assertFalse(scheduler.submit(make_message(1, 'c')))
+        self.assertTrue(scheduler.submit(make_message(2, 'a')))
+        release.set()
+        scheduler.shutdown()
+
+
+class AsyncChatSchedulerTestCase(unittest.TestCase):
+    def test_messages_of_chat_are_processed_in_order(self):
+        processed = []
+
+        async def process(message):
+            await asyncio.sleep(0.001 * (message.chat.id % 2))
+            processed.append((message.chat.id, message.text))
+
+        async def run():
+            scheduler = AsyncChatScheduler(process, workers=2, chat_queue_size=100)
+            for i in range(20):
+                for chat_id in (1, 2, 3):
+                    scheduler.submit(make_message(chat_id, i))
+            await scheduler.join()
+
+        asyncio.run(run())
+        for chat_id in (1, 2, 3):
+            self.assertEqual([text for chat, text in processed if chat == chat_id], list(range(20)))
@@ -0,0 +1,84 @@
+import base64
+import json
+import time
+import unittest
+
+from eduapp.exceptions import LoginRequiredError
+from eduapp.main import relogin
+from eduapp.sessions import EASession, SessionRegistry, create_session, get_token_expiry
+
+
+def make_token(payload):
+    encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+    return f'header.{encoded}.signature'
+
+
+class SessionRegistryTestCase(unittest.TestCase):
+    def test_sessions_are_separated_by_chat(self):
+        registry = SessionRegistry()
+        registry.put(create_session(1, 'first', 'pass', 'token1', 10))
+        registry.put(create_session(2, 'second', 'pass', 'token2', 20))
+        self.assertEqual(registry.get(1).token, 'token1')
+        self.assertEqual(registry.get(2).user_id, 20)
+        self.assertIsNone(registry.get(3))
+
+    def test_least_recently_used_is_evicted(self):
+        registry = SessionRegistry(max_size=2)
+        registry.put(create_session(1, 'first', 'pass', 'token1'))
+        registry.put(create_session(2, 'second', 'pass', 'token2'))
+        registry.get(1)
+        registry.put(create_session(3, 'third', 'pass', 'token3'))
+        self.assertEqual(len(registry), 2)
+        self.assertIsNotNone(registry.get(1))
+        self.assertIsNone(registry.get(2))
+
+    def test_expiring_sessions(self):
+        registry = SessionRegistry()
+        now = time.time()
+        registry.put(create_session(1, 'first', 'pass', make_token({'exp': now + 60})))
+        registry.put(create_session(2, 'second', 'pass', make_token({'exp': now + 3600})))
+        failed = create_session(3, 'third', 'pass', make_token({'exp': now + 60}))
+        failed.refresh_after = now + 600
+        registry.put(failed)
+        expiring = registry.expiring(now + 300, now - 60)
+        self.assertEqual([session.chat_id for session in expiring], [1])
+
+    def test_restore_keeps_fresher_token(self):
+        registry = SessionRegistry()
+        local = create_session(1, 'first', 'pass', 'local')
+        local.expires_at = 2000
+        registry.put(local)
+        stored = create_session(1, 'first', 'pass', 'stored')
+        stored.expires_at = 1000
+        self.assertIs(registry.restore(stored), local)
+        stored.expires_at = 3000
+        self.assertIs(registry.restore(stored), stored)
+        other = create_session(1, 'second', 'pass', 'other')
+        other.expires_at = 0
+        self.assertEqual(registry.restore(other).login, 'second')
+
+    def test_password_is_not_serialized(self):
+        registry = SessionRegistry()
+        session = create_session(1, 'first', 'secret', 'token')
+        self.assertNotIn('secret', session.to_json())
+        restored = EASession.from_json(session.to_json())
+        self.assertIsNone(restored.password)
+        self.assertEqual((restored.token, restored.expires_at), (session.token, session.expires_at))
+        registry.put(session)
+        restored.expires_at += 60
+        self.assertEqual(registry.restore(restored).password, 'secret')
+
+    def test_restored_session_asks_to_log_in(self):
+        restored = EASession.from_json(create_session(1, 'first', 'secret', 'token').to_json())
+        status = relogin(restored)
+        self.assertFalse(status.success)
+        self.assertEqual(status.error, LoginRequiredError.message)
+
+
+class TokenExpiryTestCase(unittest.TestCase):
+    def test_expiry_from_token(self):
+        self.assertEqual(get_token_expiry(make_token({'exp': 1650000000, 'user_id': 7})), 1650000000)
+
+    def test_token_without_expiry(self):
+        self.assertIsNone(get_token_expiry(make_token({'user_id': 7})))
+        self.assertIsNone(get_token_expiry('not a jwt'))
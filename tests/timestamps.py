@@ -0,0 +1,20 @@
+import unittest
+from datetime import timedelta
+
+from eduapp.timestamps import parse_ea_datetime, parse_ea_datetimes
+
+
+class ParseEaDatetimeTestCase(unittest.TestCase):
+    def test_offset_is_kept(self):
+        moment = parse_ea_datetime('2022-03-01T10:00:00+03:00')
+        self.assertEqual(moment.hour, 10)
+        self.assertEqual(moment.utcoffset(), timedelta(hours=3))
+
+    def test_conversion_to_user_timezone(self):
+        moments = parse_ea_datetimes(['2022-03-01T01:00:00+03:00', '2022-03-01T12:00:00Z'],
+                                     'Asia/Novosibirsk')
+        self.assertEqual([(moment.day, moment.hour) for moment in moments], [(1, 5), (1, 19)])
+
+    def test_unknown_timezone_is_ignored(self):
+        moment = parse_ea_datetime('2022-03-01T10:00:00+03:00', 'Nowhere/Unknown')
+        self.assertEqual(moment.utcoffset(), timedelta(hours=3))
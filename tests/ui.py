@@ -1,7 +1,13 @@
+import re
 import unittest
+from datetime import datetime
+from unittest import mock
 
+from eduapp.cache import TTLCache
 from eduapp.main import EaAuthStatus
-from ui.main import login_ui_handler
+from ui.cache import RenderCache
+from ui.main import TemplateRegistry, login_ui_handler
+from ui.questions import question_page_to_str
 
 
 class LoginUiHandlerTesstCase(unittest.TestCase):
@@ -16,3 +22,56 @@ class LoginUiHandlerTesstCase(unittest.TestCase):
         result = login_ui_handler(data)
         expected_result = 'Ошибка входа. \nerror_message'
         self.assertEqual(result, expected_result)
+
+
+class TemplateRegistryTestCase(unittest.TestCase):
+    def test_templates_are_compiled_once(self):
+        registry = TemplateRegistry(cache_dir=None)
+        registry.compile_all()
+        compiled = registry.misses
+        self.assertIn('widgets/lesson_time.html', registry.templates)
+        template = registry.get('profile.html')
+        self.assertIs(registry.get('profile.html'), template)
+        self.assertEqual(registry.misses, compiled)
+        self.assertEqual(registry.hits, 2)
+
+
+class QuestionPageTestCase(unittest.TestCase):
+    def test_numbers_follow_page_size(self):
+        question = {'reason': 'Тема', 'first_que': 'Вопрос', 'teacher': 'Иван Петров',
+                    'date': datetime(2022, 3, 1, 10)}
+        with mock.patch('config.EDUAPP_QUESTIONS_PAGE_SIZE', 10):
+            text = question_page_to_str({'page': 2, 'questions': [question, question]})
+        self.assertEqual(re.findall(r'<b>(\d+)</b>\)', text), ['11', '12'])
+
+
+class RenderCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = RenderCache(max_bytes=10000)
+        self.renders = []
+
+    def render(self, data):
+        self.renders.append(data)
+        return ', '.join(data['lessons'])
+
+    def test_same_content_is_rendered_once(self):
+        self.cache.render('calendar', self.render, {'lessons': ['a', 'b']})
+        text = self.cache.render('calendar', self.render, {'lessons': ['a', 'b']})
+        self.cache.render('calendar', self.render, {'lessons': ['a']})
+        self.assertEqual(text, 'a, b')
+        self.assertEqual(len(self.renders), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_size_is_bounded(self):
+        for i in range(100):
+            self.cache.render('calendar', self.render, {'lessons': [str(i) * 100]})
+        self.assertLessEqual(self.cache.size, 10000)
+        self.assertLess(len(self.cache), 100)
+
+    def test_replaced_data_is_forgotten(self):
+        data_cache = TTLCache(max_size=10, ttl=60)
+        data_cache.add_listener(self.cache.forget_on_remove('calendar'))
+        data_cache.put('month', {'lessons': ['a']})
+        self.cache.render('calendar', self.render, data_cache.get('month'))
+        data_cache.put('month', {'lessons': ['b']})
+        self.assertEqual(len(self.cache), 0)
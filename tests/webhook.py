@@ -0,0 +1,70 @@
+import asyncio
+import json
+import os
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+from bot.scheduler import ChatScheduler
+from bot.state_store import MemoryStateStore
+from bot.webhook import SECRET_HEADER, WebhookServer, WebhookSettings, is_authorized
+from tests.engine import RecordingEngine
+
+UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1,
+        'date': 1650000000,
+        'chat': {'id': 5, 'type': 'private'},
+        'from': {'id': 5, 'is_bot': False, 'first_name': 'Ученик', 'username': 'pupil'},
+        'text': '/start',
+    },
+}
+
+
+class WebhookServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = RecordingEngine(MemoryStateStore())
+        scheduler = ChatScheduler(lambda message: asyncio.run(self.engine.process_message(message)),
+                                  workers=2)
+        self.server = WebhookServer(scheduler, WebhookSettings(host='127.0.0.1', port=0,
+                                                               secret='secret'))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def post(self, body, secret='secret'):
+        request = urllib.request.Request(f'http://127.0.0.1:{self.server.port}/webhook',
+                                         data=body, headers={SECRET_HEADER: secret})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status
+        except urllib.error.HTTPError as ex:
+            return ex.code
+
+    def test_update_is_processed(self):
+        self.assertEqual(self.post(json.dumps(UPDATE).encode()), 200)
+        self.server.shutdown()
+        self.assertEqual(self.engine.sent[0][0], 5)
+
+    def test_bad_requests_are_rejected(self):
+        self.assertEqual(self.post(json.dumps(UPDATE).encode(), secret='wrong'), 403)
+        self.assertEqual(self.post(b'not json'), 400)
+        self.server.shutdown()
+        self.assertEqual(self.engine.sent, [])
+
+
+class WebhookSecretTestCase(unittest.TestCase):
+    def test_secret_is_required(self):
+        with mock.patch.dict(os.environ, {'WEBHOOK_SECRET': ''}):
+            with self.assertRaises(ValueError):
+                WebhookSettings.from_env()
+        with self.assertRaises(ValueError):
+            WebhookServer(mock.Mock(), WebhookSettings(host='127.0.0.1', port=0))
+
+    def test_is_authorized(self):
+        settings = WebhookSettings(secret='secret')
+        self.assertTrue(is_authorized({SECRET_HEADER: 'secret'}, settings))
+        self.assertFalse(is_authorized({SECRET_HEADER: 'wrong'}, settings))
+        self.assertFalse(is_authorized({}, settings))
+        self.assertFalse(is_authorized({SECRET_HEADER: ''}, WebhookSettings()))
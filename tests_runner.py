@@ -1,6 +1,21 @@
 import unittest
 
+from tests.benchmarks import *
+from tests.cache import *
+from tests.calendar_data import *
+from tests.discussions import *
+from tests.engine import *
+from tests.http_cache import *
+from tests.loadtest import *
+from tests.metrics import *
+from tests.navigation import *
+from tests.outbox import *
+from tests.reminders import *
+from tests.scheduler import *
+from tests.sessions import *
+from tests.timestamps import *
 from tests.ui import *
+from tests.webhook import *
 
 if __name__ == '__main__':
     unittest.main()
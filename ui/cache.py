@@ -0,0 +1,156 @@
+"""
+Кэш отрисованных сообщений.
+
+Отрисовка шаблона по тем же данным даёт тот же текст, поэтому готовые сообщения
+сохраняются по имени представления и хэшу содержимого данных. Пользователь,
+листающий месяцы календаря туда и обратно, получает уже отрисованные сообщения.
+
+Изменившиеся данные дают другой хэш, поэтому устаревший текст из кэша не выдаётся никогда.
+Когда запись кэша данных Eduapp заменяется или устаревает, отрисованные по ней сообщения
+удаляются сразу (см. :meth:`RenderCache.forget`), не дожидаясь вытеснения
+"""
+
+import functools
+import hashlib
+import logging
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+import config
+from eduapp.metrics import metrics
+
+
+def get_content_hash(args: tuple, kwargs: dict) -> Optional[bytes]:
+    """
+    Хэш содержимого аргументов отрисовки
+
+    :param args: позиционные аргументы
+    :param kwargs: именованные аргументы
+    :return: хэш или `None`, если аргументы не сериализуются
+    """
+    try:
+        data = pickle.dumps((args, sorted(kwargs.items())), protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class RenderCache:
+    """
+    Потокобезопасный кэш отрисованных сообщений.
+
+    Размер кэша ограничен суммарным объёмом сообщений: при переполнении удаляются те,
+    к которым дольше всех не обращались
+    """
+
+    def __init__(self, max_bytes: int = config.UI_RENDER_CACHE_BYTES) -> None:
+        """
+        :param max_bytes: максимальный суммарный объём сообщений, в байтах
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[Tuple[str, bytes], str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Доля отрисовок, взятых из кэша
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def render(self, view: str, render: Callable[..., str], *args, **kwargs) -> str:
+        """
+        Возвращает отрисованное сообщение из кэша или отрисовывает и сохраняет его
+
+        :param view: имя представления
+        :param render: функция отрисовки
+        :param args: позиционные аргументы функции отрисовки
+        :param kwargs: именованные аргументы функции отрисовки
+        :return: отрисованное сообщение
+        """
+        content_hash = get_content_hash(args, kwargs)
+        if content_hash is None:
+            logging.debug('Данные представления %s не сериализуются, отрисовка без кэша', view)
+            return render(*args, **kwargs)
+        key = (view, content_hash)
+        with self._lock:
+            text = self._data.get(key)
+            if text is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return text
+            self.misses += 1
+        text = render(*args, **kwargs)
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = text
+                self.size += sys.getsizeof(text)
+            while self.size > self.max_bytes and self._data:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= sys.getsizeof(evicted)
+        return text
+
+    def forget(self, view: str, *args, **kwargs) -> None:
+        """
+        Удаляет сообщение, отрисованное по этим данным
+
+        :param view: имя представления
+        :param args: позиционные аргументы функции отрисовки
+        :param kwargs: именованные аргументы функции отрисовки
+        """
+        content_hash = get_content_hash(args, kwargs)
+        if content_hash is None:
+            return
+        with self._lock:
+            text = self._data.pop((view, content_hash), None)
+            if text is not None:
+                self.size -= sys.getsizeof(text)
+
+    def forget_on_remove(self, view: str,
+                         get_args: Callable[[object], tuple] = lambda value: (value,)) \
+            -> Callable[[Hashable, object], None]:
+        """
+        Слушатель для :meth:`eduapp.cache.TTLCache.add_listener`, удаляющий сообщения,
+        отрисованные по удалённой записи кэша данных
+
+        :param view: имя представления
+        :param get_args: функция, получающая аргументы отрисовки из записи кэша
+        :return: слушатель
+        """
+        return lambda key, value: self.forget(view, *get_args(value))
+
+    def cached(self, view: str) -> Callable:
+        """
+        Декоратор функции отрисовки, сохраняющий её результаты в кэш
+
+        :param view: имя представления
+        """
+        def decorator(render: Callable[..., str]) -> Callable[..., str]:
+            @functools.wraps(render)
+            def wrapper(*args, **kwargs):
+                return self.render(view, render, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def clear(self) -> None:
+        """
+        Удаляет все сообщения
+        """
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+#: Кэш сообщений бота
+render_cache = RenderCache()
+metrics.add_cache('render', render_cache)
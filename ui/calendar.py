@@ -1,3 +1,8 @@
+import html
+
+from eduapp.lessons import Lesson
+
+
 class CalendarUI:
     ERROR_INVALID_INPUT_FORMAT = 'Извините, я Вас не понял. ' \
                                  'Введите период в указанном формате: DD.MM-DD.MM'
@@ -5,3 +10,14 @@ class CalendarUI:
                         'а месяц - от 1 до 13. Попробуйте ввести ещё раз'
     ERROR_INVALID_START = 'Первая дата должна быть меньше второй. ' \
                          'Попробуйте ввести ещё раз'
+    REMINDER = '⏰ Скоро занятие <b>{name}</b>: начало в {start:%H:%M}'
+
+
+def reminder_to_str(lesson: Lesson) -> str:
+    """
+    Напоминание о занятии
+
+    :param lesson: занятие
+    :return: текст сообщения с HTML-разметкой
+    """
+    return CalendarUI.REMINDER.format(name=html.escape(lesson.name), start=lesson.time.start)
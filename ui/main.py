@@ -1,21 +1,100 @@
 """
 UI - пользовательский интерфейс
 """
-from typing import Any, Dict
+import os
+import threading
+from typing import Any, Dict, Optional
 
-from jinja2 import Environment, PackageLoader, select_autoescape
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader, Template, \
+    select_autoescape
 
+import config
 from constants import MonthNames, LessonStatusSymbols
 
-from eduapp.main import EaAuthStatus
+from eduapp.account import account_cache
+from eduapp.calendar import calendar_cache
+from eduapp.main import EaAuthStatus, get_profile_from_account
+from eduapp.metrics import metrics
+from ui.cache import render_cache
+
+#: Время отрисовки шаблонов сообщений
+render_seconds = metrics.histogram('ui_template_render_seconds', 'Время отрисовки шаблона',
+                                   ('template',))
+
+
+class TimedTemplate(Template):
+    """
+    Шаблон, время отрисовки которого попадает в метрику :data:`render_seconds`
+    """
+
+    def render(self, *args, **kwargs) -> str:
+        with render_seconds.time(self.name):
+            return super().render(*args, **kwargs)
+
+
+class TemplateRegistry:
+    """
+    Общий для всего процесса реестр шаблонов.
+
+    Каждый шаблон компилируется один раз, дальше отрисовка - это только вызов
+    :meth:`jinja2.Template.render`. Если задан каталог кэша, скомпилированный код
+    шаблонов сохраняется на диск и при следующем запуске бота не компилируется заново
+    """
+
+    def __init__(self, cache_dir: Optional[str] = config.UI_TEMPLATES_CACHE_DIR) -> None:
+        """
+        :param cache_dir: каталог для скомпилированных шаблонов. `None` - не сохранять на диск
+        """
+        bytecode_cache = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        self.env = Environment(
+            loader=PackageLoader('ui'),
+            autoescape=select_autoescape(),
+            bytecode_cache=bytecode_cache,
+            # Шаблоны не меняются во время работы бота, не проверяем файлы при каждом обращении
+            auto_reload=False,
+        )
+        self.env.template_class = TimedTemplate
+        self.templates: Dict[str, Template] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Template:
+        """
+        Возвращает скомпилированный шаблон
+
+        :param name: имя шаблона относительно каталога ``ui/templates``
+        :return: шаблон
+        """
+        template = self.templates.get(name)
+        if template is not None:
+            self.hits += 1
+            return template
+        with self._lock:
+            self.misses += 1
+            template = self.templates[name] = self.env.get_template(name)
+        return template
+
+    def compile_all(self) -> None:
+        """
+        Компилирует все шаблоны заранее, чтобы первые сообщения пользователям
+        не ждали компиляции. Вызывается при запуске бота
+        """
+        for name in self.env.list_templates(extensions=['html']):
+            if name not in self.templates:
+                self.get(name)
+
+
+#: Реестр шаблонов сообщений бота
+templates = TemplateRegistry()
+metrics.add_cache('templates', templates)
 
 
 def get_template_to_html(name):
-    env = Environment(
-        loader=PackageLoader('ui'),
-        autoescape=select_autoescape()
-    )
-    return env.get_template(name)
+    return templates.get(name)
 
 
 def login_ui_handler(data: EaAuthStatus) -> str:
@@ -31,17 +110,19 @@ def login_ui_handler(data: EaAuthStatus) -> str:
         if data.success else f'Ошибка входа. \n{data.error}'
 
 
+@render_cache.cached('profile')
 def profile_data_to_str(data):
     template = get_template_to_html('profile.html')
     context = data
     return template.render(context)
 
 
+@render_cache.cached('calendar')
 def calendar_data_to_str(data: Dict[str, Any]) -> str:
     """
     Преобразует данные о календаре в строку, которая отправится пользователю
 
-    :param data: изначальные данные о календаре
+    :param data: изначальные данные о календаре, занятия в нём - :class:`eduapp.lessons.Lesson`
     :type data: :class:`dict`
     :return: строка с календарём, выводимая пользователю
     :rtype: :class:`str`
@@ -49,22 +130,13 @@ def calendar_data_to_str(data: Dict[str, Any]) -> str:
     template = get_template_to_html('calendar.html')
     context = {
         'month_name': MonthNames.translate(data['date']['name']),
-        'days': []
+        'days': data['days'].items(),
+        'status_symbols': LessonStatusSymbols.SYMBOLS,
     }
-    for days, lessons in data['days'].items():
-        day_context = {
-            'date': days,
-            'lessons': []
-        }
-        for lesson in lessons:
-            lesson_context = {
-                'start': lesson['time']['start'],
-                'finish': lesson['time']['finish'],
-                'visited': LessonStatusSymbols.translate(lesson['visited']),
-                'subject': lesson['name'],
-            }
-            if 'theme' in lesson:
-                lesson_context['theme'] = lesson['theme']
-            day_context['lessons'].append(lesson_context)
-        context['days'].append(day_context)
     return template.render(context)
+
+
+# Сообщения, отрисованные по заменённым или устаревшим данным, больше не понадобятся
+calendar_cache.add_listener(render_cache.forget_on_remove('calendar'))
+account_cache.add_listener(render_cache.forget_on_remove(
+    'profile', lambda account: (get_profile_from_account(account),)))
@@ -1,21 +1,25 @@
-from jinja2 import Environment, PackageLoader, select_autoescape
-
-import bot.bot_states
 import config
+from eduapp.questions import question_page_cache
+from ui.cache import render_cache
 from ui.main import get_template_to_html
 
+# Время вопросов выводится без часового пояса - оно уже в поясе пользователя
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 
+@render_cache.cached('question_page')
 def question_page_to_str(jsn):
     template = get_template_to_html('question_list.html')
     questions = []
+    first_number = (jsn['page'] - 1) * config.EDUAPP_QUESTIONS_PAGE_SIZE + 1
     for i in range(len(jsn['questions'])):
         current_question = jsn['questions'][i]
         question = {
-            'number': i + jsn["page"] * 5 - 4,
+            'number': first_number + i,
             'theme': current_question["reason"],
             'first': current_question["first_que"],
             'teacher': current_question["teacher"],
-            'data': current_question["date"]
+            'data': current_question["date"].strftime(DATE_FORMAT)
         }
         questions.append(question)
     context = {
@@ -24,12 +28,13 @@ def question_page_to_str(jsn):
     return template.render(context)
 
 
-def single_question_to_str(jsn, phrases):
+@render_cache.cached('question')
+def single_question_to_str(jsn, phrases, username, page=1):
     template = get_template_to_html('single_question.html')
     comments = []
     for phrase in phrases:
         phrase_context = {
-            'is_author_you': phrase['author']['username'] == config.USER_LOGIN,
+            'is_author_you': phrase['author']['username'] == username,
             'message': phrase['message']
         }
         comments.append(phrase_context)
@@ -37,12 +42,33 @@ def single_question_to_str(jsn, phrases):
     context = {
         'theme': jsn["reason"],
         'teacher': jsn["teacher"],
-        'date': jsn["date"],
+        'date': jsn["date"].strftime(DATE_FORMAT),
         'is_many_comments': False,
         'comments': comments
     }
-    if len(context['comments']) > 10:
-        context['comments'] = context['comments'][-10 * bot.bot_states.QueChatState.page: -10 * (bot.bot_states.QueChatState.page - 1)]
-        context['is_many_comments'] = True
+    if len(comments) > 10:
+        # Страница 1 - последние 10 реплик, страница 2 - 10 реплик перед ними и т.д.
+        end = max(len(comments) - 10 * (page - 1), 0)
+        context['comments'] = comments[max(end - 10, 0): end]
+        context['is_many_comments'] = end > 10
 
     return template.render(context)
+
+
+def reply_notification_to_str(jsn, replies):
+    """
+    Уведомление о новых ответах преподавателя
+
+    :param jsn: разобранное обсуждение
+    :param replies: новые реплики преподавателя
+    :return: текст сообщения с HTML-разметкой
+    """
+    template = get_template_to_html('reply_notification.html')
+    return template.render({
+        'theme': jsn['reason'],
+        'teacher': jsn['teacher'],
+        'messages': [reply['message'] for reply in replies],
+    })
+
+
+question_page_cache.add_listener(render_cache.forget_on_remove('question_page'))